@@ -0,0 +1,97 @@
+"""
+Бенчмарки бота на локальном файле SQLite (сеть и Telegram не нужны).
+
+Запуск:
+    python bench.py latency --users 1000
+    python bench.py borrow --ops 5000
+    python bench.py pages --books 1000000
+    python bench.py search --books 500000
+    python bench.py cache --updates 50000
+    python bench.py listspam --users 5000
+    python bench.py import --rows 1000000
+    python bench.py journal --updates 20000
+    python bench.py fsm --users 2000
+    python bench.py webhook --updates 5000
+    python bench.py shards --workers 1,2,4,8
+    python bench.py ratelimit --sends 450
+    python bench.py metrics --updates 5000
+    python bench.py load --users 2000 --save benchmarks/baseline.json
+    python bench.py load --users 2000 --compare benchmarks/baseline.json
+    python bench.py passwords --users 200
+    python bench.py buttons --buttons 60
+    python bench.py reminders --loans 100000
+    python bench.py waitlist --users 5000 --hot 20
+    python bench.py bookindex --books 1000000
+    python bench.py report --loans 5000000
+    python bench.py report --loans 500000 --formats csv,naive
+
+По умолчанию база создаётся во временном каталоге внутри текущего;
+--dir позволяет выбрать диск, на котором меряется fsync.
+Сценарии лежат в benchmarks/, по модулю на область.
+"""
+
+import argparse
+
+from benchmarks import (
+    bookindex,
+    borrow,
+    buttons,
+    cache,
+    catalogue_import,
+    fsm,
+    journal,
+    latency,
+    listspam,
+    load,
+    metrics,
+    pages,
+    passwords,
+    ratelimit,
+    reminders,
+    report,
+    search,
+    shards,
+    waitlist,
+    webhook,
+)
+
+# Порядок подкоманд в справке
+SCENARIOS = [
+    latency,
+    borrow,
+    pages,
+    search,
+    cache,
+    listspam,
+    catalogue_import,
+    journal,
+    fsm,
+    webhook,
+    shards,
+    ratelimit,
+    metrics,
+    load,
+    passwords,
+    buttons,
+    reminders,
+    waitlist,
+    bookindex,
+    report,
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    sub = parser.add_subparsers(dest="scenario", required=True)
+    for scenario in SCENARIOS:
+        scenario.add_parser(sub)
+
+    for scenario in sub.choices.values():
+        scenario.add_argument("--dir", default=".", help="каталог для файла БД")
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,3 @@
+"""
+Сценарии bench.py: по модулю на область, общие заготовки — в common.py.
+"""
@@ -0,0 +1,175 @@
+"""
+Каталог в памяти против словаря словарей из book.py (python bench.py bookindex).
+"""
+
+import asyncio
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from db import Database
+
+from benchmarks.common import create_catalogue, numbered_books
+
+
+def bench_bookindex(args):
+    from book_index import BookIndex
+
+    def traced(build):
+        tracemalloc.start()
+        started = time.perf_counter()
+        value = build()
+        elapsed = time.perf_counter() - started
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return value, size, elapsed
+
+    # Строки создаются заново для каждой книги, как при чтении из базы или JSON
+    def dict_of_dicts():
+        return {
+            title: {"author": author, "available": True, "borrower": None}
+            for title, author in numbered_books(args.books)
+        }
+
+    def book_index():
+        index = BookIndex()
+        index.load(
+            (book_id, title, author, True, None)
+            for book_id, (title, author) in enumerate(numbered_books(args.books), start=1)
+        )
+        return index
+
+    books, dict_size, dict_time = traced(dict_of_dicts)
+    del books
+    index, index_size, index_time = traced(book_index)
+    print(
+        f"bookindex: {args.books:,} книг — словарь словарей {dict_size / 2**20:,.0f} MiB "
+        f"({dict_size / args.books:.0f} B/книга, {dict_time:.1f} s), BookIndex "
+        f"{index_size / 2**20:,.0f} MiB ({index_size / args.books:.0f} B/книга, {index_time:.1f} s); "
+        f"битовая карта {len(index._available) / 1024:,.0f} KiB"
+    )
+
+    # Счётчик свободных книг сходится с картой и с простым множеством
+    rng = random.Random(0)
+    taken = set()
+    for _ in range(100_000):
+        book_id = rng.randint(1, args.books)
+        if rng.random() < 0.5:
+            index.set_borrower(book_id, f"Читатель {book_id}")
+            taken.add(book_id)
+        else:
+            index.set_borrower(book_id, None)
+            taken.discard(book_id)
+    bits = int.from_bytes(index._available, "little").bit_count()
+    ok = index.available_count == bits == args.books - len(taken)
+    ok = ok and all(
+        index.find(f"Книга {book_id - 1}")[3] == f"Читатель {book_id}" for book_id in taken
+    )
+
+    titles = [f"Книга {rng.randrange(args.books)}" for _ in range(100_000)]
+    started = time.perf_counter()
+    for title in titles:
+        index.find(title)
+    exact = (time.perf_counter() - started) / len(titles)
+    started = time.perf_counter()
+    for title in titles:
+        index.find(title.upper())
+    normalized = (time.perf_counter() - started) / len(titles)
+    print(
+        f"bookindex: find {exact * 1e9:,.0f} ns, без учёта регистра {normalized * 1e9:,.0f} ns; "
+        f"свободно {index.available_count:,} (карта: {bits:,}); {'OK' if ok else 'FAIL'}"
+    )
+    del index
+
+    async def against_db(path):
+        # Те же методы Database с каталогом в памяти и без него
+        results = {}
+        for label, book_index in (("SQLite", None), ("BookIndex", BookIndex())):
+            database = Database(path, book_index=book_index)
+            started = time.perf_counter()
+            await database.connect()
+            loaded = time.perf_counter() - started
+            timings = {}
+            for name, call in (
+                ("find_book", lambda i: database.find_book(f"Книга {i}")),
+                ("find_book_id", lambda i: database.find_book_id(f"Книга {i}")),
+                ("get_books_page", lambda i: database.get_books_page(i, 10)),
+                ("count_available", lambda i: database.count_available()),
+            ):
+                repeat = 200 if name == "count_available" and book_index is None else 5000
+                started = time.perf_counter()
+                for i in range(repeat):
+                    await call(i * 7919 % args.db_books)
+                timings[name] = (time.perf_counter() - started) / repeat
+            results[label] = (loaded, timings, database)
+        return results
+
+    async def consistency(path):
+        # После выдач, очереди и возвратов каталог в памяти совпадает с таблицей
+        index = BookIndex()
+        database = Database(path, book_index=index)
+        await database.connect()
+        for user_id in range(3):
+            await database.create_user(user_id, f"Имя{user_id}", f"Фамилия{user_id}", "pwd")
+        await database.borrow_book(0, "Книга 1")
+        await database.borrow_book(1, "Книга 2")
+        await database.join_waitlist(2, await database.find_book_id("Книга 1"))
+        await database.return_book(0, "Книга 1")
+        await database.return_book(1, "Книга 2")
+        await database.borrow_book(0, "Книга 3")
+        # Импорт другим процессом (importer.py): каталог перечитывается при промахе
+        other = Database(path)
+        await other.connect()
+        await other.import_books([("Новая книга", "Новый автор", True, None)])
+        await other.close()
+        refreshed = await database.find_book_id("новая книга") is not None
+        unchanged = not await database.refresh_book_index()
+        expected = await database._read(
+            lambda conn: conn.execute(
+                "SELECT title, author, available, borrower FROM books ORDER BY id"
+            ).fetchall()
+        )
+        count = await database._read(_count_available_sql)
+        await database.close()
+        return refreshed and unchanged and all(
+            index.find(title) == (title, author, bool(available), borrower)
+            for title, author, available, borrower in expected
+        ) and index.available_count == count
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        path = os.path.join(directory, "bookindex.sqlite3")
+        asyncio.run(create_catalogue(path, args.db_books))
+
+        async def compare():
+            results = await against_db(path)
+            for _, _, database in results.values():
+                await database.close()
+            return results
+
+        results = asyncio.run(compare())
+        consistent = asyncio.run(consistency(path))
+
+    print(f"bookindex: {args.db_books:,} книг в SQLite, время одного вызова Database:")
+    for label, (loaded, timings, _) in results.items():
+        calls = ", ".join(f"{name} {value * 1e6:,.1f} µs" for name, value in timings.items())
+        print(f"  {label:<9} connect {loaded:.2f} s; {calls}")
+    print(
+        f"bookindex: каталог в памяти совпадает с таблицей после выдач, возвратов "
+        f"и импорта другим процессом: {consistent}"
+    )
+    if not ok or not consistent:
+        raise SystemExit("FAIL")
+    print("OK")
+
+
+def _count_available_sql(conn):
+    return conn.execute("SELECT COUNT(*) FROM books WHERE available").fetchone()[0]
+
+
+def add_parser(sub):
+    bookindex = sub.add_parser("bookindex", help="память и скорость каталога в памяти")
+    bookindex.add_argument("--books", type=int, default=1_000_000)
+    bookindex.add_argument("--db-books", type=int, default=100_000, help="для сравнения с SQLite")
+    bookindex.set_defaults(func=bench_bookindex)
@@ -0,0 +1,90 @@
+"""
+Пропускная способность бронирований, commit на операцию vs пачкой (python bench.py borrow).
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+
+from db import Database
+
+from benchmarks.common import make_books, report
+
+
+async def run_borrow(label, ops, concurrency, path, **options):
+    database = Database(path, **options)
+    await database.connect()
+    await database.init_books(make_books(ops))
+    for user_id in range(concurrency):
+        await database.create_user(user_id, f"Имя{user_id}", f"Фамилия{user_id}", "pwd")
+
+    latencies = []
+    titles = iter(range(ops))
+
+    async def borrower(user_id):
+        for i in titles:
+            started = time.perf_counter()
+            await database.borrow_book(user_id, f"Книга {i}")
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(borrower(user_id) for user_id in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    await database.close()
+
+    report(f"borrow[{label}]", latencies, elapsed)
+    print(f"{'':<24} {ops / elapsed:,.0f} borrow/s")
+    return ops / elapsed
+
+
+# Во сколько раз групповой коммит должен ускорить выдачи
+BORROW_TARGET = 10
+
+
+def bench_borrow(args):
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        single = asyncio.run(
+            run_borrow(
+                "commit per op",
+                args.ops,
+                args.concurrency,
+                os.path.join(directory, "single.sqlite3"),
+                batch_size=1,
+            )
+        )
+        batched = asyncio.run(
+            run_borrow(
+                "group commit",
+                args.ops,
+                args.concurrency,
+                os.path.join(directory, "batched.sqlite3"),
+                batch_size=args.batch,
+            )
+        )
+        # Одиночная запись не должна ждать соседей, которых нет
+        for label, batch_size in (("commit per op, 1 user", 1), ("group commit, 1 user", args.batch)):
+            asyncio.run(
+                run_borrow(
+                    label,
+                    args.lone_ops,
+                    1,
+                    os.path.join(directory, f"lone-{batch_size}.sqlite3"),
+                    batch_size=batch_size,
+                )
+            )
+    # На диске с быстрым fsync выигрыш ограничен работой самого писателя
+    speedup = batched / single
+    print(
+        f"borrow: групповой коммит быстрее в {speedup:.1f} раза — цель {BORROW_TARGET}x "
+        f"{'достигнута' if speedup >= BORROW_TARGET else 'НЕ достигнута'}"
+    )
+
+
+def add_parser(sub):
+    borrow = sub.add_parser("borrow", help="бронирований в секунду, group commit")
+    borrow.add_argument("--ops", type=int, default=5000)
+    borrow.add_argument("--concurrency", type=int, default=500)
+    borrow.add_argument("--batch", type=int, default=256)
+    borrow.add_argument("--lone-ops", type=int, default=500, help="выдач одному пользователю")
+    borrow.set_defaults(func=bench_borrow)
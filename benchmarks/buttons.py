@@ -0,0 +1,76 @@
+"""
+Цена выбора хендлера при многих кнопках (python bench.py buttons).
+"""
+
+import asyncio
+import time
+
+from benchmarks.common import make_fake_session, quiet_aiogram
+
+
+def bench_buttons(args):
+    from aiogram import Bot, Dispatcher, F, Router
+    from aiogram.types import Update
+
+    from buttons import ButtonRouter
+
+    async def handler(message):
+        return None
+
+    texts = [f"Кнопка {i}" for i in range(args.buttons)]
+
+    def filters_router():
+        router = Router()
+        for text in texts:
+            router.message(F.text == text)(handler)
+        router.message()(handler)
+        return router
+
+    def buttons_router():
+        router = ButtonRouter()
+        for text in texts:
+            router.message.button(text)(handler)
+        router.message()(handler)
+        return router
+
+    async def run():
+        quiet_aiogram()
+        bot = Bot("0:bench", session=make_fake_session(0))
+        cases = [("первая кнопка", texts[0]), ("последняя кнопка", texts[-1]), ("не кнопка", "Война и мир")]
+        for label, make_router in (("F.text ==", filters_router), ("ButtonRouter", buttons_router)):
+            dispatcher = Dispatcher()
+            dispatcher.include_router(make_router())
+            for case, text in cases:
+                update = Update.model_validate(
+                    {
+                        "update_id": 1,
+                        "message": {
+                            "message_id": 1,
+                            "date": 0,
+                            "chat": {"id": 1, "type": "private"},
+                            "from": {"id": 1, "is_bot": False, "first_name": "Имя"},
+                            "text": text,
+                        },
+                    },
+                    context={"bot": bot},
+                )
+                timings = []
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    for _ in range(args.updates):
+                        await dispatcher.feed_update(bot, update)
+                    timings.append((time.perf_counter() - started) / args.updates)
+                print(
+                    f"buttons[{label:<12} {case:<16}] {min(timings) * 1e6:7.1f} мкс на обновление "
+                    f"({args.buttons} кнопок)"
+                )
+
+    asyncio.run(run())
+
+
+def add_parser(sub):
+    buttons = sub.add_parser("buttons", help="выбор хендлера кнопки: фильтры и словарь")
+    buttons.add_argument("--buttons", type=int, default=60)
+    buttons.add_argument("--updates", type=int, default=1000)
+    buttons.add_argument("--repeat", type=int, default=3)
+    buttons.set_defaults(func=bench_buttons)
@@ -0,0 +1,101 @@
+"""
+Сколько чтений из БД приходится на одно обновление (python bench.py cache).
+"""
+
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.common import CountingDatabase, create_catalogue
+
+
+# Обращения к БД, которые делает каждый хендлер start.py (вместе с check_registration)
+async def handle_start(db, user_id):
+    await db.get_user(user_id)
+
+
+async def handle_profile(db, user_id):
+    await db.get_user(user_id)
+    await db.get_user(user_id)
+    await db.get_user_loans(user_id)
+
+
+async def handle_logout(db, user_id):
+    await db.get_user(user_id)
+    await db.get_user(user_id)
+
+
+async def handle_list(db, user_id):
+    await db.get_books_page(0, 10)
+
+
+async def handle_ask(db, user_id):
+    await db.get_user(user_id)
+
+
+async def handle_find(db, user_id):
+    await db.find_book(f"Книга {user_id % 100}")
+
+
+async def handle_borrow(db, user_id):
+    await db.get_user(user_id)
+    await db.borrow_book(user_id, f"Книга {user_id % 100}")
+
+
+TRAFFIC = {
+    handle_start: 10,
+    handle_profile: 20,
+    handle_logout: 5,
+    handle_list: 20,
+    handle_ask: 20,
+    handle_find: 15,
+    handle_borrow: 10,
+}
+
+
+async def run_cache(label, path, users, updates, **options):
+    database = CountingDatabase(path, **options)
+    await database.connect()
+    for user_id in range(users):
+        await database.create_user(user_id, f"Имя{user_id}", f"Фамилия{user_id}", "pwd")
+    database.reads = 0
+
+    rng = random.Random(0)
+    handlers = rng.choices(list(TRAFFIC), list(TRAFFIC.values()), k=updates)
+    started = time.perf_counter()
+    for offset in range(0, updates, 100):
+        await asyncio.gather(
+            *(
+                handler(database, rng.randrange(users))
+                for handler in handlers[offset : offset + 100]
+            )
+        )
+    elapsed = time.perf_counter() - started
+    await database.close()
+
+    print(
+        f"{label:<24} чтений на обновление: {database.reads / updates:.2f}, "
+        f"{updates / elapsed:,.0f} обновлений/s"
+    )
+    print(f"{'':<24} users: {database.users_cache.stats()}")
+    print(f"{'':<24} loans: {database.loans_cache.stats()}")
+
+
+def bench_cache(args):
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        for label, size in (("без кеша", 0), ("LRU+TTL кеш", args.cache_size)):
+            path = os.path.join(directory, f"cache{size}.sqlite3")
+            asyncio.run(create_catalogue(path, 100))
+            asyncio.run(
+                run_cache(label, path, args.users, args.updates, user_cache_size=size)
+            )
+
+
+def add_parser(sub):
+    cache = sub.add_parser("cache", help="чтения из БД на обновление, кеш пользователей")
+    cache.add_argument("--users", type=int, default=5000)
+    cache.add_argument("--updates", type=int, default=50_000)
+    cache.add_argument("--cache-size", type=int, default=10_000)
+    cache.set_defaults(func=bench_cache)
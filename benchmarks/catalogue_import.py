@@ -0,0 +1,64 @@
+"""
+Потоковый импорт каталога из .csv и .xlsx (python bench.py import).
+"""
+
+import asyncio
+import csv
+import os
+import tempfile
+import time
+
+from benchmarks.common import numbered_books, peak_rss_mib
+
+
+def write_csv(path, count):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Название", "Автор"])
+        writer.writerows(numbered_books(count))
+
+
+def write_xlsx(path, count):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(["Название", "Автор"])
+    for row in numbered_books(count):
+        sheet.append(row)
+    workbook.save(path)
+
+
+async def run_import(label, source, path, chunk_size):
+    import importer
+
+    for attempt in ("новые книги", "повторно (upsert)"):
+        rss_before = peak_rss_mib()
+        started = time.perf_counter()
+        total = await importer.import_file(source, path, chunk_size)
+        elapsed = time.perf_counter() - started
+        print(
+            f"import[{label}, {attempt}] {total:,} строк за {elapsed:.1f} s "
+            f"({total / elapsed:,.0f} строк/s), пик RSS {peak_rss_mib():.0f} MiB "
+            f"(+{peak_rss_mib() - rss_before:.0f})"
+        )
+
+
+def bench_import(args):
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        sources = [("csv", write_csv, args.rows), ("xlsx", write_xlsx, args.xlsx_rows)]
+        for label, write, count in sources:
+            source = os.path.join(directory, f"catalogue.{label}")
+            started = time.perf_counter()
+            write(source, count)
+            print(f"{source}: {count:,} строк записано за {time.perf_counter() - started:.1f} s")
+            path = os.path.join(directory, f"import-{label}.sqlite3")
+            asyncio.run(run_import(label, source, path, args.chunk_size))
+
+
+def add_parser(sub):
+    imports = sub.add_parser("import", help="импорт каталога из .csv и .xlsx")
+    imports.add_argument("--rows", type=int, default=1_000_000)
+    imports.add_argument("--xlsx-rows", type=int, default=200_000)
+    imports.add_argument("--chunk-size", type=int, default=10_000)
+    imports.set_defaults(func=bench_import)
@@ -0,0 +1,220 @@
+"""
+Общие заготовки бенчмарков: статистика и вывод, синтетический каталог,
+сессия бота без сети и диспетчер с роутером start.py.
+"""
+
+import asyncio
+import itertools
+import os
+import random
+import resource
+import sqlite3
+import statistics
+import time
+
+from cache import LRUCache
+from db import Database
+
+
+# Корень репозитория: модули бота импортируются отсюда, bench.py — точка входа
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH = os.path.join(ROOT, "bench.py")
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+def report(name, latencies, elapsed):
+    print(
+        f"{name:<24} n={len(latencies):<7} "
+        f"p50={percentile(latencies, 50) * 1000:8.2f} ms  "
+        f"p99={percentile(latencies, 99) * 1000:8.2f} ms  "
+        f"mean={statistics.fmean(latencies) * 1000:8.2f} ms  "
+        f"total={elapsed:6.2f} s"
+    )
+
+
+def make_books(count):
+    return {
+        f"Книга {i}": {"author": f"Автор {i}", "available": True, "borrower": None}
+        for i in range(count)
+    }
+
+
+def numbered_books(count):
+    return ((f"Книга {i}", f"Автор {i % 1000}") for i in range(count))
+
+
+def worded_books(count, seed=0, vocabulary=20_000):
+    """
+    Правдоподобные названия: слова настоящего каталога book.py плюс
+    сгенерированные из слогов, с частотами по закону Ципфа (как в живом языке).
+    """
+    from book import books
+
+    rng = random.Random(seed)
+    syllables = ["ба", "ве", "го", "да", "же", "зи", "ко", "ла", "ми", "но",
+                 "по", "ра", "си", "ту", "фе", "ха", "че", "ша", "юр", "ян"]
+    words = sorted({w for title in books for w in title.split() if len(w) > 2})
+    while len(words) < vocabulary:
+        words.append("".join(rng.choices(syllables, k=rng.randint(2, 4))).capitalize())
+    cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+    authors = sorted({info["author"] for info in books.values()})
+    for i in range(count):
+        title = " ".join(rng.choices(words, cum_weights=cum_weights, k=rng.randint(2, 4)))
+        yield f"{title} ({i})", rng.choice(authors)
+
+
+async def create_catalogue(path, count, rows=None):
+    """
+    Создаёт базу со схемой и быстро заливает count книг напрямую, без словаря в памяти.
+    """
+    database = Database(path)
+    await database.connect()
+    await database.close()
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.executemany(
+            "INSERT INTO books (title, author, available, borrower) VALUES (?, ?, 1, NULL)",
+            rows if rows is not None else numbered_books(count),
+        )
+    conn.close()
+
+
+async def measure_loop_lag(lags, stop: asyncio.Event, interval=0.001):
+    """
+    Насколько позже запланированного просыпается цикл событий:
+    именно столько ждёт любой другой чат, пока идёт запрос к БД.
+    """
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+
+
+class CountingDatabase(Database):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reads = 0
+
+    async def _read(self, func, *args):
+        self.reads += 1
+        return await super()._read(func, *args)
+
+
+def import_start(database):
+    """
+    Импортирует start.py без настоящего токена и подменяет в нём базу.
+    """
+    os.environ.setdefault("API_TOKEN", "0:bench")
+    import start
+
+    start.db = database
+    start.books_pages_cache = LRUCache(maxsize=1000, ttl=3600)
+    return start
+
+
+def peak_rss_mib():
+    # ru_maxrss в Linux — в килобайтах
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def make_fake_session(send_delay):
+    """
+    Сессия бота без сети: getUpdates отдаёт заранее подготовленные обновления,
+    любой другой метод «выполняется» за send_delay секунд.
+    """
+    from aiogram.client.session.base import BaseSession
+    from aiogram.methods import GetMe, GetUpdates
+    from aiogram.types import User
+
+    class FakeSession(BaseSession):
+        def __init__(self):
+            super().__init__()
+            self.pending = []
+            self.requests = 0
+
+        async def make_request(self, bot, method, timeout=None):
+            if isinstance(method, GetMe):
+                return User(id=1, is_bot=True, first_name="bench", username="bench_bot")
+            if isinstance(method, GetUpdates):
+                if not self.pending:
+                    await asyncio.sleep(0.01)
+                    return []
+                batch, self.pending = self.pending[: method.limit or 100], self.pending[100:]
+                return batch
+            self.requests += 1
+            await asyncio.sleep(send_delay)
+            return True
+
+        async def stream_content(
+            self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True
+        ):
+            # Файлов у сессии без сети нет: содержимое всегда пустое
+            for chunk in ():
+                yield chunk
+
+        async def close(self):
+            pass
+
+    return FakeSession()
+
+
+# Что присылают пользователи: у каждого — своя последовательность нажатий
+SYNTHETIC_TEXTS = ["📚 Список книг", "👤 Личный кабинет", "🔍 Найти книгу", "Книга 42"]
+
+
+def synthetic_updates(count, users, texts=SYNTHETIC_TEXTS, books=50):
+    # В текстах можно сослаться на {book} — одну из books первых книг каталога
+    for update_id in range(count):
+        user_id = update_id % users
+        text = texts[(update_id // users) % len(texts)].format(book=user_id % books)
+        user = {"id": user_id, "is_bot": False, "first_name": f"Имя{user_id}"}
+        yield {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": 0,
+                "chat": {"id": user_id, "type": "private"},
+                "from": user,
+                "text": text,
+            },
+        }
+
+
+def counting_dispatcher(database):
+    """
+    Диспетчер с роутером start.py и счётчиком обработанных обновлений.
+    """
+    from aiogram import Dispatcher
+
+    from storage import SQLiteStorage
+
+    start = import_start(database)
+    dispatcher = Dispatcher(storage=SQLiteStorage(database))
+    dispatcher.include_router(start.router)
+    dispatcher.processed = 0
+    dispatcher.done = asyncio.Event()
+
+    @dispatcher.update.outer_middleware()
+    async def count(handler, event, data):
+        try:
+            return await handler(event, data)
+        finally:
+            dispatcher.processed += 1
+            if dispatcher.processed >= dispatcher.expected:
+                dispatcher.done.set()
+
+    return dispatcher
+
+
+def quiet_aiogram():
+    import logging
+
+    # Строка лога на каждое обновление заметно тормозит и засоряет вывод
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)
@@ -0,0 +1,75 @@
+"""
+Хранилище состояний в SQLite против хранилища в памяти (python bench.py fsm).
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+
+from db import Database
+
+from benchmarks.common import report
+
+
+def fsm_key(user_id):
+    from aiogram.fsm.storage.base import StorageKey
+
+    return StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+
+
+async def fsm_throughput(label, storage, users, concurrency):
+    from aiogram.fsm.context import FSMContext
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def registration(user_id):
+        # Как в start.py: состояние, данные, снова состояние, чтение данных
+        async with semaphore:
+            state = FSMContext(storage, fsm_key(user_id))
+            await state.set_state("RegisterState:waiting_for_name")
+            await state.update_data(name=f"Имя {user_id}")
+            await state.set_state("RegisterState:waiting_for_surname")
+            await state.update_data(surname=f"Фамилия {user_id}")
+            await state.get_data()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(registration(user_id) for user_id in range(users)))
+    elapsed = time.perf_counter() - started
+
+    # Задержка одиночного вызова без конкурентов
+    latencies = []
+    for method, args in (("set_state", ("LoginState:waiting_for_password",)), ("get_data", ())):
+        latencies.clear()
+        for user_id in range(min(users, 500)):
+            t0 = time.perf_counter()
+            await getattr(storage, method)(fsm_key(user_id), *args)
+            latencies.append(time.perf_counter() - t0)
+        report(f"fsm[{label}] {method}", latencies, sum(latencies))
+    # 4 записи и 3 чтения на регистрацию (update_data читает перед записью)
+    print(f"fsm[{label}] регистраций: {users / elapsed:,.0f}/s, операций: {users * 7 / elapsed:,.0f}/s")
+
+
+def bench_fsm(args):
+    from aiogram.fsm.storage.memory import MemoryStorage
+
+    from storage import SQLiteStorage
+
+    async def run():
+        with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+            await fsm_throughput("память", MemoryStorage(), args.users, args.concurrency)
+            database = Database(os.path.join(directory, "fsm.sqlite3"))
+            await database.connect()
+            storage = SQLiteStorage(database)
+            await fsm_throughput("SQLite", storage, args.users, args.concurrency)
+            await storage.close()
+            await database.close()
+
+    asyncio.run(run())
+
+
+def add_parser(sub):
+    fsm = sub.add_parser("fsm", help="хранилище состояний FSM в SQLite")
+    fsm.add_argument("--users", type=int, default=2000)
+    fsm.add_argument("--concurrency", type=int, default=200)
+    fsm.set_defaults(func=bench_fsm)
@@ -0,0 +1,71 @@
+"""
+Цена изменения статуса — перезапись файла против журнала (python bench.py journal).
+"""
+
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks.common import ROOT, numbered_books, report
+
+
+BOOK_SOURCE = os.path.join(ROOT, "book.py")
+
+def load_book_copy(directory):
+    import importlib.util
+
+    spec = importlib.util.spec_from_file_location("book_copy", os.path.join(directory, "book.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def rewrite_books_file(module, path, title, borrower):
+    # Прежний update_book_status: весь словарь переписывается на каждое изменение
+    module.books[title]["available"] = borrower is None
+    module.books[title]["borrower"] = borrower
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"books = {module.books}\n")
+
+
+def time_updates(label, update, titles, count):
+    latencies = []
+    started = time.perf_counter()
+    for i in range(count):
+        t0 = time.perf_counter()
+        update(titles[i % len(titles)], None if i % 2 else f"Читатель {i}")
+        latencies.append(time.perf_counter() - t0)
+    report(label, latencies, time.perf_counter() - started)
+
+
+def bench_journal(args):
+    for size in (None, args.books):
+        with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+            shutil.copy(BOOK_SOURCE, directory)
+            module = load_book_copy(directory)
+            if size:
+                module.books.update(
+                    (title, {"author": author, "available": True, "borrower": None})
+                    for title, author in numbered_books(size)
+                )
+            titles = list(module.books)
+            label = f"{len(titles):,} книг"
+            old_path = os.path.join(directory, "books.py")
+            time_updates(
+                f"journal[{label}, перезапись файла]",
+                lambda title, borrower: rewrite_books_file(module, old_path, title, borrower),
+                titles, args.old_updates,
+            )
+            time_updates(
+                f"journal[{label}, журнал]", module.update_book_status, titles, args.updates
+            )
+            module.flush_journal()
+
+
+def add_parser(sub):
+    journal = sub.add_parser("journal", help="журнал book.py: цена изменения статуса")
+    journal.add_argument("--updates", type=int, default=20_000)
+    journal.add_argument("--old-updates", type=int, default=50, help="для перезаписи файла")
+    journal.add_argument("--books", type=int, default=100_000)
+    journal.set_defaults(func=bench_journal)
@@ -0,0 +1,131 @@
+"""
+Задержка хендлеров при N одновременных пользователях (python bench.py latency).
+"""
+
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+
+from db import Database
+
+from benchmarks.common import make_books, measure_loop_lag, report
+
+
+class SyncDatabase:
+    """
+    Прежняя схема: один курсор, запросы прямо в цикле событий.
+    Повторяет API Database, чтобы сценарий был одинаковым.
+    """
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        self.cursor = self.conn.cursor()
+
+    async def get_user(self, user_id):
+        self.cursor.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
+        return self.cursor.fetchone()
+
+    async def create_user(self, user_id, name, surname, password):
+        self.cursor.execute(
+            "INSERT INTO users (user_id, name, surname, password) VALUES (?, ?, ?, ?)",
+            (user_id, name, surname, password),
+        )
+        self.conn.commit()
+
+    async def find_book(self, title):
+        self.cursor.execute(
+            "SELECT title, author, available, borrower FROM books WHERE title = ?",
+            (title,),
+        )
+        return self.cursor.fetchone()
+
+    async def borrow_book(self, user_id, title):
+        # Как раньше: проверка, затем две записи со своим commit каждая
+        row = await self.find_book(title)
+        if not row or not row[2]:
+            return False
+        self.cursor.execute(
+            "UPDATE books SET available = ?, borrower = ? WHERE title = ?",
+            (False, f"Имя{user_id}", title),
+        )
+        self.conn.commit()
+        self.cursor.execute(
+            "INSERT INTO loans (user_id, book_id, borrowed_at, due_at) "
+            "SELECT ?, id, 0, 0 FROM books WHERE title = ?",
+            (user_id, title),
+        )
+        self.conn.commit()
+        return True
+
+
+async def send_answer():
+    # Имитация message.answer: ответ уходит в сеть и отдаёт управление циклу
+    await asyncio.sleep(0)
+
+
+async def simulate_user(db, user_id, books_count, arrived, latencies):
+    """
+    Один пользователь: регистрация, поиск книги и бронирование.
+    Задержка хендлера считается от прихода сообщения до ответа; первое
+    сообщение всех пользователей приходит одновременно.
+    """
+    if not await db.get_user(user_id):
+        await db.create_user(user_id, f"Имя{user_id}", f"Фамилия{user_id}", "pwd")
+    await send_answer()
+    latencies.append(time.perf_counter() - arrived)
+
+    title = f"Книга {user_id % books_count}"
+
+    arrived = time.perf_counter()
+    await db.get_user(user_id)
+    await db.find_book(title)
+    await send_answer()
+    latencies.append(time.perf_counter() - arrived)
+
+    arrived = time.perf_counter()
+    await db.borrow_book(user_id, title)
+    await send_answer()
+    latencies.append(time.perf_counter() - arrived)
+
+
+async def run_latency(mode, users, books_count, directory):
+    path = os.path.join(directory, f"{mode}.sqlite3")
+    database = Database(path)
+    await database.connect()
+    await database.init_books(make_books(books_count))
+    db = database if mode == "async" else SyncDatabase(path)
+
+    latencies, lags = [], []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(measure_loop_lag(lags, stop))
+    await asyncio.sleep(0)
+
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(
+            simulate_user(db, user_id, books_count, started, latencies)
+            for user_id in range(users)
+        )
+    )
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await probe
+
+    report(f"handler[{mode}]", latencies, elapsed)
+    report(f"loop lag[{mode}]", lags, elapsed)
+    await database.close()
+
+
+def bench_latency(args):
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        for mode in ("sync", "async"):
+            asyncio.run(run_latency(mode, args.users, args.books, directory))
+
+
+def add_parser(sub):
+    latency = sub.add_parser("latency", help="p50/p99 хендлеров, sync vs async")
+    latency.add_argument("--users", type=int, default=1000)
+    latency.add_argument("--books", type=int, default=200)
+    latency.set_defaults(func=bench_latency)
@@ -0,0 +1,68 @@
+"""
+Тысячи одновременных нажатий «📚 Список книг», с кешем страниц и без (python bench.py listspam).
+"""
+
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.common import CountingDatabase, create_catalogue, import_start, report
+
+
+async def run_listspam(label, path, users, borrow_share, spread, cache_size):
+    database = CountingDatabase(path)
+    await database.connect()
+    for user_id in range(users):
+        await database.create_user(user_id, f"Имя{user_id}", f"Фамилия{user_id}", "pwd")
+    start = import_start(database)
+    start.books_pages_cache.maxsize = cache_size
+    # Без кеша — и без объединения одновременных запросов
+    fetch = start.get_books_page if cache_size else start.load_books_page
+    rng = random.Random(0)
+
+    async def press(user_id):
+        # Нажатия приходят вперемешку в течение spread секунд
+        await asyncio.sleep(rng.random() * spread)
+        started = time.perf_counter()
+        if rng.random() < borrow_share:
+            await database.borrow_book(user_id, f"Книга {rng.randrange(1000)}")
+            return
+        # Чаще всего смотрят первую страницу, иногда листают дальше
+        cursor = 0 if rng.random() < 0.8 else rng.randrange(0, 1000, 10)
+        await fetch(cursor, False)
+        latencies.append(time.perf_counter() - started)
+
+    # Первая волна — холодный кеш, вторая — установившийся режим
+    for wave in ("cold", "steady"):
+        database.reads = 0
+        latencies = []
+        started = time.perf_counter()
+        await asyncio.gather(*(press(user_id) for user_id in range(users)))
+        elapsed = time.perf_counter() - started
+        report(f"list[{label}, {wave}]", latencies, elapsed)
+        print(f"{'':<24} чтений из БД на нажатие: {database.reads / len(latencies):.3f}")
+    print(f"{'':<24} кеш: {start.books_pages_cache.stats()}")
+    await database.close()
+
+
+def bench_listspam(args):
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        for label, size in (("без кеша", 0), ("кеш страниц", 1000)):
+            path = os.path.join(directory, f"list{size}.sqlite3")
+            asyncio.run(create_catalogue(path, args.books))
+            asyncio.run(
+                run_listspam(
+                    label, path, args.users, args.borrow_share, args.spread, size
+                )
+            )
+
+
+def add_parser(sub):
+    listspam = sub.add_parser("listspam", help="кеш отрисованных страниц каталога")
+    listspam.add_argument("--users", type=int, default=5000)
+    listspam.add_argument("--books", type=int, default=10_000)
+    listspam.add_argument("--borrow-share", type=float, default=0.01)
+    listspam.add_argument("--spread", type=float, default=0.5, help="секунд")
+    listspam.set_defaults(func=bench_listspam)
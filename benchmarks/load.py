@@ -0,0 +1,243 @@
+"""
+Сценарии нагрузки через диспетчер, базовая линия и сравнение с ней (python bench.py load).
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from db import Database
+
+from benchmarks.common import (
+    BENCH,
+    counting_dispatcher,
+    create_catalogue,
+    import_start,
+    make_fake_session,
+    measure_loop_lag,
+    peak_rss_mib,
+    percentile,
+    quiet_aiogram,
+)
+from benchmarks.shards import check_loans
+
+
+# Что делает каждый виртуальный пользователь. Следующее сообщение уходит
+# только после ответа бота на предыдущее, как у живого человека
+LOAD_SCRIPTS = {
+    "register": lambda u: ["📝 Регистрация", f"Имя{u}", f"Фамилия{u}", f"pwd{u}"],
+    "login": lambda u: ["🔑 Войти", f"Имя{u}", f"Фамилия{u}", f"pwd{u}"],
+    "listspam": lambda u: ["📚 Список книг"] * 5,
+    "borrow": lambda u: ["📖 Взять книгу", "Книга 1"],
+}
+
+# С чего начинается последний ответ бота, если сценарий пройден. В borrow
+# книгу получает ровно один пользователь, остальным она уже занята
+LOAD_SUCCESS = {
+    "register": "✅ Регистрация завершена",
+    "login": "✅ Успешный вход",
+    "listspam": "Список книг:",
+    "borrow": "Вы успешно зарезервировали",
+}
+
+# Сценарии, которым нужны уже зарегистрированные пользователи
+LOAD_PREREGISTERED = {"login", "listspam", "borrow"}
+
+# Метрика -> True, если больше — лучше
+LOAD_METRICS = {"updates_per_s": True, "p50_ms": False, "p99_ms": False, "peak_rss_mib": False}
+
+
+def load_bot():
+    """
+    Бот с сессией без сети; второй результат — последний ответ бота в каждый чат.
+    """
+    from aiogram import Bot
+
+    session = make_fake_session(0)
+    last_reply = {}
+
+    @session.middleware
+    async def record(make_request, bot, method):
+        text = getattr(method, "text", None)
+        if text is not None:
+            last_reply[method.chat_id] = text
+        return await make_request(bot, method)
+
+    return Bot("0:bench", session=session), last_reply
+
+
+async def drive_users(dispatcher, bot, last_reply, users, concurrency, script):
+    """
+    users пользователей одновременно (не больше concurrency в работе)
+    проходят script(u) через Dispatcher.feed_update. Возвращает задержки
+    обновлений, лаг цикла событий, общее время и последний ответ каждому.
+    """
+    from aiogram.types import Update
+
+    slots = asyncio.Semaphore(concurrency)
+    latencies = []
+    outcomes = []
+    update_ids = itertools.count()
+
+    async def user(u):
+        async with slots:
+            for text in script(u):
+                update_id = next(update_ids)
+                update = Update.model_validate(
+                    {
+                        "update_id": update_id,
+                        "message": {
+                            "message_id": update_id,
+                            "date": 0,
+                            "chat": {"id": u, "type": "private"},
+                            "from": {"id": u, "is_bot": False, "first_name": f"Имя{u}"},
+                            "text": text,
+                        },
+                    },
+                    context={"bot": bot},
+                )
+                started = time.perf_counter()
+                await dispatcher.feed_update(bot, update)
+                latencies.append(time.perf_counter() - started)
+            outcomes.append(last_reply.get(u, ""))
+
+    lags = []
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(lags, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(user(u) for u in range(users)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await lag_task
+    return latencies, lags, elapsed, outcomes
+
+
+async def run_load(scenario, users, concurrency, books, scrypt_n, directory):
+    """
+    Один сценарий: users пользователей проходят его через диспетчер с
+    роутером start.py, ответы бота уходят в сессию без сети.
+    """
+    from passwords import PasswordHasher
+
+    quiet_aiogram()
+    path = os.path.join(directory, f"load-{scenario}.sqlite3")
+    await create_catalogue(path, books)
+    database = Database(path)
+    await database.connect()
+    if scenario in LOAD_PREREGISTERED:
+        # Пароли открытым текстом, как у старой версии: вход их пересчитает
+        for u in range(users):
+            await database.create_user(u, f"Имя{u}", f"Фамилия{u}", f"pwd{u}")
+    dispatcher = counting_dispatcher(database)
+    dispatcher.expected = float("inf")
+    start = import_start(database)
+    start.hasher = PasswordHasher(n=scrypt_n)
+    bot, last_reply = load_bot()
+
+    rss_before = peak_rss_mib()
+    latencies, lags, elapsed, outcomes = await drive_users(
+        dispatcher, bot, last_reply, users, concurrency, LOAD_SCRIPTS[scenario]
+    )
+
+    await dispatcher.storage.close()
+    await database.close()
+    start.hasher.close()
+    taken, loans, per_book = check_loans(path)
+    return {
+        "users": users,
+        "updates": len(latencies),
+        "updates_per_s": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": max(latencies) * 1000,
+        "loop_lag_p99_ms": percentile(lags, 99) * 1000,
+        "peak_rss_mib": peak_rss_mib(),
+        "rss_growth_mib": peak_rss_mib() - rss_before,
+        "succeeded": sum(reply.startswith(LOAD_SUCCESS[scenario]) for reply in outcomes),
+        "open_loans": loans,
+        "max_loans_per_book": per_book,
+    }
+
+
+def bench_load(args):
+    if args.only:
+        # Дочерний процесс: один сценарий, результат — JSON в stdout
+        with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+            result = asyncio.run(
+                run_load(
+                    args.only, args.users, args.concurrency, args.books, args.scrypt_n, directory
+                )
+            )
+        print(json.dumps(result))
+        return
+
+    results = {}
+    for scenario in args.scenarios.split(","):
+        # Каждый сценарий — в своём процессе, чтобы пик RSS был только его
+        output = subprocess.run(
+            [
+                sys.executable, BENCH, "load", "--only", scenario,
+                "--users", str(args.users), "--concurrency", str(args.concurrency),
+                "--books", str(args.books), "--scrypt-n", str(args.scrypt_n), "--dir", args.dir,
+            ],
+            check=True, stdout=subprocess.PIPE, text=True,
+        ).stdout
+        result = results[scenario] = json.loads(output.splitlines()[-1])
+        print(
+            f"load[{scenario:<8}] {result['updates']:>6} обновлений, "
+            f"{result['updates_per_s']:7,.0f}/s  p50={result['p50_ms']:7.2f} ms  "
+            f"p99={result['p99_ms']:7.2f} ms  лаг цикла p99={result['loop_lag_p99_ms']:6.2f} ms  "
+            f"пик RSS {result['peak_rss_mib']:.0f} MiB; успешно: {result['succeeded']}/{result['users']}, "
+            f"открытых выдач: {result['open_loans']} (на книгу не больше {result['max_loans_per_book']})"
+        )
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(
+                {"python": sys.version.split()[0], "cpus": os.cpu_count(), "results": results},
+                f, ensure_ascii=False, indent=2,
+            )
+        print(f"load: базовая линия сохранена в {args.save}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = []
+        for scenario, result in results.items():
+            if scenario not in baseline:
+                continue
+            if baseline[scenario]["users"] != result["users"]:
+                print(f"load[{scenario:<8}] в базовой линии другое число пользователей, пропускаем")
+                continue
+            for metric, higher_is_better in LOAD_METRICS.items():
+                old, new = baseline[scenario][metric], result[metric]
+                change = (new - old) / old if old else 0.0
+                worse = -change if higher_is_better else change
+                mark = "  РЕГРЕССИЯ" if worse > args.tolerance else ""
+                if mark:
+                    regressions.append(f"{scenario}.{metric}")
+                print(f"load[{scenario:<8}] {metric:<14} {old:10.2f} -> {new:10.2f} ({change:+.1%}){mark}")
+        if regressions:
+            print(f"load: хуже базовой линии больше чем на {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+def add_parser(sub):
+    load = sub.add_parser("load", help="сценарии нагрузки через диспетчер, базовая линия")
+    load.add_argument("--scenarios", default=",".join(LOAD_SCRIPTS))
+    load.add_argument("--users", type=int, default=2000)
+    load.add_argument("--concurrency", type=int, default=200)
+    load.add_argument("--books", type=int, default=10_000)
+    # Полная цена scrypt — в сценарии passwords; здесь меряется сам бот
+    load.add_argument("--scrypt-n", type=int, default=2**10)
+    load.add_argument("--save", help="записать результаты как базовую линию (JSON)")
+    load.add_argument("--compare", help="сравнить с базовой линией из этого файла")
+    load.add_argument("--tolerance", type=float, default=0.2, help="допустимое ухудшение")
+    load.add_argument("--only", choices=list(LOAD_SCRIPTS), help=argparse.SUPPRESS)
+    load.set_defaults(func=bench_load)
@@ -0,0 +1,177 @@
+"""
+Цена замеров на горячем пути (python bench.py metrics).
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+import types
+
+from db import Database
+
+from benchmarks.common import (
+    counting_dispatcher,
+    create_catalogue,
+    import_start,
+    synthetic_updates,
+)
+from benchmarks.webhook import run_polling
+
+
+def bench_metrics(args):
+    import db as db_module
+    from metrics import (
+        ApiMetricsMiddleware,
+        HandlerMetricsMiddleware,
+        Metrics,
+        TimedConnection,
+        UpdateMetricsMiddleware,
+    )
+
+    async def run():
+        with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+            path = os.path.join(directory, "metrics.sqlite3")
+            await create_catalogue(path, args.books)
+            metrics = Metrics()
+            plain, timed = Database(path), Database(path, metrics=metrics)
+            for database in (plain, timed):
+                await database.connect()
+            for user_id in range(0, args.users, 2):
+                await plain.create_user(user_id, f"Имя{user_id}", f"Фамилия{user_id}", "pwd")
+
+            dispatcher = counting_dispatcher(plain)
+            start = import_start(plain)
+            # Замеры, которые start.py вешает на свой роутер, снимаем: их включает конфигурация
+            for observer in (start.router.message, start.router.callback_query):
+                for middleware in list(observer.middleware):
+                    if isinstance(middleware, HandlerMetricsMiddleware):
+                        observer.middleware.unregister(middleware)
+            update_mw = UpdateMetricsMiddleware(metrics)
+            handler_mw = HandlerMetricsMiddleware(metrics)
+            updates = list(synthetic_updates(args.updates, args.users))
+
+            async def configure(enabled):
+                database = timed if enabled else plain
+                start.db = dispatcher.storage.db = database
+                if enabled:
+                    dispatcher.update.outer_middleware(update_mw)
+                    start.router.message.middleware(handler_mw)
+                else:
+                    for observer, middleware in (
+                        (dispatcher.update.outer_middleware, update_mw),
+                        (start.router.message.middleware, handler_mw),
+                    ):
+                        if middleware in list(observer):
+                            observer.unregister(middleware)
+
+            # Прогоны чередуются, сравниваются соседние пары: так меньше
+            # сказывается фоновая нагрузка на машину
+            rates = {False: [], True: []}
+            for _ in range(args.rounds):
+                for enabled in (False, True):
+                    await configure(enabled)
+                    session_mw = ApiMetricsMiddleware(metrics) if enabled else None
+                    elapsed = await run_polling(
+                        dispatcher, updates, 100, 0, session_middleware=session_mw
+                    )
+                    rates[enabled].append(len(updates) / elapsed)
+            overhead = statistics.median(1 - on / off for off, on in zip(rates[False], rates[True]))
+            print(
+                f"metrics[обновления] без замеров {statistics.median(rates[False]):,.0f}/s, "
+                f"с замерами {statistics.median(rates[True]):,.0f}/s, "
+                f"накладные расходы (медиана по парам) {overhead:.1%}"
+            )
+            await dispatcher.storage.close()
+            for database in (plain, timed):
+                await database.close()
+
+            # Цена одного вызова каждого middleware по сравнению с прямым вызовом
+            from aiogram.methods import SendMessage
+            from aiogram.types import Update
+
+            async def noop(*args):
+                return None
+
+            update = Update.model_validate(updates[0])
+            data = {"handler": types.SimpleNamespace(callback=noop)}
+            method = SendMessage(chat_id=1, text="x")
+            scratch = Metrics()
+            api_mw = ApiMetricsMiddleware(scratch)
+            calls = {
+                "без middleware": lambda: noop(update, data),
+                "UpdateMetricsMiddleware": lambda: UpdateMetricsMiddleware(scratch)(noop, update, data),
+                "HandlerMetricsMiddleware": lambda: HandlerMetricsMiddleware(scratch)(
+                    noop, update.message, data
+                ),
+                "ApiMetricsMiddleware": lambda: api_mw(noop, None, method),
+            }
+            costs = {}
+            for label, call in calls.items():
+                started = time.perf_counter()
+                for _ in range(args.queries):
+                    await call()
+                costs[label] = (time.perf_counter() - started) / args.queries * 1e6
+            for label, cost in costs.items():
+                print(f"metrics[{label}] {cost:.2f} мкс на вызов")
+
+            # Цена одного запроса через TimedConnection
+            sql_costs = {}
+            for label, factory in (("sqlite3", sqlite3.Connection), ("TimedConnection", TimedConnection)):
+                conn = sqlite3.connect(path, factory=factory)
+                if factory is TimedConnection:
+                    conn.metrics = scratch
+                started = time.perf_counter()
+                for i in range(args.queries):
+                    db_module._get_user(conn, i % args.users)
+                sql_costs[label] = (time.perf_counter() - started) / args.queries * 1e6
+                print(f"metrics[SQL, {label}] {sql_costs[label]:.2f} мкс на запрос")
+                conn.close()
+
+            # Оценка по счётчикам: сколько замеров приходится на одно обновление
+            # и сколько стоит каждый. Сквозной замер выше на одном ядре шумит
+            # на ±10%, эта оценка от нагрузки на машину почти не зависит
+            summary = json.loads(metrics.to_json())["histograms"]
+            total = len(updates) * args.rounds
+            per_update = {
+                name: sum(h["count"] for h in summary.get(name, {}).values()) / total
+                for name in ("sql_seconds", "handler_seconds", "telegram_request_seconds")
+            }
+            base = costs.pop("без middleware")
+            added = (
+                costs["UpdateMetricsMiddleware"] - base
+                + (costs["HandlerMetricsMiddleware"] - base) * per_update["handler_seconds"]
+                + (costs["ApiMetricsMiddleware"] - base) * per_update["telegram_request_seconds"]
+                + (sql_costs["TimedConnection"] - sql_costs["sqlite3"]) * per_update["sql_seconds"]
+            )
+            estimate = added / (1e6 / statistics.median(rates[False]))
+            print(
+                f"metrics: на обновление SQL-запросов {per_update['sql_seconds']:.1f}, "
+                f"хендлеров {per_update['handler_seconds']:.1f}, "
+                f"запросов к API {per_update['telegram_request_seconds']:.1f}; "
+                f"замеры добавляют {added:.1f} мкс, оценка накладных расходов {estimate:.1%}"
+            )
+            for name in ("update_seconds", "handler_seconds", "telegram_request_seconds"):
+                for label, histogram in sorted(summary.get(name, {}).items()):
+                    print(
+                        f"metrics[{name} {label}] n={histogram['count']} "
+                        f"p50 <= {histogram['p50'] * 1000:g} ms, p99 <= {histogram['p99'] * 1000:g} ms"
+                    )
+            return estimate
+
+    estimate = asyncio.run(run())
+    if estimate > 0.02:
+        print("metrics: оценка накладных расходов выше 2%")
+
+
+def add_parser(sub):
+    metrics = sub.add_parser("metrics", help="накладные расходы метрик")
+    metrics.add_argument("--updates", type=int, default=5000)
+    metrics.add_argument("--users", type=int, default=1000)
+    metrics.add_argument("--books", type=int, default=10_000)
+    metrics.add_argument("--rounds", type=int, default=5)
+    metrics.add_argument("--queries", type=int, default=100_000)
+    metrics.set_defaults(func=bench_metrics)
@@ -0,0 +1,97 @@
+"""
+Листание каталога по ключу на большом каталоге (python bench.py pages).
+"""
+
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+
+from db import Database
+
+from benchmarks.common import create_catalogue, report
+
+
+def render_page(rows):
+    # То же форматирование, что в start.get_books_page
+    lines = ["Список книг:"]
+    for _, title, author, available, borrower in rows:
+        status = "✅ Доступна" if available else f"❌ Занята (Взял: {borrower})"
+        lines.append(f"📖 {title} - {author} ({status})")
+    return "\n".join(lines)
+
+
+def render_full(conn):
+    # Прежний get_books_list: fetchall всего каталога и сборка строки через +=
+    rows = conn.execute("SELECT title, author, available, borrower FROM books").fetchall()
+    book_list = "Список книг:\n"
+    for title, author, available, borrower in rows:
+        status = "✅ Доступна" if available else f"❌ Занята (Взял: {borrower})"
+        book_list += f"📖 {title} - {author} ({status})\n"
+    return book_list
+
+
+async def run_pages(path, count, requests, page_size, full):
+    await create_catalogue(path, count)
+    database = Database(path)
+    await database.connect()
+
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(requests):
+        cursor = random.randrange(count)
+        backward = random.random() < 0.5
+        fetch_started = time.perf_counter()
+        rows, _ = await database.get_books_page(cursor, page_size, backward)
+        render_page(rows)
+        latencies.append(time.perf_counter() - fetch_started)
+    report("page", latencies, time.perf_counter() - started)
+
+    tracemalloc.start()
+    rows, _ = await database.get_books_page(count - page_size * 2, page_size)
+    text = render_page(rows)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{'':<24} пик памяти на страницу: {peak / 1024:,.0f} KiB, {len(text)} символов")
+    await database.close()
+
+    if full:
+        conn = sqlite3.connect(path)
+        tracemalloc.start()
+        started = time.perf_counter()
+        text = render_full(conn)
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        conn.close()
+        print(
+            f"{'full list (старый)':<24} {elapsed * 1000:,.0f} ms, "
+            f"пик памяти {peak / 1024 / 1024:,.0f} MiB, {len(text):,} символов"
+        )
+
+
+def bench_pages(args):
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        asyncio.run(
+            run_pages(
+                os.path.join(directory, "pages.sqlite3"),
+                args.books,
+                args.requests,
+                args.page_size,
+                args.full,
+            )
+        )
+
+
+def add_parser(sub):
+    pages = sub.add_parser("pages", help="листание каталога по ключу")
+    pages.add_argument("--books", type=int, default=1_000_000)
+    pages.add_argument("--requests", type=int, default=2000)
+    pages.add_argument("--page-size", type=int, default=10)
+    pages.add_argument(
+        "--no-full", dest="full", action="store_false", help="не мерить старый список"
+    )
+    pages.set_defaults(func=bench_pages)
@@ -0,0 +1,101 @@
+"""
+Вход при одновременных попытках, хеширование в цикле и в пуле (python bench.py passwords).
+"""
+
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+
+from db import Database
+
+from benchmarks.common import (
+    counting_dispatcher,
+    create_catalogue,
+    import_start,
+    percentile,
+    quiet_aiogram,
+)
+from benchmarks.load import drive_users, load_bot
+
+
+def bench_passwords(args):
+    from passwords import PasswordHasher
+
+    class InlineHasher(PasswordHasher):
+        # Как было бы без пула: хеш считается прямо в цикле событий
+        async def _run(self, func, *args):
+            self.hashed += 1
+            return func(*args)
+
+    def login_script(u):
+        return ["🔑 Войти", f"Имя{u}", f"Фамилия{u}", "pwd"]
+
+    async def run():
+        quiet_aiogram()
+        with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+            path = os.path.join(directory, "passwords.sqlite3")
+            await create_catalogue(path, 100)
+            database = Database(path)
+            await database.connect()
+            hasher = PasswordHasher(n=args.scrypt_n)
+            started = time.perf_counter()
+            stored = await hasher.hash("pwd")
+            print(f"passwords: один хеш scrypt n={args.scrypt_n} — {(time.perf_counter() - started) * 1000:.0f} ms")
+            # Соль у всех одна: бенчмарку важна только цена проверки
+            for u in range(args.users):
+                await database.create_user(u, f"Имя{u}", f"Фамилия{u}", stored)
+            dispatcher = counting_dispatcher(database)
+            dispatcher.expected = float("inf")
+            start = import_start(database)
+            bot, last_reply = load_bot()
+
+            modes = [
+                ("в цикле событий", InlineHasher(n=args.scrypt_n)),
+                ("пул потоков", hasher),
+            ]
+            for label, start.hasher in modes:
+                latencies, lags, elapsed, outcomes = await drive_users(
+                    dispatcher, bot, last_reply, args.users, args.users, login_script
+                )
+                ok = sum(reply.startswith("✅ Успешный вход") for reply in outcomes)
+                print(
+                    f"passwords[{label:<15}] {args.users / elapsed:6.1f} входов/s, "
+                    f"обновление p50={percentile(latencies, 50) * 1000:7.1f} ms "
+                    f"p99={percentile(latencies, 99) * 1000:7.1f} ms; лаг цикла "
+                    f"p99={percentile(lags, 99) * 1000:6.1f} ms max={max(lags) * 1000:6.1f} ms; "
+                    f"вошли {ok}/{args.users}"
+                )
+
+            # Пароли открытым текстом из старой версии пересчитываются при входе
+            conn = sqlite3.connect(path)
+            with conn:
+                conn.execute("UPDATE users SET password = 'pwd'")
+            latencies, lags, elapsed, outcomes = await drive_users(
+                dispatcher, bot, last_reply, args.users, args.users, login_script
+            )
+            (upgraded,) = conn.execute(
+                "SELECT COUNT(*) FROM users WHERE password LIKE 'scrypt$%'"
+            ).fetchone()
+            conn.close()
+            ok = sum(reply.startswith("✅ Успешный вход") for reply in outcomes)
+            print(
+                f"passwords[открытый текст ] {args.users / elapsed:6.1f} входов/s, "
+                f"лаг цикла p99={percentile(lags, 99) * 1000:6.1f} ms; вошли {ok}/{args.users}, "
+                f"пароль пересчитан у {upgraded}/{args.users}"
+            )
+            await dispatcher.storage.close()
+            await database.close()
+            for _, mode_hasher in modes:
+                mode_hasher.close()
+            print(f"passwords: счётчики пула {hasher.stats()}")
+
+    asyncio.run(run())
+
+
+def add_parser(sub):
+    passwords = sub.add_parser("passwords", help="одновременные входы, хеширование паролей")
+    passwords.add_argument("--users", type=int, default=200)
+    passwords.add_argument("--scrypt-n", type=int, default=2**14)
+    passwords.set_defaults(func=bench_passwords)
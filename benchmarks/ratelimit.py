@@ -0,0 +1,131 @@
+"""
+Лимиты входящих обновлений и очередь исходящих сообщений (python bench.py ratelimit).
+"""
+
+import asyncio
+import time
+
+from benchmarks.common import report
+
+
+def make_flood_session(limit, per_seconds=1.0):
+    """
+    Сессия, которая ведёт себя как Telegram при флуде: больше limit
+    отправок за per_seconds — ответ 429 с retry_after.
+    """
+    from collections import deque
+
+    from aiogram.client.session.base import BaseSession
+    from aiogram.exceptions import TelegramRetryAfter
+
+    class FloodSession(BaseSession):
+        def __init__(self):
+            super().__init__()
+            self.sent = []
+            self.flooded = 0
+            self._window = deque()
+
+        async def make_request(self, bot, method, timeout=None):
+            now = time.monotonic()
+            while self._window and self._window[0] <= now - per_seconds:
+                self._window.popleft()
+            if len(self._window) >= limit:
+                self.flooded += 1
+                raise TelegramRetryAfter(method, "Too Many Requests", retry_after=1)
+            self._window.append(now)
+            self.sent.append(method)
+            return True
+
+        async def stream_content(
+            self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True
+        ):
+            # Файлов у сессии без сети нет: содержимое всегда пустое
+            for chunk in ():
+                yield chunk
+
+        async def close(self):
+            pass
+
+    return FloodSession()
+
+
+async def run_sends(label, sends, chats, rate, scheduler):
+    from aiogram import Bot
+
+    session = make_flood_session(rate)
+    if scheduler is not None:
+        session.middleware(scheduler)
+    bot = Bot("0:bench", session=session)
+    latencies = []
+    failed = 0
+
+    async def send(i):
+        nonlocal failed
+        started = time.perf_counter()
+        try:
+            await bot.send_message(chat_id=i % chats, text=f"Сообщение {i}")
+        except Exception:
+            failed += 1
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(send(i) for i in range(sends)))
+    elapsed = time.perf_counter() - started
+    report(f"ratelimit[{label}]", latencies, elapsed)
+    print(
+        f"{'':<24} запросов к API: {len(session.sent)}, 429: {session.flooded}, "
+        f"ошибок у хендлеров: {failed}"
+        + (f", планировщик: {scheduler.stats()}" if scheduler is not None else "")
+    )
+    return session, failed
+
+
+def bench_ratelimit(args):
+    from types import SimpleNamespace
+
+    from ratelimit import SendScheduler, ThrottlingMiddleware
+
+    # Входящие: виртуальные часы, один пользователь шлёт 100 сообщений в секунду
+    now = [0.0]
+    throttling = ThrottlingMiddleware(clock=lambda: now[0])
+    handled = {"спамер": 0, "обычный": 0}
+
+    async def handler(event, data):
+        handled[event] += 1
+
+    async def incoming():
+        for tick in range(1000):
+            now[0] = tick / 100
+            spammer = SimpleNamespace(id=1)
+            await throttling(handler, "спамер", {"event_from_user": spammer, "event_chat": spammer})
+            if tick % 100 == 0:
+                user = SimpleNamespace(id=2)
+                await throttling(handler, "обычный", {"event_from_user": user, "event_chat": user})
+
+    asyncio.run(incoming())
+    print(f"ratelimit[входящие] за 10 s обработано: {handled}, {throttling.stats()}")
+    ok = handled["обычный"] == 10 and handled["спамер"] <= 5 + 10
+
+    # Исходящие: без планировщика Telegram отвечает 429, с ним — нет
+    _, failed = asyncio.run(run_sends("без очереди", args.sends, args.chats, args.rate, None))
+    ok &= failed > 0
+    scheduler = SendScheduler()
+    session, failed = asyncio.run(
+        run_sends("SendScheduler", args.sends, args.chats, args.rate, scheduler)
+    )
+    ok &= failed == 0 and session.flooded == 0
+
+    # Склейка: 20 сообщений подряд в один чат уходят меньшим числом запросов
+    scheduler = SendScheduler()
+    session, failed = asyncio.run(run_sends("один чат", 20, 1, args.rate, scheduler))
+    ok &= failed == 0 and len(session.sent) < 20
+    if not ok:
+        raise SystemExit("лимиты не сработали")
+
+
+def add_parser(sub):
+    ratelimit = sub.add_parser("ratelimit", help="лимиты входящих и очередь исходящих")
+    ratelimit.add_argument("--sends", type=int, default=450)
+    ratelimit.add_argument("--chats", type=int, default=200)
+    ratelimit.add_argument("--rate", type=float, default=30.0, help="лимит Telegram, в секунду")
+    ratelimit.set_defaults(func=bench_ratelimit)
@@ -0,0 +1,212 @@
+"""
+Напоминания о сроке возврата на виртуальных часах (python bench.py reminders).
+"""
+
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from db import LOAN_DAYS
+
+from benchmarks.common import CountingDatabase, create_catalogue, percentile
+
+
+def bench_reminders(args):
+    import logging
+
+    from aiogram.exceptions import TelegramNetworkError
+
+    from reminders import OVERDUE_EVERY, REMINDER_SLACK, RETRY_DELAY, ReminderScheduler
+
+    day = 86400
+    start_at = 1_700_000_000
+
+    class FakeClock:
+        def __init__(self, end_at=start_at + (LOAN_DAYS + 2) * day):
+            self.now = float(start_at)
+            self.end_at = end_at
+            self.finished = asyncio.Event()
+
+        def __call__(self):
+            return self.now
+
+        async def sleep(self, delay):
+            if self.now + delay > self.end_at:
+                # Время вышло: дальше задача просто ждёт отмены
+                self.finished.set()
+                await asyncio.Event().wait()
+            self.now += delay
+            await asyncio.sleep(0)
+
+    class FakeBot:
+        def __init__(self, clock):
+            self.clock = clock
+            self.sent = []
+
+        async def send_message(self, chat_id, text):
+            self.sent.append((chat_id, self.clock(), text.startswith("📅")))
+
+    class OfflineBot(FakeBot):
+        async def send_message(self, chat_id, text):
+            self.sent.append((chat_id, self.clock(), False))
+            raise TelegramNetworkError(None, "сеть недоступна")
+
+    async def outage(loans, hours):
+        # Telegram недоступен: каждое напоминание должно повторяться раз в
+        # RETRY_DELAY после окна, а не слаться по кругу в одном проходе
+        with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+            path = os.path.join(directory, "outage.sqlite3")
+            await create_catalogue(path, loans)
+            conn = sqlite3.connect(path)
+            with conn:
+                conn.executemany(
+                    "INSERT INTO users (user_id, name, surname, password) VALUES (?, ?, ?, 'x')",
+                    ((u, f"Имя{u}", f"Фамилия{u}") for u in range(loans)),
+                )
+                conn.executemany(
+                    """
+                    INSERT INTO loans (user_id, book_id, borrowed_at, due_at, next_reminder_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    """,
+                    ((u, u + 1, start_at - 20 * day, start_at - day, start_at) for u in range(loans)),
+                )
+            conn.close()
+            database = CountingDatabase(path)
+            await database.connect()
+            clock = FakeClock(start_at + hours * 3600)
+            bot = OfflineBot(clock)
+            scheduler = ReminderScheduler(
+                database, bot, rate=args.rate, clock=clock, sleep=clock.sleep
+            )
+            database.reads = 0
+            scheduler.start()
+            await clock.finished.wait()
+            await scheduler.stop()
+            await database.close()
+        return len(bot.sent), database.reads
+
+    async def run():
+        with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+            path = os.path.join(directory, "reminders.sqlite3")
+            await create_catalogue(path, args.loans)
+            rng = random.Random(0)
+            conn = sqlite3.connect(path)
+            with conn:
+                conn.executemany(
+                    "INSERT INTO users (user_id, name, surname, password) VALUES (?, ?, ?, 'x')",
+                    ((u, f"Имя{u}", f"Фамилия{u}") for u in range(args.loans)),
+                )
+                conn.execute("UPDATE books SET available = 0")
+                # Книги взяты в течение последних двух недель: сроки разбросаны
+                # по ближайшим 14 дням, у каждой выдачи свой читатель
+                loans = []
+                for u in range(args.loans):
+                    borrowed_at = start_at - rng.randrange(LOAN_DAYS * day)
+                    due_at = borrowed_at + LOAN_DAYS * day
+                    loans.append((u, u + 1, borrowed_at, due_at, due_at - day))
+                conn.executemany(
+                    """
+                    INSERT INTO loans (user_id, book_id, borrowed_at, due_at, next_reminder_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    """,
+                    loans,
+                )
+            due = {u: due_at for u, _, _, due_at, _ in loans}
+
+            # Для сравнения: опрос всей таблицы, как без индекса и расписания
+            started = time.perf_counter()
+            for _ in range(10):
+                conn.execute(
+                    "SELECT COUNT(*) FROM loans NOT INDEXED "
+                    "WHERE returned_at IS NULL AND due_at - ? <= ?",
+                    (day, start_at),
+                ).fetchone()
+            scan = (time.perf_counter() - started) / 10
+            conn.close()
+
+            database = CountingDatabase(path)
+            await database.connect()
+            clock = FakeClock()
+            bot = FakeBot(clock)
+            scheduler = ReminderScheduler(
+                database, bot, rate=args.rate, clock=clock, sleep=clock.sleep
+            )
+            database.reads = 0
+            started = time.perf_counter()
+            scheduler.start()
+            await clock.finished.wait()
+            elapsed = time.perf_counter() - started
+            await scheduler.stop()
+            await database.close()
+
+        before = {}
+        overdue = {}
+        lateness = []
+        for user_id, at, early in bot.sent:
+            if early:
+                before[user_id] = before.get(user_id, 0) + 1
+                if due[user_id] - day >= start_at:
+                    lateness.append(at - (due[user_id] - day))
+            else:
+                overdue.setdefault(user_id, []).append(at)
+                if len(overdue[user_id]) == 1:
+                    lateness.append(at - due[user_id])
+        gaps = [b - a for times in overdue.values() for a, b in zip(times, times[1:])]
+        # Выдача, срок которой уже наступил к началу, получает только напоминание о просрочке
+        expected_before = sum(1 for due_at in due.values() if due_at - day >= start_at)
+        ok = (
+            sum(before.values()) == len(before) >= expected_before
+            and len(overdue) == args.loans
+            # Любое напоминание может уйти раньше на slack, повторное — тоже
+            and all(gap >= OVERDUE_EVERY - REMINDER_SLACK for gap in gaps)
+            and min(lateness) >= -REMINDER_SLACK
+        )
+        days = (clock.end_at - start_at) / day
+        print(
+            f"reminders: {args.loans:,} открытых выдач, {days:.0f} виртуальных дней за {elapsed:.1f} s; "
+            f"отправлено {len(bot.sent):,} напоминаний"
+        )
+        print(
+            f"reminders: до срока {len(before):,} (ожидалось не меньше {expected_before:,}, "
+            f"повторов {sum(before.values()) - len(before)}), о просрочке — всем {len(overdue):,}; "
+            f"отправлено относительно срока: min={min(lateness):.0f} s p50={percentile(lateness, 50):.0f} s "
+            f"max={max(lateness):.0f} s (виртуальных, раньше допустимо на {REMINDER_SLACK} s); "
+            f"{'OK' if ok else 'FAIL'}"
+        )
+        polls = days * day / args.poll_every
+        print(
+            f"reminders: пробуждений {scheduler.wakeups:,}, пачек {scheduler.batches:,}, "
+            f"чтений БД {database.reads:,}; опрос таблицы раз в {args.poll_every} s — это "
+            f"{polls:,.0f} запросов по {scan * 1000:.1f} ms = {polls * scan:,.0f} s процессора"
+        )
+        if not ok:
+            raise SystemExit("FAIL")
+
+    asyncio.run(run())
+
+    loans, hours = 10, 1
+    logging.disable(logging.WARNING)
+    try:
+        attempts, reads = asyncio.run(outage(loans, hours))
+    finally:
+        logging.disable(logging.NOTSET)
+    # Попытка сразу и по одной на каждый интервал повтора
+    limit = loans * (hours * 3600 // (REMINDER_SLACK + RETRY_DELAY) + 1)
+    ok = attempts <= limit
+    print(
+        f"reminders: сеть недоступна {hours} ч, {loans} просроченных выдач — "
+        f"{attempts} попыток (не больше {limit}), чтений БД {reads}; {'OK' if ok else 'FAIL'}"
+    )
+    if not ok:
+        raise SystemExit("FAIL")
+
+
+def add_parser(sub):
+    reminders = sub.add_parser("reminders", help="напоминания о сроке, виртуальные часы")
+    reminders.add_argument("--loans", type=int, default=100_000)
+    reminders.add_argument("--rate", type=float, default=10.0, help="напоминаний в секунду")
+    reminders.add_argument("--poll-every", type=int, default=60, help="для сравнения, секунды")
+    reminders.set_defaults(func=bench_reminders)
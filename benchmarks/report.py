@@ -0,0 +1,226 @@
+"""
+Отчёт администратора по большой истории выдач, пик памяти (python bench.py report).
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+from db import LOAN_DAYS
+
+from benchmarks.common import BENCH, create_catalogue, measure_loop_lag, peak_rss_mib, percentile
+
+
+# Запросы отчёта, которые не должны читать таблицу выдач целиком
+REPORT_PLANS = {
+    "сводка": (
+        "SELECT COUNT(*), SUM(due_at < 0), COUNT(DISTINCT user_id) "
+        "FROM loans INDEXED BY idx_loans_open WHERE returned_at IS NULL"
+    ),
+    "популярные": "SELECT book_id, COUNT(*) AS loans FROM loans GROUP BY book_id",
+    "читатели": (
+        "SELECT user_id, COUNT(*) FROM loans INDEXED BY idx_loans_open "
+        "WHERE returned_at IS NULL GROUP BY user_id"
+    ),
+    "история": "SELECT * FROM loans WHERE loans.id > 0 ORDER BY loans.id LIMIT 10",
+}
+
+
+def fill_loan_history(path, loans, books, users, open_share, now):
+    """
+    Заливает users читателей и loans выдач: самые свежие open_share книг
+    на руках, остальные выдачи закрыты.
+    """
+    day = 86400
+    rng = random.Random(0)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA synchronous = OFF")
+    with conn:
+        conn.executemany(
+            "INSERT INTO users (user_id, name, surname, password) VALUES (?, ?, ?, 'x')",
+            ((u, f"Имя{u}", f"Фамилия{u}") for u in range(users)),
+        )
+        # Популярность книг неравномерная: малые номера берут чаще
+        weights = list(itertools.accumulate(1 / (i + 10) for i in range(books)))
+        closed = loans - int(books * open_share)
+        start = now - 3 * 365 * day
+
+        def closed_loans():
+            for i in range(closed):
+                borrowed_at = start + i * (now - start - 30 * day) // closed
+                returned_at = borrowed_at + rng.randrange(1, 30 * day)
+                book_id = rng.choices(range(1, books + 1), cum_weights=weights)[0]
+                yield (rng.randrange(users), book_id, borrowed_at,
+                       borrowed_at + LOAN_DAYS * day, returned_at)
+
+        conn.executemany(
+            "INSERT INTO loans (user_id, book_id, borrowed_at, due_at, returned_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            closed_loans(),
+        )
+        conn.executemany(
+            "INSERT INTO loans (user_id, book_id, borrowed_at, due_at) VALUES (?, ?, ?, ?)",
+            (
+                (rng.randrange(users), book_id, borrowed_at, borrowed_at + LOAN_DAYS * day)
+                for book_id in range(1, int(books * open_share) + 1)
+                for borrowed_at in (now - rng.randrange(60 * day),)
+            ),
+        )
+        conn.execute("UPDATE books SET available = 0, borrower = 'x' WHERE id <= ?",
+                     (int(books * open_share),))
+    conn.close()
+
+
+async def build_report(path, fmt, directory, xlsx_rows):
+    from reports import ReportExporter
+
+    # Пока строится отчёт, цикл событий должен откликаться как обычно
+    lags = []
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(lags, stop))
+    exporter = ReportExporter(path, xlsx_history_rows=xlsx_rows)
+    started = time.perf_counter()
+    report_path = await exporter.export(fmt, directory)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await lag_task
+    exporter.close()
+    size = os.path.getsize(report_path)
+    history = None
+    if fmt == "csv":
+        import zipfile
+
+        with zipfile.ZipFile(report_path) as archive, archive.open("Выдачи.csv") as f:
+            history = sum(1 for _ in f) - 1
+    os.remove(report_path)
+    return {
+        "rows": exporter.rows,
+        "history": history,
+        "seconds": elapsed,
+        "size_mib": size / 2**20,
+        "peak_rss_mib": peak_rss_mib(),
+        "loop_lag_p99_ms": percentile(lags, 99) * 1000,
+        "loop_lag_max_ms": max(lags, default=0) * 1000,
+    }
+
+
+def naive_report(path):
+    # Для сравнения: вся история одним fetchall, как сделал бы простой отчёт
+    conn = sqlite3.connect(path)
+    started = time.perf_counter()
+    rows = conn.execute(
+        """
+        SELECT loans.id, books.title, users.name || ' ' || users.surname,
+               loans.borrowed_at, loans.due_at, loans.returned_at
+        FROM loans
+        JOIN books ON books.id = loans.book_id
+        LEFT JOIN users ON users.user_id = loans.user_id
+        """
+    ).fetchall()
+    elapsed = time.perf_counter() - started
+    conn.close()
+    return {"rows": len(rows), "seconds": elapsed, "peak_rss_mib": peak_rss_mib()}
+
+
+def bench_report(args):
+    if args.only:
+        # Дочерний процесс: один отчёт по готовой базе, результат — JSON в stdout
+        if args.only == "naive":
+            result = naive_report(args.path)
+        else:
+            result = asyncio.run(
+                build_report(args.path, args.only, os.path.dirname(args.path), args.xlsx_rows)
+            )
+        print(json.dumps(result))
+        return
+
+    now = int(time.time())
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        path = os.path.join(directory, "report.sqlite3")
+        started = time.perf_counter()
+        asyncio.run(create_catalogue(path, args.books))
+        fill_loan_history(path, args.loans, args.books, args.users, args.open_share, now)
+        print(
+            f"report: {args.loans:,} выдач, {args.books:,} книг, {args.users:,} читателей "
+            f"залиты за {time.perf_counter() - started:.0f} s"
+        )
+
+        ok = True
+        conn = sqlite3.connect(path)
+        for name, sql in REPORT_PLANS.items():
+            plan = " / ".join(row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}"))
+            # Проход по индексу допустим: idx_loans_open содержит только открытые
+            # выдачи, idx_loans_book покрывает подсчёт; таблицу читает только история
+            full_scan = "SCAN loans" in plan and "SCAN loans USING" not in plan
+            ok = ok and not full_scan
+            print(f"  {name:<11} {plan}{'  ПОЛНЫЙ ПРОХОД' if full_scan else ''}")
+        (open_loans,) = conn.execute(
+            "SELECT COUNT(*) FROM loans WHERE returned_at IS NULL"
+        ).fetchone()
+        (readers,) = conn.execute(
+            "SELECT COUNT(DISTINCT user_id) FROM loans WHERE returned_at IS NULL"
+        ).fetchone()
+        conn.close()
+        tables = 9 + min(100, args.books) + readers
+
+        for fmt in args.formats.split(","):
+            # Каждый отчёт — в своём процессе, чтобы пик RSS был только его
+            output = subprocess.run(
+                [
+                    sys.executable, BENCH, "report", "--only", fmt,
+                    "--path", path, "--xlsx-rows", str(args.xlsx_rows),
+                ],
+                check=True, stdout=subprocess.PIPE, text=True,
+            ).stdout
+            result = json.loads(output.splitlines()[-1])
+            if fmt == "naive":
+                print(
+                    f"report[naive] fetchall {result['rows']:,} строк за "
+                    f"{result['seconds']:.1f} s, пик RSS {result['peak_rss_mib']:.0f} MiB"
+                )
+                continue
+            history = args.loans if fmt == "csv" else min(args.loans, args.xlsx_rows)
+            complete = result["rows"] == tables + history
+            if fmt == "csv":
+                complete = complete and result["history"] == args.loans
+            within = result["peak_rss_mib"] <= args.ceiling
+            ok = ok and complete and within
+            print(
+                f"report[{fmt:<4}] {result['rows']:,} строк за {result['seconds']:.1f} s "
+                f"({result['rows'] / result['seconds']:,.0f} строк/s), файл "
+                f"{result['size_mib']:.0f} MiB, пик RSS {result['peak_rss_mib']:.0f} MiB "
+                f"(потолок {args.ceiling} MiB{'' if within else ' ПРЕВЫШЕН'}); лаг цикла "
+                f"p99={result['loop_lag_p99_ms']:.1f} ms, max={result['loop_lag_max_ms']:.1f} ms; "
+                f"строк {'сходится' if complete else 'НЕ сходится'} "
+                f"(история {history:,}, на руках {open_loans:,})"
+            )
+    if not ok:
+        raise SystemExit("FAIL")
+    print("OK")
+
+
+##############################################################################
+# Точка входа
+##############################################################################
+
+
+def add_parser(sub):
+    reports = sub.add_parser("report", help="отчёт администратора по истории выдач, пик памяти")
+    reports.add_argument("--loans", type=int, default=5_000_000)
+    reports.add_argument("--books", type=int, default=100_000)
+    reports.add_argument("--users", type=int, default=50_000)
+    reports.add_argument("--open-share", type=float, default=0.3, help="доля книг на руках")
+    reports.add_argument("--formats", default="csv,xlsx", help="через запятую; naive — fetchall")
+    reports.add_argument("--xlsx-rows", type=int, default=1_048_575, help="истории в xlsx")
+    reports.add_argument("--ceiling", type=int, default=150, help="потолок пика RSS, MiB")
+    reports.add_argument("--only", choices=["csv", "xlsx", "naive"], help=argparse.SUPPRESS)
+    reports.add_argument("--path", help=argparse.SUPPRESS)
+    reports.set_defaults(func=bench_report)
@@ -0,0 +1,79 @@
+"""
+Полнотекстовый поиск и поиск с опечатками на большом каталоге (python bench.py search).
+"""
+
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from db import Database
+
+from benchmarks.common import create_catalogue, percentile, report, worded_books
+
+
+def make_typo(text, rng):
+    letters = [i for i, ch in enumerate(text) if ch.isalpha()]
+    i = rng.choice(letters)
+    return text[:i] + text[i + 1 :] if rng.random() < 0.5 else text[:i] + "а" + text[i:]
+
+
+# Цель по задержке поиска (p99). На синтетическом каталоге в 500 тысяч книг
+# её не достигает ни один вид запросов: BM25 считается для всех совпадений,
+# а у частого слова или короткого префикса их десятки тысяч
+SEARCH_TARGET = 0.010
+
+
+async def run_search(path, count, requests):
+    started = time.perf_counter()
+    await create_catalogue(path, count, worded_books(count))
+    print(f"каталог {count:,} книг создан за {time.perf_counter() - started:.1f} s")
+
+    conn = sqlite3.connect(path)
+    sample = [row[0] for row in conn.execute(
+        "SELECT title FROM books ORDER BY random() LIMIT ?", (requests,)
+    )]
+    conn.close()
+
+    rng = random.Random(1)
+    kinds = {
+        "lowercase": lambda title: title.lower(),
+        "prefix": lambda title: " ".join(w[:4] for w in title.split()[:2]),
+        "typo": lambda title: make_typo(title.rsplit(" (", 1)[0], rng),
+    }
+
+    database = Database(path)
+    await database.connect()
+    for kind, make_query in kinds.items():
+        latencies = []
+        found = 0
+        started = time.perf_counter()
+        for title in sample:
+            query = make_query(title)
+            query_started = time.perf_counter()
+            rows = await database.search_books(query)
+            latencies.append(time.perf_counter() - query_started)
+            found += bool(rows)
+        report(f"search[{kind}]", latencies, time.perf_counter() - started)
+        p99 = percentile(latencies, 99)
+        print(
+            f"{'':<24} найдено для {found}/{len(sample)} запросов; p99 {p99 * 1000:.1f} ms — "
+            f"цель {SEARCH_TARGET * 1000:.0f} ms {'достигнута' if p99 <= SEARCH_TARGET else 'НЕ достигнута'}"
+        )
+    await database.close()
+
+
+def bench_search(args):
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        asyncio.run(
+            run_search(os.path.join(directory, "search.sqlite3"), args.books, args.requests)
+        )
+
+
+def add_parser(sub):
+    search = sub.add_parser("search", help="FTS5 и исправление опечаток, задержка поиска")
+    search.add_argument("--books", type=int, default=500_000)
+    search.add_argument("--requests", type=int, default=500)
+    search.set_defaults(func=bench_search)
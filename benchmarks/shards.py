@@ -0,0 +1,129 @@
+"""
+Обработка в нескольких процессах, от 1 до 8 (python bench.py shards).
+"""
+
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+
+from db import Database
+
+from benchmarks.common import (
+    create_catalogue,
+    import_start,
+    make_fake_session,
+    report,
+    synthetic_updates,
+)
+
+
+# Кроме чтения — бронирование одной из нескольких книг: процессы спорят за запись
+SHARD_TEXTS = ["📚 Список книг", "📖 Взять книгу", "Книга {book}", "👤 Личный кабинет"]
+
+
+async def bench_shard_setup(path, send_delay, index):
+    """
+    setup для sharding.Shards: роутер start.py на своей базе и фальшивой сессии.
+    Проверяет, что обновления каждого пользователя идут по порядку.
+    """
+    from aiogram import Bot, Dispatcher
+
+    from storage import SQLiteStorage
+
+    database = Database(path)
+    await database.connect()
+    start = import_start(database)
+    dispatcher = Dispatcher(storage=SQLiteStorage(database))
+    dispatcher.include_router(start.router)
+    last_seen = {}
+    out_of_order = 0
+
+    @dispatcher.update.outer_middleware()
+    async def check_order(handler, event, data):
+        nonlocal out_of_order
+        user_id = event.message.from_user.id
+        out_of_order += last_seen.get(user_id, -1) > event.update_id
+        last_seen[user_id] = event.update_id
+        return await handler(event, data)
+
+    async def close():
+        await dispatcher.storage.close()
+        await database.close()
+        return out_of_order
+
+    return dispatcher, Bot("0:bench", session=make_fake_session(send_delay)), close
+
+
+def check_loans(path):
+    conn = sqlite3.connect(path)
+    taken = conn.execute("SELECT COUNT(*) FROM books WHERE NOT available").fetchone()[0]
+    (loans,) = conn.execute("SELECT COUNT(*) FROM loans WHERE returned_at IS NULL").fetchone()
+    per_book = conn.execute(
+        "SELECT MAX(n) FROM (SELECT COUNT(*) AS n FROM loans "
+        "WHERE returned_at IS NULL GROUP BY book_id)"
+    ).fetchone()[0]
+    conn.close()
+    return taken, loans, per_book or 0
+
+
+def bench_shards(args):
+    import functools
+
+    from sharding import Shards
+
+    async def run(path, workers, updates):
+        shards = Shards(workers, functools.partial(bench_shard_setup, path, args.send_delay))
+        await shards.start()
+        started = time.perf_counter()
+        for update in updates:
+            shards.submit(update)
+        reports = await shards.stop()
+        return time.perf_counter() - started, reports
+
+    ok = True
+    baseline = None
+    updates = list(synthetic_updates(args.updates, args.users, SHARD_TEXTS))
+    # Ускорение упирается в число ядер: процессы сверх него только делят их
+    print(f"shards: ядер {os.cpu_count()}, обновлений {len(updates):,}")
+    for workers in map(int, args.workers.split(",")):
+        with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+            path = os.path.join(directory, "shards.sqlite3")
+            asyncio.run(create_catalogue(path, args.books))
+            conn = sqlite3.connect(path)
+            with conn:
+                conn.executemany(
+                    "INSERT INTO users (user_id, name, surname, password) VALUES (?, ?, ?, 'pwd')",
+                    ((user_id, f"Имя{user_id}", f"Фамилия{user_id}") for user_id in range(args.users)),
+                )
+            conn.close()
+
+            elapsed, reports = asyncio.run(run(path, workers, updates))
+            rate = len(updates) / elapsed
+            baseline = baseline or rate
+            handled = sum(report[1] for report in reports)
+            out_of_order = sum(report[2] for report in reports)
+            taken, loans, per_book = check_loans(path)
+            consistent = (
+                handled == len(updates) and out_of_order == 0 and taken == loans and per_book <= 1
+            )
+            ok &= consistent
+            print(
+                f"shards[{workers}] {rate:8,.0f} обновлений/s (x{rate / baseline:.2f}), "
+                f"по процессам: {[report[1] for report in reports]}, не по порядку: "
+                f"{out_of_order}, занято книг: {taken}, открытых выдач: {loans}"
+            )
+
+    if not ok:
+        raise SystemExit("обновления потеряны, перепутаны или выдачи не сходятся с книгами")
+
+
+def add_parser(sub):
+    shards = sub.add_parser("shards", help="обработка обновлений в нескольких процессах")
+    shards.add_argument("--workers", default="1,2,4,8", help="через запятую")
+    shards.add_argument("--updates", type=int, default=8000)
+    shards.add_argument("--users", type=int, default=1000)
+    shards.add_argument("--books", type=int, default=10_000)
+    shards.add_argument("--send-delay", type=float, default=0.05, help="ответ API, секунд")
+    shards.set_defaults(func=bench_shards)
@@ -0,0 +1,179 @@
+"""
+Тысячи читателей в очередях на популярные книги (python bench.py waitlist).
+"""
+
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from db import Database
+
+from benchmarks.common import create_catalogue, report
+
+
+def bench_waitlist(args):
+    import db as db_module
+
+    async def contention(path):
+        database = Database(path)
+        await database.connect()
+        titles = {}
+        for book_id in range(1, args.hot + 1):
+            titles[book_id] = f"Книга {book_id - 1}"
+        # Первые hot пользователей держат по книге, остальные встают в очереди
+        holders = {}
+        for book_id, title in titles.items():
+            await database.borrow_book(book_id - 1, title)
+            holders[book_id] = book_id - 1
+        rng = random.Random(0)
+        joins = [
+            (user_id, book_id)
+            for user_id in range(args.hot, args.users)
+            for book_id in rng.sample(sorted(titles), min(args.queues, args.hot))
+        ]
+        rng.shuffle(joins)
+
+        queued = {book_id: [] for book_id in titles}
+        received = {book_id: [] for book_id in titles}
+        wakeups = {book_id: asyncio.Event() for book_id in titles}
+        join_latencies = []
+        return_latencies = []
+        joined_all = False
+        pending = iter(joins)
+
+        async def joiner():
+            for user_id, book_id in pending:
+                started = time.perf_counter()
+                title, place = await database.join_waitlist(user_id, book_id)
+                join_latencies.append(time.perf_counter() - started)
+                # Ответы приходят в порядке фиксации: это и есть порядок очереди
+                if place == 0:
+                    holders[book_id] = user_id
+                    wakeups[book_id].set()
+                elif place is not None:
+                    queued[book_id].append(user_id)
+
+        async def returner(book_id):
+            # Держатель книги сразу её возвращает, книга уходит следующему
+            while True:
+                holder = holders.get(book_id)
+                if holder is None:
+                    if joined_all:
+                        return
+                    wakeups[book_id].clear()
+                    await wakeups[book_id].wait()
+                    continue
+                started = time.perf_counter()
+                handoff = await database.return_book(holder, titles[book_id])
+                return_latencies.append(time.perf_counter() - started)
+                if handoff is None:
+                    raise SystemExit(f"FAIL: книги {book_id} не оказалось у {holder}")
+                next_user, _ = handoff
+                holders[book_id] = next_user
+                if next_user is not None:
+                    received[book_id].append(next_user)
+
+        started = time.perf_counter()
+        returners = [asyncio.create_task(returner(book_id)) for book_id in titles]
+        await asyncio.gather(*(joiner() for _ in range(args.concurrency)))
+        joined_all = True
+        for event in wakeups.values():
+            event.set()
+        await asyncio.gather(*returners)
+        elapsed = time.perf_counter() - started
+        await database.close()
+        return queued, received, join_latencies, return_latencies, elapsed
+
+    def depth_cost(path, depth, ops=2000):
+        """
+        Стоимость возврата с передачей книги при очереди длиной depth (без
+        fsync: меряются сами запросы). Вернувший книгу встаёт в конец (это
+        в замер не входит), так что длина очереди не меняется.
+        """
+        conn = sqlite3.connect(path, isolation_level=None)
+        conn.execute("BEGIN")
+        conn.execute("DELETE FROM waitlist")
+        conn.execute("UPDATE loans SET returned_at = 0 WHERE returned_at IS NULL")
+        conn.execute("UPDATE books SET available = 1, borrower = NULL")
+        book_id = 1
+        db_module._join_waitlist(conn, 0, book_id)
+        for user_id in range(1, depth + 1):
+            db_module._join_waitlist(conn, user_id, book_id)
+        holder = 0
+        title = conn.execute("SELECT title FROM books WHERE id = ?", (book_id,)).fetchone()[0]
+        elapsed = 0.0
+        for _ in range(ops):
+            started = time.perf_counter()
+            _, (next_user, _, _) = db_module._return_book(conn, holder, title)
+            elapsed += time.perf_counter() - started
+            db_module._join_waitlist(conn, holder, book_id)
+            holder = next_user
+        elapsed /= ops
+        conn.execute("ROLLBACK")
+        conn.close()
+        return elapsed
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        path = os.path.join(directory, "waitlist.sqlite3")
+        asyncio.run(create_catalogue(path, max(args.hot, 1000)))
+        conn = sqlite3.connect(path)
+        with conn:
+            conn.executemany(
+                "INSERT INTO users (user_id, name, surname, password) VALUES (?, ?, ?, 'x')",
+                ((u, f"Имя{u}", f"Фамилия{u}") for u in range(args.users)),
+            )
+        conn.close()
+
+        queued, received, join_latencies, return_latencies, elapsed = asyncio.run(
+            contention(path)
+        )
+
+        conn = sqlite3.connect(path)
+        waiting = conn.execute("SELECT COUNT(*) FROM waitlist").fetchone()[0]
+        open_loans = conn.execute(
+            "SELECT COUNT(*) FROM loans WHERE returned_at IS NULL"
+        ).fetchone()[0]
+        taken = conn.execute("SELECT COUNT(*) FROM books WHERE NOT available").fetchone()[0]
+        conn.close()
+
+        shallow = depth_cost(path, 10)
+        deep = depth_cost(path, args.users)
+
+    total_queued = sum(len(users) for users in queued.values())
+    handoffs = sum(len(users) for users in received.values())
+    # Каждый вставший в очередь получил книгу ровно один раз и в порядке очереди
+    fifo = all(received[book_id] == queued[book_id] for book_id in queued)
+    ok = fifo and waiting == 0 and open_loans == 0 and taken == 0
+    report("waitlist[join]", join_latencies, elapsed)
+    report("waitlist[return]", return_latencies, elapsed)
+    print(
+        f"waitlist: {args.users:,} пользователей, {args.hot} популярных книг; "
+        f"в очередь встали {total_queued:,} раз, передач книги {handoffs:,}; "
+        f"{(len(join_latencies) + len(return_latencies)) / elapsed:,.0f} операций/s"
+    )
+    print(
+        f"waitlist: порядок очереди {'соблюдён' if fifo else 'НАРУШЕН'}, "
+        f"после разбора: в очередях {waiting}, открытых выдач {open_loans}, занятых книг {taken}"
+    )
+    print(
+        f"waitlist: возврат с передачей при очереди 10 — {shallow * 1e6:.0f} µs, "
+        f"при {args.users:,} — {deep * 1e6:.0f} µs (запросы без fsync)"
+    )
+    if deep > 3 * shallow:
+        ok = False
+        print("waitlist: стоимость передачи растёт с длиной очереди")
+    if not ok:
+        raise SystemExit("FAIL")
+    print("OK")
+
+
+def add_parser(sub):
+    waitlist = sub.add_parser("waitlist", help="очереди на популярные книги, передача при возврате")
+    waitlist.add_argument("--users", type=int, default=5000)
+    waitlist.add_argument("--hot", type=int, default=20, help="популярных книг")
+    waitlist.add_argument("--queues", type=int, default=3, help="очередей на пользователя")
+    waitlist.add_argument("--concurrency", type=int, default=200)
+    waitlist.set_defaults(func=bench_waitlist)
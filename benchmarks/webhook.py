@@ -0,0 +1,133 @@
+"""
+Long polling против вебхука на синтетических обновлениях (python bench.py webhook).
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+
+from db import Database
+
+from benchmarks.common import (
+    counting_dispatcher,
+    create_catalogue,
+    make_fake_session,
+    synthetic_updates,
+)
+
+
+async def run_polling(dispatcher, updates, concurrency, send_delay, session_middleware=None):
+    from aiogram import Bot
+    from aiogram.types import Update
+
+    session = make_fake_session(send_delay)
+    if session_middleware is not None:
+        session.middleware(session_middleware)
+    session.pending = [Update.model_validate(update) for update in updates]
+    bot = Bot("0:bench", session=session)
+    dispatcher.processed, dispatcher.expected = 0, len(updates)
+    dispatcher.done.clear()
+
+    started = time.perf_counter()
+    polling = asyncio.create_task(
+        dispatcher.start_polling(
+            bot, handle_signals=False, close_bot_session=False,
+            tasks_concurrency_limit=concurrency,
+        )
+    )
+    await dispatcher.done.wait()
+    elapsed = time.perf_counter() - started
+    await dispatcher.stop_polling()
+    await polling
+    return elapsed
+
+
+async def run_webhook_load(dispatcher, updates, concurrency, send_delay, clients):
+    import aiohttp
+    from aiogram import Bot
+    from aiohttp import web
+
+    from webhook import create_app
+
+    secret = "bench-secret"
+    bot = Bot("0:bench", session=make_fake_session(send_delay))
+    app = create_app(
+        dispatcher, bot, "/webhook", secret, max_in_flight=concurrency, close_bot_session=False
+    )
+    runner = web.AppRunner(app, handle_signals=False)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    url = f"http://{host}:{port}/webhook"
+    dispatcher.processed, dispatcher.expected = 0, len(updates)
+    dispatcher.done.clear()
+
+    connector = aiohttp.TCPConnector(limit=clients)
+    async with aiohttp.ClientSession(connector=connector) as client:
+        async with client.post(url, json=updates[0]) as response:
+            rejected = response.status == 401
+
+        queue = iter(updates)
+        statuses = []
+
+        async def sender():
+            for update in queue:
+                async with client.post(
+                    url, json=update, headers={"X-Telegram-Bot-Api-Secret-Token": secret}
+                ) as response:
+                    statuses.append(response.status)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(sender() for _ in range(clients)))
+        accepted = time.perf_counter() - started
+        in_flight = app["webhook_handler"].in_flight
+        # Остановка сразу после последнего запроса: начатые обработчики должны доработать
+        await runner.cleanup()
+        elapsed = time.perf_counter() - started
+
+    ok = rejected and statuses.count(200) == len(updates) and dispatcher.processed == len(updates)
+    print(
+        f"{'':<24} запрос без токена отклонён: {rejected}; при остановке в работе "
+        f"{in_flight}, дообработано: {dispatcher.processed}/{len(updates)}; "
+        f"все запросы приняты за {accepted:.2f} s"
+    )
+    return elapsed, ok
+
+
+def bench_webhook(args):
+    async def run():
+        with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+            path = os.path.join(directory, "webhook.sqlite3")
+            await create_catalogue(path, args.books)
+            database = Database(path)
+            await database.connect()
+            for user_id in range(0, args.users, 2):
+                await database.create_user(user_id, f"Имя{user_id}", f"Фамилия{user_id}", "pwd")
+            dispatcher = counting_dispatcher(database)
+            updates = list(synthetic_updates(args.updates, args.users))
+
+            elapsed = await run_polling(dispatcher, updates, args.concurrency, args.send_delay)
+            print(f"webhook[polling]  {len(updates) / elapsed:8,.0f} обновлений/s")
+            elapsed, ok = await run_webhook_load(
+                dispatcher, updates, args.concurrency, args.send_delay, args.clients
+            )
+            print(f"webhook[вебхук]   {len(updates) / elapsed:8,.0f} обновлений/s")
+            await dispatcher.storage.close()
+            await database.close()
+        return ok
+
+    if not asyncio.run(run()):
+        raise SystemExit("вебхук потерял обновления или принял запрос без токена")
+
+
+def add_parser(sub):
+    webhook = sub.add_parser("webhook", help="polling и вебхук на синтетических обновлениях")
+    webhook.add_argument("--updates", type=int, default=5000)
+    webhook.add_argument("--users", type=int, default=1000)
+    webhook.add_argument("--books", type=int, default=10_000)
+    webhook.add_argument("--concurrency", type=int, default=100, help="обработчиков сразу")
+    webhook.add_argument("--clients", type=int, default=40, help="соединений к вебхуку")
+    webhook.add_argument("--send-delay", type=float, default=0.05, help="ответ API, секунд")
+    webhook.set_defaults(func=bench_webhook)
@@ -1,3 +1,6 @@
+import json
+import os
+
 books = {
     "Война и мир": {"author": "Лев Толстой", "available": True, "borrower": None},
     "Преступление и наказание": {"author": "Федор Достоевский", "available": True, "borrower": None},
@@ -43,13 +46,136 @@ books = {
     "Портрет Дориана Грея": {"author": "Оскар Уайльд", "available": True, "borrower": None},
     "Старик и море": {"author": "Эрнест Хемингуэй", "available": True, "borrower": None}
 }
+
+
+##############################################################################
+# Журнал изменений статусов
+#
+# Каждое изменение дописывается в books.journal строкой JSON с итоговым
+# состоянием книги, поэтому повторное применение записи ничего не портит.
+# fsync делается раз в JOURNAL_FSYNC_EVERY записей (и в flush_journal()):
+# падение процесса не теряет ничего, отключение питания — не больше этой пачки.
+# Раз в COMPACT_EVERY записей словарь целиком пишется в снимок через
+# временный файл и os.replace, после чего журнал обнуляется.
+# При импорте модуля статусы из снимка и журнала накладываются на словарь
+# books выше: книги, добавленные в него после снимка, не теряются.
+##############################################################################
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+JOURNAL_PATH = os.path.join(BASE_DIR, "books.journal")
+SNAPSHOT_PATH = os.path.join(BASE_DIR, "books.snapshot.json")
+
+JOURNAL_FSYNC_EVERY = 32
+COMPACT_EVERY = 10_000
+
+_journal = None
+_unsynced = 0
+_journal_entries = 0
+
+
+def _apply(title, borrower):
+    books[title]["available"] = borrower is None
+    books[title]["borrower"] = borrower
+
+
+def load_books():
+    """
+    Восстанавливает статусы books: снимок, затем записи журнала.
+    Оборванная последняя строка (падение посреди записи) отрезается от
+    журнала, иначе следующая запись дописалась бы к ней и тоже пропала.
+    """
+    global _journal_entries
+    if os.path.exists(SNAPSHOT_PATH):
+        with open(SNAPSHOT_PATH, encoding="utf-8") as f:
+            snapshot = json.load(f)
+        # Каталог — словарь выше, из снимка берутся только статусы
+        for title, book in snapshot.items():
+            if title in books:
+                _apply(title, book["borrower"])
+
+    _journal_entries = 0
+    if os.path.exists(JOURNAL_PATH):
+        with open(JOURNAL_PATH, "r+b") as f:
+            complete = 0
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                if entry["title"] in books:
+                    _apply(entry["title"], entry["borrower"])
+                _journal_entries += 1
+                complete += len(line)
+            if complete < f.seek(0, os.SEEK_END):
+                f.truncate(complete)
+                os.fsync(f.fileno())
+
+
 def update_book_status(title, borrower):
+    global _journal, _unsynced, _journal_entries
     if title in books:
-        books[title]["available"] = borrower is None
-        books[title]["borrower"] = borrower
+        _apply(title, borrower)
 
-        with open("books.py", "w", encoding="utf-8") as f:
-            f.write(f"books = {books}\n")
+        if _journal is None:
+            _journal = open(JOURNAL_PATH, "a", encoding="utf-8")
+        entry = json.dumps({"title": title, "borrower": borrower}, ensure_ascii=False)
+        _journal.write(entry + "\n")
+        _journal.flush()
+        _unsynced += 1
+        _journal_entries += 1
+        if _unsynced >= JOURNAL_FSYNC_EVERY:
+            flush_journal()
+        if _journal_entries >= COMPACT_EVERY:
+            compact()
 
         return True
-    return False
\ No newline at end of file
+    return False
+
+
+def flush_journal():
+    """
+    Гарантирует, что все записанные изменения на диске.
+    """
+    global _unsynced
+    if _journal is not None and _unsynced:
+        os.fsync(_journal.fileno())
+    _unsynced = 0
+
+
+def compact():
+    """
+    Пишет снимок books атомарно (временный файл + os.replace) и обнуляет журнал.
+    Если процесс упадёт между заменой снимка и обнулением, журнал просто
+    проиграется поверх нового снимка ещё раз.
+    """
+    global _journal, _unsynced, _journal_entries
+    tmp_path = SNAPSHOT_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(books, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, SNAPSHOT_PATH)
+    _fsync_dir(BASE_DIR)
+
+    if _journal is not None:
+        _journal.close()
+    _journal = open(JOURNAL_PATH, "w", encoding="utf-8")
+    os.fsync(_journal.fileno())
+    _unsynced = 0
+    _journal_entries = 0
+
+
+def _fsync_dir(path):
+    # Переименование становится надёжным только после fsync каталога
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+load_books()
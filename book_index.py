@@ -0,0 +1,175 @@
+"""
+Каталог книг в памяти процесса.
+
+Название и автор почти не меняются, часто меняется только то, свободна ли
+книга. BookIndex загружается из таблицы books при старте (см.
+Database.connect) и отвечает на поиск по названию, листание каталога и
+«сколько книг свободно» без обращения к базе:
+
+- названия и авторы — два списка по id, без объекта на книгу;
+- поиск по названию — отсортированный массив хешей нормализованных
+  названий (без учёта регистра, «ё» и лишних пробелов) и параллельный
+  массив id: 16 байт на книгу вместо словарей «название -> книга»,
+  бинарный поиск вместо хеш-таблицы. Совпадение проверяется по самому
+  названию, точное предпочитается нормализованному;
+- доступность — битовая карта в bytearray, бит на книгу, плюс счётчик
+  свободных книг; имена взявших хранятся только для занятых книг.
+
+Авторы повторяются, поэтому интернируются: одна строка на автора вместо
+строки на каждую книгу. Названия уникальны, их интернирование только
+раздуло бы таблицу интернированных строк.
+
+Database обновляет карту при каждой выдаче и возврате. Выдачи в других
+процессах (WORKERS > 1) сюда не попадают, поэтому каталог в памяти
+включается только для одного процесса. Книги, добавленные importer.py,
+бот подхватывает при первом же промахе: если книги нет в каталоге (или
+листание дошло до его конца), MAX(id) таблицы books сверяется с каталогом,
+и тот перечитывается (Database.refresh_book_index). Нового автора у уже
+известной книги импорт не добавляет в каталог до перезапуска.
+"""
+
+import sys
+from array import array
+from bisect import bisect_left
+
+
+def normalize_title(title: str) -> str:
+    return " ".join(title.lower().replace("ё", "е").split())
+
+
+class BookIndex:
+    def __init__(self):
+        # Название и автор книги с id = i — в _titles[i] и _authors[i];
+        # на месте удалённых — None
+        self._titles = []
+        self._authors = []
+        # Хеши нормализованных названий по возрастанию и id книг в том же порядке
+        self._keys = array("q")
+        self._ids = array("q")
+        self._count = 0
+        self._available = bytearray()
+        self._borrowers = {}
+        self.available_count = 0
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def max_id(self) -> int:
+        return max(len(self._titles) - 1, 0)
+
+    def load(self, rows):
+        """
+        Заполняет пустой каталог строками (id, title, author, available, borrower)
+        в порядке возрастания id.
+        """
+        titles = self._titles
+        authors = self._authors
+        keys = []
+        for book_id, title, author, available, borrower in rows:
+            if book_id >= len(titles):
+                titles.extend([None] * (book_id + 1 - len(titles)))
+                authors.extend([None] * (book_id + 1 - len(authors)))
+            titles[book_id] = title
+            authors[book_id] = sys.intern(author) if author else author
+            keys.append((hash(normalize_title(title)), book_id))
+            if not available:
+                self._borrowers[book_id] = borrower
+        keys.sort()
+        self._keys = array("q", (key for key, _ in keys))
+        self._ids = array("q", (book_id for _, book_id in keys))
+        self._count = len(keys)
+        self._available = bytearray((len(titles) + 7) // 8)
+        for book_id, title in enumerate(titles):
+            if title is not None and book_id not in self._borrowers:
+                self._available[book_id >> 3] |= 1 << (book_id & 7)
+        self.available_count = self._count - len(self._borrowers)
+
+    def replace(self, other: "BookIndex"):
+        """
+        Подменяет содержимое каталогом, загруженным заново (после импорта).
+        """
+        self._titles = other._titles
+        self._authors = other._authors
+        self._keys = other._keys
+        self._ids = other._ids
+        self._count = other._count
+        self._available = other._available
+        self._borrowers = other._borrowers
+        self.available_count = other.available_count
+
+    def is_available(self, book_id: int) -> bool:
+        return bool(self._available[book_id >> 3] & (1 << (book_id & 7)))
+
+    def set_borrower(self, book_id: int, borrower):
+        """
+        Книгу взял borrower; None — книга снова свободна.
+        """
+        if book_id >= len(self._titles) or self._titles[book_id] is None:
+            return
+        was_available = self.is_available(book_id)
+        if borrower is None:
+            self._borrowers.pop(book_id, None)
+            self._available[book_id >> 3] |= 1 << (book_id & 7)
+            self.available_count += not was_available
+        else:
+            self._borrowers[book_id] = borrower
+            self._available[book_id >> 3] &= ~(1 << (book_id & 7)) & 0xFF
+            self.available_count -= was_available
+
+    def _row(self, book_id: int):
+        available = self.is_available(book_id)
+        borrower = None if available else self._borrowers.get(book_id)
+        return self._titles[book_id], self._authors[book_id], available, borrower
+
+    def find(self, title: str):
+        """
+        Как Database.find_book: (title, author, available, borrower) или None.
+        Название, которого нет дословно, ищется без учёта регистра, «ё» и пробелов.
+        """
+        book_id = self.find_id(title)
+        return self._row(book_id) if book_id is not None else None
+
+    def find_id(self, title: str):
+        """
+        id книги или None; название сравнивается так же, как в find.
+        """
+        normalized = normalize_title(title)
+        key = hash(normalized)
+        keys = self._keys
+        found = None
+        # Одинаковый хеш — у названий, равных после нормализации, и у редких коллизий
+        for i in range(bisect_left(keys, key), len(keys)):
+            if keys[i] != key:
+                break
+            book_id = self._ids[i]
+            candidate = self._titles[book_id]
+            if candidate == title:
+                return book_id
+            if found is None and normalize_title(candidate) == normalized:
+                found = book_id
+        return found
+
+    def page(self, cursor: int, limit: int, backward: bool = False):
+        """
+        Как Database.get_books_page: (rows, has_more), rows — кортежи
+        (id, title, author, available, borrower) по возрастанию id.
+        """
+        titles = self._titles
+        if backward:
+            ids = range(min(cursor, len(titles)) - 1, 0, -1)
+        else:
+            ids = range(max(cursor + 1, 1), len(titles))
+        rows = []
+        for book_id in ids:
+            if titles[book_id] is None:
+                continue
+            if len(rows) == limit:
+                break
+            rows.append((book_id, *self._row(book_id)))
+        else:
+            return (rows[::-1] if backward else rows), False
+        return (rows[::-1] if backward else rows), True
+
+    def stats(self) -> dict:
+        return {"books": self._count, "available": self.available_count}
@@ -0,0 +1,74 @@
+"""
+Роутер, который находит хендлер кнопки по точному тексту сообщения.
+
+Обычный роутер aiogram перебирает хендлеры по порядку и у каждого проверяет
+фильтры, так что нажатие последней из N кнопок стоит N проверок F.text == ...
+ButtonRouter держит кнопки и команды в словаре «текст -> хендлер»: поиск
+занимает одно обращение к словарю при любом их числе. Если текст не кнопка,
+сообщение идёт к обычным хендлерам (состояния FSM и т.п.) как раньше.
+
+Кнопка срабатывает в любом состоянии FSM: нажатие меню посреди регистрации
+открывает меню, а не записывается в поле анкеты. Начатый сценарий при этом
+сбрасывается (состояние и его данные), иначе следующее сообщение ушло бы
+в поле анкеты, о которой пользователь уже забыл.
+"""
+
+from typing import Any
+
+from aiogram import Router
+from aiogram.dispatcher.event.bases import SkipHandler
+from aiogram.dispatcher.event.handler import FilterObject, HandlerObject
+from aiogram.dispatcher.event.telegram import TelegramEventObserver
+from aiogram.types import TelegramObject
+
+
+class ButtonObserver(TelegramEventObserver):
+    def __init__(self, router: Router, event_name: str):
+        super().__init__(router=router, event_name=event_name)
+        self.buttons: dict[str, HandlerObject] = {}
+
+    def button(self, *texts: str, filters=(), flags: dict[str, Any] | None = None):
+        """
+        Декоратор: хендлер для сообщений, текст которых в точности один из texts.
+        filters проверяются уже после того, как хендлер найден.
+        """
+
+        def register(callback):
+            handler = HandlerObject(
+                callback=callback,
+                filters=[FilterObject(filter_) for filter_ in filters],
+                flags=flags or {},
+            )
+            for text in texts:
+                if text in self.buttons:
+                    raise ValueError(f"Кнопка {text!r} уже зарегистрирована")
+                self.buttons[text] = handler
+            return callback
+
+        return register
+
+    async def trigger(self, event: TelegramObject, **kwargs: Any) -> Any:
+        handler = self.buttons.get(getattr(event, "text", None))
+        if handler is not None:
+            kwargs["handler"] = handler
+            result, data = await handler.check(event, **kwargs)
+            if result:
+                kwargs.update(data)
+                # state и raw_state кладёт FSMContextMiddleware aiogram
+                if kwargs.get("raw_state") is not None:
+                    await kwargs["state"].clear()
+                    kwargs["raw_state"] = None
+                wrapped_inner = self.outer_middleware.wrap_middlewares(
+                    self._resolve_middlewares(), handler.call
+                )
+                try:
+                    return await wrapped_inner(event, kwargs)
+                except SkipHandler:
+                    pass
+        return await super().trigger(event, **kwargs)
+
+
+class ButtonRouter(Router):
+    def __init__(self, *, name: str | None = None):
+        super().__init__(name=name)
+        self.message = self.observers["message"] = ButtonObserver(self, "message")
@@ -0,0 +1,127 @@
+"""
+Ограниченный LRU-кеш с временем жизни записей (TTL) и счётчиками.
+
+Используется только из цикла событий, поэтому блокировок не требует.
+"""
+
+import time
+from collections import OrderedDict
+
+# Значение-маркер «в кеше нет», чтобы можно было кешировать и None
+MISSING = object()
+
+
+class LRUCache:
+    def __init__(self, maxsize: int = 10_000, ttl: float = 300.0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data = OrderedDict()
+        # Растёт при каждой инвалидации; см. put()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """
+        Возвращает значение или MISSING, если его нет или оно устарело.
+        """
+        item = self._data.get(key, MISSING)
+        if item is MISSING:
+            self.misses += 1
+            return MISSING
+        expires_at, value = item
+        if expires_at <= self._clock():
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return MISSING
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value, generation=None):
+        """
+        Кладёт значение в кеш. Если передан generation, взятый до чтения из БД,
+        и с тех пор была инвалидация, значение могло устареть и не кешируется.
+        """
+        if self.maxsize <= 0:
+            return
+        if generation is not None and generation != self.generation:
+            return
+        self._data[key] = (self._clock() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key):
+        self.generation += 1
+        self._data.pop(key, None)
+
+    def clear(self):
+        self.generation += 1
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class CatalogueVersions:
+    """
+    Версии каталога по группам книг (id // bucket_size).
+
+    Изменение книги отмечает только её группу, поэтому закешированные страницы
+    с другими книгами остаются действительными. bump_all() нужен, когда меняется
+    состав каталога (книги добавлены или удалены).
+    """
+
+    def __init__(self, bucket_size: int = 64):
+        self.bucket_size = bucket_size
+        # Общий счётчик изменений; группа помнит его значение при своём последнем изменении
+        self.version = 0
+        self._all_changed_at = 0
+        self._buckets = {}
+
+    def bump(self, book_id: int):
+        self.version += 1
+        self._buckets[book_id // self.bucket_size] = self.version
+
+    def bump_all(self):
+        self.version += 1
+        self._all_changed_at = self.version
+
+    def snapshot(self, book_ids, since: int):
+        """
+        Снимок версий групп, в которые входят book_ids, для is_current().
+        since — значение version до чтения страницы из БД; если с тех пор её
+        группы менялись, прочитанное могло устареть, и возвращается None.
+        """
+        if self._all_changed_at > since:
+            return None
+        buckets = {}
+        for book_id in book_ids:
+            bucket = book_id // self.bucket_size
+            changed_at = self._buckets.get(bucket, 0)
+            if changed_at > since:
+                return None
+            buckets[bucket] = changed_at
+        return self._all_changed_at, buckets
+
+    def is_current(self, snapshot) -> bool:
+        all_changed_at, buckets = snapshot
+        return all_changed_at == self._all_changed_at and all(
+            self._buckets.get(bucket, 0) == changed_at
+            for bucket, changed_at in buckets.items()
+        )
@@ -1,6 +1,38 @@
 from dotenv import load_dotenv
 import os
+import secrets
 
 load_dotenv()
 
-API_TOKEN = os.getenv("API_TOKEN")
\ No newline at end of file
+API_TOKEN = os.getenv("API_TOKEN")
+
+# Вебхук: если WEBHOOK_URL не задан, бот работает через long polling
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+# Секретный токен вебхука: без него поддельные обновления мог бы прислать
+# любой, кто узнал адрес. Не задан — генерируется при запуске (вебхук
+# каждый раз регистрируется заново, уже с ним)
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or secrets.token_urlsafe(32)
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+
+# Сколько процессов обрабатывают обновления (см. sharding.py)
+WORKERS = int(os.getenv("WORKERS", "1"))
+
+# Метрики (Prometheus: /metrics, JSON: /metrics.json); порт 0 — не поднимать.
+# Процессы-обработчики слушают следующие порты: METRICS_PORT + 1 + номер
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+
+# Хеширование паролей (см. passwords.py): параметры scrypt и число потоков
+PASSWORD_SCRYPT_N = int(os.getenv("PASSWORD_SCRYPT_N", str(2**14)))
+PASSWORD_SCRYPT_R = int(os.getenv("PASSWORD_SCRYPT_R", "8"))
+PASSWORD_SCRYPT_P = int(os.getenv("PASSWORD_SCRYPT_P", "1"))
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", str(os.cpu_count() or 1)))
+
+# Каталог книг в памяти (см. book_index.py): поиск по названию, листание и
+# число свободных книг без запросов к базе. Работает только при WORKERS = 1
+BOOK_INDEX = os.getenv("BOOK_INDEX", "1") == "1"
+
+# Администраторы (user_id через запятую): им доступен /report (см. reports.py)
+ADMIN_IDS = {int(user_id) for user_id in os.getenv("ADMIN_IDS", "").replace(",", " ").split()}
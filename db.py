@@ -0,0 +1,1447 @@
+"""
+Асинхронный слой работы с базой данных SQLite.
+
+Все запросы выполняются вне цикла событий: запись идёт через единственный
+поток-писатель (SQLite всё равно допускает только одного писателя), чтение —
+через небольшой пул потоков, у каждого из которых своё соединение.
+Хендлеры просто делают `await db.<метод>(...)` и не блокируют других
+пользователей, пока идёт медленный запрос или commit.
+
+Поток-писатель склеивает изменения в одну транзакцию (групповой коммит):
+пачка — всё, что накопилось в очереди, пока шёл предыдущий COMMIT (не
+больше `batch_size` операций). Одиночная запись фиксируется сразу, а под
+нагрузкой вместо fsync на каждый UPDATE получается один fsync на пачку.
+Упавшая операция откатывается одна (см. _commit_batch), остальные операции
+пачки сохраняются, а `await` возвращается только после COMMIT, т.е. когда
+запись уже на диске.
+"""
+
+import asyncio
+import difflib
+import itertools
+import logging
+import queue
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from book_index import normalize_title
+from cache import MISSING, CatalogueVersions, LRUCache
+
+DB_PATH = "database.sqlite3"
+
+# Срок, на который выдаётся книга
+LOAN_DAYS = 14
+
+# За сколько секунд до срока возврата напоминать о нём (см. reminders.py)
+REMIND_BEFORE = 86400
+
+# Насколько название должно быть похоже на запрос с опечаткой (0..1)
+TYPO_THRESHOLD = 0.6
+
+# Размер отображения файла БД в память и кеша страниц на соединение
+MMAP_SIZE = 256 * 1024 * 1024
+CACHE_SIZE_KIB = 32 * 1024
+
+# Сколько операций, накопившихся за время коммита, брать в одну транзакцию
+BATCH_SIZE = 256
+
+# Сколько раз повторять BEGIN, если другой процесс держит запись дольше busy_timeout
+BUSY_RETRIES = 3
+
+# Сколько строк импорта отправлять в одном executemany
+IMPORT_CHUNK_SIZE = 10_000
+
+# Кеш записей пользователей и их выдач: сколько держать и как долго
+USER_CACHE_SIZE = 10_000
+USER_CACHE_TTL = 300.0
+
+
+class Database:
+    def __init__(
+        self,
+        path: str = DB_PATH,
+        readers: int = 4,
+        batch_size: int = BATCH_SIZE,
+        user_cache_size: int = USER_CACHE_SIZE,
+        user_cache_ttl: float = USER_CACHE_TTL,
+        metrics=None,
+        book_index=None,
+    ):
+        self.path = path
+        # metrics.Metrics: время каждого SQL-запроса и ожидания базы на обновление
+        self.metrics = metrics
+        self.batch_size = batch_size
+        # Кеши живут в цикле событий; запись в БД сбрасывает затронутые ключи
+        self.users_cache = LRUCache(user_cache_size, user_cache_ttl)
+        self.loans_cache = LRUCache(user_cache_size, user_cache_ttl)
+        # Версии каталога для кеша отрисованных страниц списка книг
+        self.catalogue = CatalogueVersions()
+        # book_index.BookIndex: каталог в памяти, загружается в connect()
+        self.book_index = book_index
+        # Выдачи и возвраты, случившиеся, пока каталог перечитывается
+        self._index_changes = None
+        # Одновременные промахи мимо каталога перечитывают его один раз
+        self._index_refresh = asyncio.Lock()
+        self._readers = ThreadPoolExecutor(
+            max_workers=readers, thread_name_prefix="db-reader"
+        )
+        self._queue = queue.Queue()
+        self._writer = None
+        self._local = threading.local()
+        self._reader_conns = []
+        self._lock = threading.Lock()
+
+    ##########################################################################
+    # Служебные методы
+    ##########################################################################
+
+    def _open(self) -> sqlite3.Connection:
+        # isolation_level=None: транзакциями управляем сами (BEGIN/COMMIT)
+        if self.metrics is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        else:
+            from metrics import TimedConnection
+
+            conn = sqlite3.connect(
+                self.path,
+                check_same_thread=False,
+                isolation_level=None,
+                factory=TimedConnection,
+            )
+            conn.metrics = self.metrics
+        # WAL позволяет читателям работать параллельно с писателем,
+        # synchronous=FULL сохраняет прежнюю гарантию долговечности.
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=FULL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        # Чтение индексов (в том числе полнотекстового) через mmap и больший
+        # кеш страниц: меньше системных вызовов на каждый запрос
+        conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB}")
+        return conn
+
+    def _reader_conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+            with self._lock:
+                self._reader_conns.append(conn)
+        return conn
+
+    async def _read(self, func, *args):
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            return await loop.run_in_executor(
+                self._readers, lambda: func(self._reader_conn(), *args)
+            )
+        finally:
+            if self.metrics is not None:
+                self.metrics.observe_db_wait(time.perf_counter() - started)
+
+    async def _write(self, func, *args):
+        """
+        Ставит изменение в очередь писателя и ждёт, пока его транзакция
+        будет зафиксирована.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        started = time.perf_counter()
+        self._queue.put((func, args, loop, future))
+        try:
+            return await future
+        finally:
+            if self.metrics is not None:
+                self.metrics.observe_db_wait(time.perf_counter() - started)
+
+    def _writer_loop(self, conn: sqlite3.Connection):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            # Новую пачку никто не ждёт: берётся то, что уже в очереди. Пока
+            # идёт COMMIT (fsync), очередь наполняется сама
+            batch = [item]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._commit_batch(conn, batch)
+            if stop:
+                break
+        conn.close()
+
+    def _commit_batch(self, conn: sqlite3.Connection, batch):
+        # Точка сохранения на каждую операцию заметно дороже самой выдачи, а
+        # ошибки редки: пачка сначала выполняется без них. Если операция
+        # упала, пачка откатывается и повторяется уже с точками сохранения
+        results = self._run_batch(conn, batch, savepoints=False)
+        if results is None:
+            results = self._run_batch(conn, batch, savepoints=True)
+
+        # Один вызов call_soon_threadsafe на цикл событий, а не на операцию:
+        # каждый такой вызов будит цикл записью в его сокет
+        by_loop = {}
+        for (_, _, loop, future), (ok, value) in zip(batch, results):
+            by_loop.setdefault(loop, []).append((future, ok, value))
+        for loop, resolved in by_loop.items():
+            loop.call_soon_threadsafe(_resolve_all, resolved)
+
+    def _run_batch(self, conn: sqlite3.Connection, batch, savepoints: bool):
+        """
+        Выполняет пачку одной транзакцией. Без точек сохранения возвращает
+        None, если одна из нескольких операций упала (пачка уже откачена).
+        """
+        results = []
+        try:
+            _begin(conn)
+            for func, args, _, _ in batch:
+                if not savepoints:
+                    try:
+                        results.append((True, func(conn, *args)))
+                    except Exception as exc:
+                        if conn.in_transaction:
+                            conn.execute("ROLLBACK")
+                        return [(False, exc)] if len(batch) == 1 else None
+                    continue
+                conn.execute("SAVEPOINT op")
+                try:
+                    result = func(conn, *args)
+                except Exception as exc:
+                    conn.execute("ROLLBACK TO op")
+                    results.append((False, exc))
+                else:
+                    results.append((True, result))
+                conn.execute("RELEASE op")
+            conn.execute("COMMIT")
+        except Exception as exc:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            results = [(False, exc)] * len(batch)
+        return results
+
+    async def connect(self):
+        """
+        Запускаем поток-писатель и создаём таблицы, если их ещё нет.
+        """
+        loop = asyncio.get_running_loop()
+        conn = await loop.run_in_executor(self._readers, self._open)
+        self._writer = threading.Thread(
+            target=self._writer_loop, args=(conn,), name="db-writer", daemon=True
+        )
+        self._writer.start()
+        await self._write(_migrate)
+        await self._load_book_index()
+
+    async def close(self):
+        """
+        Дожидаемся записи всех поставленных в очередь изменений и закрываем соединения.
+        """
+        loop = asyncio.get_running_loop()
+        if self._writer is not None:
+            self._queue.put(None)
+            await loop.run_in_executor(None, self._writer.join)
+            self._writer = None
+        self._readers.shutdown(wait=True)
+        with self._lock:
+            for conn in self._reader_conns:
+                conn.close()
+            self._reader_conns.clear()
+
+    async def _load_book_index(self):
+        if self.book_index is None:
+            return
+        from book_index import BookIndex
+
+        # Новый каталог собирается в потоке и подменяет старый уже в цикле событий.
+        # Изменения, сделанные за это время, снимок мог не застать: они
+        # применяются к новому каталогу ещё раз
+        self._index_changes = changes = []
+        try:
+            index = await self._read(_load_book_index, BookIndex())
+        finally:
+            self._index_changes = None
+        for book_id, borrower in changes:
+            index.set_borrower(book_id, borrower)
+        self.book_index.replace(index)
+
+    async def refresh_book_index(self) -> bool:
+        """
+        Перечитывает каталог в памяти, если в таблице books появились книги,
+        которых в нём нет (импорт другим процессом, см. importer.py).
+        Вызывается, когда книги не нашлось в каталоге: проверка — один
+        запрос MAX(id) по первичному ключу. Возвращает True, если перечитал.
+        """
+        if self.book_index is None:
+            return False
+        async with self._index_refresh:
+            if await self._read(_max_book_id) == self.book_index.max_id:
+                return False
+            self.catalogue.bump_all()
+            await self._load_book_index()
+            return True
+
+    def _book_changed(self, book_id: int, borrower):
+        # borrower — кто теперь держит книгу, None — она свободна
+        self.catalogue.bump(book_id)
+        if self.book_index is not None:
+            self.book_index.set_borrower(book_id, borrower)
+            if self._index_changes is not None:
+                self._index_changes.append((book_id, borrower))
+
+    async def _cached_read(self, cache: LRUCache, key, func, *args):
+        value = cache.get(key)
+        if value is MISSING:
+            generation = cache.generation
+            value = await self._read(func, *args)
+            cache.put(key, value, generation)
+        return value
+
+    ##########################################################################
+    # Пользователи
+    ##########################################################################
+
+    async def get_user(self, user_id: int):
+        """
+        Возвращает dict с данными пользователя или None.
+        Результат (в том числе None) кешируется до create_user или истечения TTL.
+        """
+        return await self._cached_read(self.users_cache, user_id, _get_user, user_id)
+
+    async def find_user_by_name(self, name: str, surname: str):
+        """
+        Возвращает кортеж (user_id, password) или None; password — хеш
+        (см. passwords.py) или открытый текст из старой версии бота.
+        """
+        return await self._read(_find_user_by_name, name, surname)
+
+    async def create_user(
+        self, user_id: int, name: str, surname: str, password: str
+    ) -> bool:
+        """
+        Возвращает False, если такой user_id или пара (имя, фамилия) уже заняты.
+        """
+        try:
+            return await self._write(_create_user, user_id, name, surname, password)
+        finally:
+            self.users_cache.invalidate(user_id)
+
+    async def set_password(self, user_id: int, password: str):
+        """
+        Заменяет сохранённый пароль (хеш) пользователя.
+        """
+        try:
+            await self._write(_set_password, user_id, password)
+        finally:
+            self.users_cache.invalidate(user_id)
+
+    async def get_user_loans(self, user_id: int):
+        """
+        Возвращает невозвращённые книги пользователя: список (title, borrowed_at, due_at).
+        """
+        return await self._cached_read(
+            self.loans_cache, user_id, _get_user_loans, user_id
+        )
+
+    ##########################################################################
+    # Книги
+    ##########################################################################
+
+    async def get_books_page(self, cursor: int, limit: int, backward: bool = False):
+        """
+        Страница каталога по ключу: книги с id > cursor (или id < cursor при
+        backward=True), не больше limit штук, по возрастанию id.
+        Возвращает (rows, has_more), где rows — кортежи
+        (id, title, author, available, borrower), а has_more говорит, есть ли
+        книги дальше в направлении листания.
+        """
+        if self.book_index is not None:
+            rows, has_more = self.book_index.page(cursor, limit, backward)
+            # Конец каталога: за ним могут быть импортированные книги
+            if not has_more and not backward and await self.refresh_book_index():
+                rows, has_more = self.book_index.page(cursor, limit, backward)
+            return rows, has_more
+        return await self._read(_get_books_page, cursor, limit, backward)
+
+    async def find_book(self, title: str):
+        """
+        Возвращает кортеж (title, author, available, borrower) или None.
+        Название, которого нет дословно, ищется без учёта регистра, «ё» и
+        лишних пробелов; в ответе — название из каталога.
+        """
+        if self.book_index is not None:
+            row = self.book_index.find(title)
+            if row is None and await self.refresh_book_index():
+                row = self.book_index.find(title)
+            return row
+        return await self._read(_find_book, title)
+
+    async def search_books(self, text: str, limit: int = 5):
+        """
+        Полнотекстовый поиск по названию и автору без учёта регистра, по
+        началу слов, с ранжированием BM25. Если ничего не нашлось, слова,
+        которых нет в словаре индекса (fts5vocab), заменяются ближайшими по
+        расстоянию редактирования (difflib), и поиск повторяется: так
+        прощаются опечатки.
+        Возвращает список кортежей (title, author, available, borrower).
+        """
+        return await self._read(_search_books, text, limit)
+
+    async def borrow_book(self, user_id: int, title: str) -> bool:
+        """
+        Бронирует книгу за пользователем одной транзакцией. title — точное
+        название из каталога (см. find_book).
+        Возвращает True, если книга была свободна и теперь записана на него.
+        """
+        row = await self._write(_borrow_book, user_id, title)
+        if row is None:
+            return False
+        self.loans_cache.invalidate(user_id)
+        self._book_changed(*row)
+        return True
+
+    async def find_book_id(self, title: str):
+        """
+        Возвращает id книги с таким названием или None. Название сравнивается
+        так же, как в find_book.
+        """
+        if self.book_index is not None:
+            book_id = self.book_index.find_id(title)
+            if book_id is None and await self.refresh_book_index():
+                book_id = self.book_index.find_id(title)
+            return book_id
+        return await self._read(_find_book_id, title)
+
+    async def count_available(self) -> int:
+        """
+        Сколько книг сейчас свободно.
+        """
+        if self.book_index is not None:
+            return self.book_index.available_count
+        return await self._read(_count_available)
+
+    async def set_book_returned(self, title: str):
+        """
+        Закрывает открытую выдачу книги, кто бы её ни взял. Книга в той же
+        транзакции переходит к первому в очереди или становится доступной.
+        Возвращает None, если книга не была занята, иначе (user_id, due_at)
+        нового читателя или (None, None), если очереди не было.
+        """
+        book_id, holder, handoff = await self._write(_set_book_returned, title)
+        if book_id is None:
+            return None
+        return self._after_return(book_id, holder, handoff)
+
+    async def return_book(self, user_id: int, title: str):
+        """
+        Возврат книги читателем: то же, что set_book_returned, но только если
+        книга сейчас у этого пользователя. Возвращает None, если её у него нет.
+        """
+        book_id, handoff = await self._write(_return_book, user_id, title)
+        if book_id is None:
+            return None
+        return self._after_return(book_id, user_id, handoff)
+
+    def _after_return(self, book_id, holder, handoff):
+        next_user, due_at, borrower = handoff
+        if holder is not None:
+            self.loans_cache.invalidate(holder)
+        if next_user is not None:
+            self.loans_cache.invalidate(next_user)
+        self._book_changed(book_id, borrower)
+        return next_user, due_at
+
+    async def init_books(self, initial_books: dict):
+        """
+        Загружает книги в пустую таблицу `books`.
+        """
+        await self._write(_init_books, initial_books)
+        self.catalogue.bump_all()
+        await self._load_book_index()
+
+    async def import_books(self, rows, chunk_size: int = IMPORT_CHUNK_SIZE, progress=None):
+        """
+        Импортирует книги из итератора строк (title, author, available, borrower)
+        одной транзакцией, пачками по chunk_size. Книга с существующим названием
+        получает нового автора, её доступность не меняется.
+        progress(done) вызывается после каждой пачки (из потока-писателя).
+        Возвращает число обработанных строк.
+        """
+        total = await self._write(_import_books, rows, chunk_size, progress)
+        self.catalogue.bump_all()
+        await self._load_book_index()
+        return total
+
+
+    ##########################################################################
+    # Очередь на книги
+    ##########################################################################
+
+    async def join_waitlist(self, user_id: int, book_id: int):
+        """
+        Ставит пользователя в конец очереди на книгу. Возвращает None, если
+        книги нет, иначе (title, place): place — место в очереди с единицы
+        (если пользователь уже в ней — его текущее место), 0 — книга была
+        свободна и сразу выдана ему, None — она и так у него.
+        """
+        result = await self._write(_join_waitlist, user_id, book_id)
+        if result is None:
+            return None
+        title, place, borrower = result
+        if place == 0:
+            self.loans_cache.invalidate(user_id)
+            self._book_changed(book_id, borrower)
+        return title, place
+
+    async def leave_waitlist(self, user_id: int, book_id: int) -> bool:
+        """
+        Убирает пользователя из очереди. False, если его там не было.
+        """
+        return await self._write(_leave_waitlist, user_id, book_id)
+
+    async def get_user_waitlist(self, user_id: int):
+        """
+        Очереди пользователя: список (title, place) в порядке записи.
+        """
+        return await self._read(_get_user_waitlist, user_id)
+
+    ##########################################################################
+    # Напоминания о возврате
+    ##########################################################################
+
+    async def next_reminder_at(self):
+        """
+        Время ближайшего напоминания по открытым выдачам или None, если их нет.
+        """
+        return await self._read(_next_reminder_at)
+
+    async def due_reminders(self, now: int, limit: int):
+        """
+        Выдачи, по которым пора напомнить, в порядке очереди: список
+        (loan_id, user_id, title, due_at), не больше limit штук.
+        """
+        return await self._read(_due_reminders, now, limit)
+
+    async def reschedule_reminders(self, items):
+        """
+        items — пары (next_reminder_at, loan_id): когда напомнить в следующий раз.
+        """
+        await self._write(_reschedule_reminders, list(items))
+
+    ##########################################################################
+    # Изменения, сделанные миграциями
+    ##########################################################################
+
+    async def pending_migration_notes(self):
+        """
+        О чём ещё не сообщили читателям: список (note_id, user_id, kind,
+        original, surname), surname — текущая фамилия.
+        """
+        return await self._read(_pending_migration_notes)
+
+    async def mark_migration_notes(self, note_ids, now: int):
+        """
+        Отмечает, что читателям сообщили о записях note_ids.
+        """
+        await self._write(_mark_migration_notes, list(note_ids), now)
+
+    ##########################################################################
+    # Состояния FSM
+    ##########################################################################
+
+    async def get_fsm(self, key: str, fresh_after: float):
+        """
+        Возвращает (state, data_json) или None, если записи нет или она не
+        менялась с момента fresh_after (истёк срок жизни).
+        """
+        return await self._read(_get_fsm, key, fresh_after)
+
+    async def set_fsm_state(self, key: str, state, now: float, fresh_after: float):
+        """
+        Меняет состояние; данные записи, истёкшей к fresh_after, сбрасываются.
+        """
+        await self._write(_set_fsm, key, "state", state, now, fresh_after)
+
+    async def set_fsm_data(self, key: str, data_json: str, now: float, fresh_after: float):
+        """
+        Заменяет данные; состояние записи, истёкшей к fresh_after, сбрасывается.
+        """
+        await self._write(_set_fsm, key, "data", data_json, now, fresh_after)
+
+    async def purge_fsm(self, older_than: float) -> int:
+        """
+        Удаляет состояния, не менявшиеся с момента older_than. Возвращает их число.
+        """
+        return await self._write(_purge_fsm, older_than)
+
+
+def _begin(conn: sqlite3.Connection):
+    # С базой могут работать несколько процессов (см. sharding.py): если
+    # чужая транзакция не уложилась в busy_timeout, пробуем ещё раз
+    for attempt in itertools.count(1):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            return
+        except sqlite3.OperationalError as exc:
+            if exc.sqlite_errorcode != sqlite3.SQLITE_BUSY or attempt > BUSY_RETRIES:
+                raise
+            logging.warning("База занята другим процессом, попытка %s", attempt)
+
+
+def _resolve(future: asyncio.Future, ok: bool, value):
+    if future.cancelled():
+        return
+    if ok:
+        future.set_result(value)
+    else:
+        future.set_exception(value)
+
+
+def _resolve_all(resolved):
+    for future, ok, value in resolved:
+        _resolve(future, ok, value)
+
+
+##############################################################################
+# Синхронные запросы (выполняются в потоках-исполнителях)
+#
+# Функции записи не вызывают commit: транзакцией управляет поток-писатель.
+##############################################################################
+
+
+def _migrate(conn: sqlite3.Connection):
+    """
+    Доводит схему до последней версии. Номер версии хранится в PRAGMA user_version,
+    каждая миграция выполняется один раз.
+    """
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        migration(conn)
+        conn.execute(f"PRAGMA user_version = {number}")
+
+
+def _migration_base_tables(conn: sqlite3.Connection):
+    # Создаём таблицу пользователей (если не существует)
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            name TEXT,
+            surname TEXT,
+            password TEXT,
+            borrowed_books TEXT
+        )
+    """
+    )
+    # Создаём таблицу книг (если не существует)
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS books (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT UNIQUE,
+            author TEXT,
+            available BOOLEAN,
+            borrower TEXT
+        )
+    """
+    )
+
+
+def _migration_loans(conn: sqlite3.Connection):
+    """
+    Таблица выдач вместо CSV-строки users.borrowed_books.
+    Уже взятые книги переносятся из CSV, колонка удаляется.
+    """
+    conn.execute(
+        """
+        CREATE TABLE loans (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL REFERENCES users (user_id),
+            book_id INTEGER NOT NULL REFERENCES books (id),
+            borrowed_at INTEGER NOT NULL,
+            due_at INTEGER NOT NULL,
+            returned_at INTEGER
+        )
+    """
+    )
+    conn.execute("CREATE INDEX idx_loans_user ON loans (user_id)")
+    conn.execute("CREATE INDEX idx_loans_book ON loans (book_id)")
+    # Одна открытая выдача на книгу; индекс же ищет открытые выдачи
+    conn.execute(
+        "CREATE UNIQUE INDEX idx_loans_open ON loans (book_id) WHERE returned_at IS NULL"
+    )
+
+    book_ids = dict(conn.execute("SELECT title, id FROM books"))
+    now = int(time.time())
+    due = now + LOAN_DAYS * 86400
+    users = conn.execute(
+        "SELECT user_id, borrowed_books FROM users WHERE borrowed_books <> ''"
+    ).fetchall()
+    _create_migration_notes(conn)
+    for user_id, borrowed_csv in users:
+        titles, unmatched = _split_titles(borrowed_csv, book_ids)
+        for title in titles:
+            conn.execute(
+                """
+                INSERT OR IGNORE INTO loans (user_id, book_id, borrowed_at, due_at)
+                VALUES (?, ?, ?, ?)
+                """,
+                (user_id, book_ids[title], now, due),
+            )
+        # Книги, которых нет в каталоге, выдачей не стали: читатель узнает о них
+        for text in unmatched:
+            _add_migration_note(conn, user_id, "unknown_book", text)
+    conn.execute("ALTER TABLE users DROP COLUMN borrowed_books")
+
+
+def _split_titles(borrowed_csv: str, book_ids: dict):
+    """
+    Разбирает CSV со списком книг. Название с запятой было разрезано на
+    части, поэтому соседние части склеиваются, пока не найдётся книга;
+    части перед ней, не ставшие книгой, откладываются.
+    Возвращает (названия, куски CSV, которым книга не нашлась).
+    """
+    titles = []
+    unmatched = []
+    pending = []
+    for part in borrowed_csv.split(","):
+        if not part:
+            continue
+        pending.append(part)
+        for start in range(len(pending)):
+            title = ",".join(pending[start:])
+            if title in book_ids:
+                if start:
+                    unmatched.append(",".join(pending[:start]))
+                titles.append(title)
+                pending = []
+                break
+    if pending:
+        unmatched.append(",".join(pending))
+    return titles, unmatched
+
+
+def _migration_user_name_index(conn: sqlite3.Connection):
+    """
+    Уникальный составной индекс для входа по имени и фамилии.
+    Если в базе уже есть однофамильцы-тёзки, у всех, кроме самого первого,
+    к фамилии дописывается их user_id, иначе вход выбирал бы одного из них
+    наугад. Прежняя фамилия остаётся в migration_notes, и при запуске бот
+    сообщает читателю новую.
+    """
+    duplicates = conn.execute(
+        """
+        SELECT user_id, surname FROM users AS u
+        WHERE EXISTS (
+            SELECT 1 FROM users AS older
+            WHERE older.name = u.name AND older.surname = u.surname
+              AND older.user_id < u.user_id
+        )
+        """
+    ).fetchall()
+    _create_migration_notes(conn)
+    for user_id, surname in duplicates:
+        conn.execute(
+            "UPDATE users SET surname = surname || ' (' || user_id || ')' WHERE user_id = ?",
+            (user_id,),
+        )
+        _add_migration_note(conn, user_id, "renamed", surname)
+    conn.execute("CREATE UNIQUE INDEX idx_users_name ON users (name, surname)")
+
+
+def _create_migration_notes(conn: sqlite3.Connection):
+    """
+    Что миграции изменили в данных читателей без их участия: kind —
+    "renamed" (original — прежняя фамилия) или "unknown_book" (original —
+    кусок borrowed_books без книги в каталоге). notified_at — когда
+    читателю об этом сообщили (см. start.py).
+    """
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS migration_notes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL REFERENCES users (user_id),
+            kind TEXT NOT NULL,
+            original TEXT NOT NULL,
+            notified_at INTEGER
+        )
+    """
+    )
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_migration_notes_pending ON migration_notes (id)
+        WHERE notified_at IS NULL
+        """
+    )
+
+
+def _add_migration_note(conn: sqlite3.Connection, user_id: int, kind: str, original: str):
+    conn.execute(
+        "INSERT INTO migration_notes (user_id, kind, original) VALUES (?, ?, ?)",
+        (user_id, kind, original),
+    )
+    logging.warning("Миграция изменила данные пользователя %s: %s %r", user_id, kind, original)
+
+
+# SQL-версия _normalize_text: FTS5 сам приводит регистр, но «ё» и «е» для
+# него разные буквы
+_NORMALIZE_SQL = "replace(replace({}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def _migration_books_fts(conn: sqlite3.Connection):
+    """
+    Полнотекстовый индекс books_fts по словам названия и автора, с
+    префиксными индексами для поиска по началу слова. Индекс без хранимого
+    текста — нужен только rowid, сами строки берутся из books.
+    books_vocab — словарь индекса, по нему исправляются опечатки.
+    Триггеры держат индекс в синхронизации с books; смена available/borrower
+    его не трогает.
+    """
+    title = _NORMALIZE_SQL.format("{0}.title")
+    author = _NORMALIZE_SQL.format("{0}.author")
+    conn.execute(
+        """
+        CREATE VIRTUAL TABLE books_fts USING fts5(
+            title, author, content='', prefix='2 3',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    """
+    )
+    conn.execute("CREATE VIRTUAL TABLE books_vocab USING fts5vocab(books_fts, 'row')")
+
+    insert = f"""
+        INSERT INTO books_fts (rowid, title, author)
+        VALUES ({{0}}.id, {title}, {author});
+    """
+    delete = f"""
+        INSERT INTO books_fts (books_fts, rowid, title, author)
+        VALUES ('delete', {{0}}.id, {title}, {author});
+    """
+    conn.execute(
+        f"""
+        CREATE TRIGGER books_fts_insert AFTER INSERT ON books BEGIN
+            {insert.format("new")}
+        END
+    """
+    )
+    conn.execute(
+        f"""
+        CREATE TRIGGER books_fts_delete AFTER DELETE ON books BEGIN
+            {delete.format("old")}
+        END
+    """
+    )
+    conn.execute(
+        f"""
+        CREATE TRIGGER books_fts_update AFTER UPDATE OF title, author ON books BEGIN
+            {delete.format("old")}
+            {insert.format("new")}
+        END
+    """
+    )
+
+    conn.execute(
+        f"INSERT INTO books_fts (rowid, title, author) "
+        f"SELECT id, {title.format('books')}, {author.format('books')} FROM books"
+    )
+
+
+def _migration_fsm_states(conn: sqlite3.Connection):
+    """
+    Состояния FSM aiogram (см. storage.py): ключ, состояние и данные в JSON.
+    """
+    conn.execute(
+        """
+        CREATE TABLE fsm_states (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT NOT NULL DEFAULT '{}',
+            updated_at REAL NOT NULL
+        ) WITHOUT ROWID
+    """
+    )
+    # Для удаления устаревших состояний
+    conn.execute("CREATE INDEX idx_fsm_states_updated ON fsm_states (updated_at)")
+
+
+def _migration_loan_reminders(conn: sqlite3.Connection):
+    """
+    Когда напомнить о возврате (см. reminders.py). Индекс по открытым
+    выдачам отдаёт ближайшее напоминание без просмотра всей таблицы.
+    """
+    conn.execute("ALTER TABLE loans ADD COLUMN next_reminder_at INTEGER")
+    conn.execute(
+        "UPDATE loans SET next_reminder_at = due_at - ? WHERE returned_at IS NULL",
+        (REMIND_BEFORE,),
+    )
+    conn.execute(
+        """
+        CREATE INDEX idx_loans_reminder ON loans (next_reminder_at)
+        WHERE returned_at IS NULL
+        """
+    )
+
+
+def _migration_waitlist(conn: sqlite3.Connection):
+    """
+    Очереди на занятые книги. Ключ (book_id, position): первый в очереди —
+    начало диапазона книги, последний — его конец, оба находятся спуском
+    по дереву без просмотра очереди. Второй индекс не даёт встать в одну
+    очередь дважды и отдаёт очереди пользователя.
+    """
+    conn.execute(
+        """
+        CREATE TABLE waitlist (
+            book_id INTEGER NOT NULL REFERENCES books (id),
+            position INTEGER NOT NULL,
+            user_id INTEGER NOT NULL REFERENCES users (user_id),
+            queued_at INTEGER NOT NULL,
+            PRIMARY KEY (book_id, position)
+        ) WITHOUT ROWID
+    """
+    )
+    conn.execute("CREATE UNIQUE INDEX idx_waitlist_user ON waitlist (user_id, book_id)")
+
+
+def _migration_notes(conn: sqlite3.Connection):
+    # Базам, которые прошли _migration_loans и _migration_user_name_index до
+    # появления migration_notes: таблица нужна для чтения, записей в ней не будет
+    _create_migration_notes(conn)
+
+
+MIGRATIONS = [
+    _migration_base_tables,
+    _migration_loans,
+    _migration_user_name_index,
+    _migration_books_fts,
+    _migration_fsm_states,
+    _migration_loan_reminders,
+    _migration_waitlist,
+    _migration_notes,
+]
+
+
+def _get_user(conn: sqlite3.Connection, user_id: int):
+    row = conn.execute("SELECT * FROM users WHERE user_id = ?", (user_id,)).fetchone()
+    if row:
+        # row: (user_id, name, surname, password)
+        return {
+            "user_id": row[0],
+            "name": row[1],
+            "surname": row[2],
+            "password": row[3],
+        }
+    return None
+
+
+def _find_user_by_name(conn: sqlite3.Connection, name: str, surname: str):
+    return conn.execute(
+        """
+        SELECT user_id, password FROM users
+        WHERE name = ? AND surname = ?
+        """,
+        (name, surname),
+    ).fetchone()
+
+
+def _create_user(conn: sqlite3.Connection, user_id, name, surname, password) -> bool:
+    try:
+        conn.execute(
+            """
+            INSERT INTO users (user_id, name, surname, password)
+            VALUES (?, ?, ?, ?)
+            """,
+            (user_id, name, surname, password),
+        )
+    except sqlite3.IntegrityError:
+        return False
+    return True
+
+
+def _set_password(conn: sqlite3.Connection, user_id, password):
+    conn.execute("UPDATE users SET password = ? WHERE user_id = ?", (password, user_id))
+
+
+def _get_user_loans(conn: sqlite3.Connection, user_id: int):
+    return conn.execute(
+        """
+        SELECT books.title, loans.borrowed_at, loans.due_at
+        FROM loans JOIN books ON books.id = loans.book_id
+        WHERE loans.user_id = ? AND loans.returned_at IS NULL
+        ORDER BY loans.borrowed_at
+        """,
+        (user_id,),
+    ).fetchall()
+
+
+def _get_books_page(conn: sqlite3.Connection, cursor: int, limit: int, backward: bool):
+    # Берём на одну строку больше, чтобы узнать, есть ли следующая страница
+    if backward:
+        rows = conn.execute(
+            """
+            SELECT id, title, author, available, borrower FROM books
+            WHERE id < ? ORDER BY id DESC LIMIT ?
+            """,
+            (cursor, limit + 1),
+        ).fetchall()
+        return rows[:limit][::-1], len(rows) > limit
+    rows = conn.execute(
+        """
+        SELECT id, title, author, available, borrower FROM books
+        WHERE id > ? ORDER BY id LIMIT ?
+        """,
+        (cursor, limit + 1),
+    ).fetchall()
+    return rows[:limit], len(rows) > limit
+
+
+def _find_book(conn: sqlite3.Connection, title: str):
+    query = "SELECT title, author, available, borrower FROM books WHERE title = ?"
+    row = conn.execute(query, (title,)).fetchone()
+    if row is None:
+        title = _resolve_title(conn, title)
+        if title is not None:
+            row = conn.execute(query, (title,)).fetchone()
+    return row
+
+
+def _resolve_title(conn: sqlite3.Connection, title: str):
+    """
+    Название книги, которое совпадает с title после normalize_title (как в
+    BookIndex), или None. Кандидаты — книги со всеми словами title в
+    названии, их находит books_fts.
+    """
+    normalized = normalize_title(title)
+    words = re.findall(r"\w+", normalized)
+    if not words:
+        return None
+    rows = conn.execute(
+        """
+        SELECT books.title FROM books_fts JOIN books ON books.id = books_fts.rowid
+        WHERE books_fts MATCH ?
+        """,
+        ("title : (" + " ".join(f'"{word}"' for word in words) + ")",),
+    )
+    for (candidate,) in rows:
+        if normalize_title(candidate) == normalized:
+            return candidate
+    return None
+
+
+def _normalize_text(text: str) -> str:
+    return text.lower().replace("ё", "е")
+
+
+def _search_books(conn: sqlite3.Connection, text: str, limit: int):
+    words = re.findall(r"\w+", _normalize_text(text))
+    if not words:
+        return []
+    # Последнее слово — начало слова (пользователь мог не допечатать),
+    # остальные целиком: префикс по частому слову дорог
+    rows = _match_books(conn, words, limit, prefix_all=False)
+    if rows:
+        return rows
+
+    # Слова, которых нет в словаре индекса (опечатки), заменяем на самые
+    # похожие слова из словаря и ищем ещё раз, теперь все слова — префиксами
+    corrected = [_correct_word(conn, word) for word in words]
+    corrected = [word for word in corrected if word]
+    if not corrected:
+        return []
+    return _match_books(conn, corrected, limit)
+
+
+def _match_books(conn: sqlite3.Connection, words, limit: int, prefix_all=True):
+    terms = [f'"{word}"*' if prefix_all else f'"{word}"' for word in words[:-1]]
+    terms.append(f'"{words[-1]}"*')
+    # Ранжируются все совпадения: LIMIT до ORDER BY rank отдал бы первые по
+    # rowid, и точное название терялось бы среди книг с частым словом
+    return conn.execute(
+        """
+        WITH hits AS (
+            SELECT rowid, rank FROM books_fts
+            WHERE books_fts MATCH ? ORDER BY rank LIMIT ?
+        )
+        SELECT books.title, books.author, books.available, books.borrower
+        FROM hits JOIN books ON books.id = hits.rowid
+        ORDER BY hits.rank
+        """,
+        (" ".join(terms), limit),
+    ).fetchall()
+
+
+def _correct_word(conn: sqlite3.Connection, word: str):
+    """
+    Возвращает само слово, если с него начинается хоть одно слово словаря,
+    иначе ближайшее по редакционному расстоянию слово словаря или None.
+    Кандидаты сначала берутся с тех же трёх первых букв (так их немного),
+    затем с двух и с одной.
+    """
+    if _vocab_range(conn, word, limit=1):
+        return word
+    for start in dict.fromkeys((word[:3], word[:2], word[:1])):
+        candidates = [
+            term for term in _vocab_range(conn, start) if abs(len(term) - len(word)) <= 2
+        ]
+        matches = difflib.get_close_matches(word, candidates, n=1, cutoff=TYPO_THRESHOLD)
+        if matches:
+            return matches[0]
+    return None
+
+
+def _vocab_range(conn: sqlite3.Connection, start: str, limit: int = -1):
+    # Слова словаря, начинающиеся со start
+    return [
+        term
+        for (term,) in conn.execute(
+            "SELECT term FROM books_vocab WHERE term >= ? AND term < ? LIMIT ?",
+            (start, start + "\uffff", limit),
+        )
+    ]
+
+
+def _borrow_book(conn: sqlite3.Connection, user_id: int, title: str):
+    # Условный UPDATE: проверка и захват книги в одном операторе.
+    # Возвращает (id книги, borrower) или None, если она не найдена или занята.
+    rows = conn.execute(
+        """
+        UPDATE books
+        SET available = ?,
+            borrower = (SELECT name || ' ' || surname FROM users WHERE user_id = ?)
+        WHERE title = ? AND available = ?
+        RETURNING id, borrower
+        """,
+        (False, user_id, title, True),
+    ).fetchall()
+    if not rows:
+        return None
+    _open_loan(conn, user_id, rows[0][0])
+    return rows[0]
+
+
+def _open_loan(conn: sqlite3.Connection, user_id: int, book_id: int) -> int:
+    # Возвращает срок возврата
+    now = int(time.time())
+    due_at = now + LOAN_DAYS * 86400
+    conn.execute(
+        """
+        INSERT INTO loans (user_id, book_id, borrowed_at, due_at, next_reminder_at)
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        (user_id, book_id, now, due_at, due_at - REMIND_BEFORE),
+    )
+    return due_at
+
+
+def _find_book_id(conn: sqlite3.Connection, title: str):
+    row = conn.execute("SELECT id FROM books WHERE title = ?", (title,)).fetchone()
+    if row is None:
+        title = _resolve_title(conn, title)
+        if title is not None:
+            row = conn.execute("SELECT id FROM books WHERE title = ?", (title,)).fetchone()
+    return row[0] if row else None
+
+
+def _count_available(conn: sqlite3.Connection) -> int:
+    return conn.execute("SELECT COUNT(*) FROM books WHERE available").fetchone()[0]
+
+
+def _max_book_id(conn: sqlite3.Connection) -> int:
+    return conn.execute("SELECT COALESCE(MAX(id), 0) FROM books").fetchone()[0]
+
+
+def _load_book_index(conn: sqlite3.Connection, book_index):
+    book_index.load(
+        conn.execute("SELECT id, title, author, available, borrower FROM books ORDER BY id")
+    )
+    return book_index
+
+
+def _set_book_returned(conn: sqlite3.Connection, title: str):
+    # Возвращает (id книги или None, если она не была занята;
+    # user_id читателя по таблице loans или None; результат _hand_over)
+    row = conn.execute(
+        "SELECT id FROM books WHERE title = ? AND available = ?", (title, False)
+    ).fetchone()
+    if row is None:
+        return None, None, (None, None, None)
+    book_id = row[0]
+    rows = conn.execute(
+        """
+        UPDATE loans SET returned_at = ?
+        WHERE returned_at IS NULL AND book_id = ?
+        RETURNING user_id
+        """,
+        (int(time.time()), book_id),
+    ).fetchall()
+    return book_id, rows[0][0] if rows else None, _hand_over(conn, book_id)
+
+
+def _return_book(conn: sqlite3.Connection, user_id: int, title: str):
+    # Возвращает (id книги или None, если её нет у пользователя; результат _hand_over)
+    rows = conn.execute(
+        """
+        UPDATE loans SET returned_at = ?
+        WHERE returned_at IS NULL AND user_id = ?
+          AND book_id = (SELECT id FROM books WHERE title = ?)
+        RETURNING book_id
+        """,
+        (int(time.time()), user_id, title),
+    ).fetchall()
+    if not rows:
+        return None, (None, None, None)
+    book_id = rows[0][0]
+    return book_id, _hand_over(conn, book_id)
+
+
+def _hand_over(conn: sqlite3.Connection, book_id: int):
+    """
+    Книга, выдача которой только что закрыта, достаётся первому в очереди,
+    а без очереди становится доступной. Выполняется в транзакции возврата,
+    так что книга не бывает ни свободной при непустой очереди, ни ничьей.
+    Возвращает (user_id, due_at, borrower) нового читателя или (None, None, None).
+    """
+    rows = conn.execute(
+        """
+        DELETE FROM waitlist
+        WHERE book_id = ?
+          AND position = (SELECT MIN(position) FROM waitlist WHERE book_id = ?)
+        RETURNING user_id
+        """,
+        (book_id, book_id),
+    ).fetchall()
+    if not rows:
+        conn.execute(
+            "UPDATE books SET available = ?, borrower = NULL WHERE id = ?", (True, book_id)
+        )
+        return None, None, None
+    user_id = rows[0][0]
+    (borrower,) = conn.execute(
+        """
+        UPDATE books
+        SET borrower = (SELECT name || ' ' || surname FROM users WHERE user_id = ?)
+        WHERE id = ?
+        RETURNING borrower
+        """,
+        (user_id, book_id),
+    ).fetchone()
+    return user_id, _open_loan(conn, user_id, book_id), borrower
+
+
+def _join_waitlist(conn: sqlite3.Connection, user_id: int, book_id: int):
+    row = conn.execute(
+        "SELECT title, available FROM books WHERE id = ?", (book_id,)
+    ).fetchone()
+    # Возвращает (title, place, borrower); borrower — только если книга выдана сразу
+    if row is None:
+        return None
+    title, available = row
+    if available:
+        # Книга освободилась, пока пользователь думал: очередь пуста (иначе
+        # книга перешла бы к первому в ней), так что она достаётся ему
+        (borrower,) = conn.execute(
+            """
+            UPDATE books
+            SET available = ?,
+                borrower = (SELECT name || ' ' || surname FROM users WHERE user_id = ?)
+            WHERE id = ?
+            RETURNING borrower
+            """,
+            (False, user_id, book_id),
+        ).fetchone()
+        _open_loan(conn, user_id, book_id)
+        return title, 0, borrower
+    holder = conn.execute(
+        "SELECT user_id FROM loans WHERE returned_at IS NULL AND book_id = ?", (book_id,)
+    ).fetchone()
+    if holder is not None and holder[0] == user_id:
+        return title, None, None
+    conn.execute(
+        """
+        INSERT OR IGNORE INTO waitlist (book_id, position, user_id, queued_at)
+        SELECT ?, COALESCE(MAX(position), 0) + 1, ?, ? FROM waitlist WHERE book_id = ?
+        """,
+        (book_id, user_id, int(time.time()), book_id),
+    )
+    return title, _waitlist_place(conn, user_id, book_id), None
+
+
+def _waitlist_place(conn: sqlite3.Connection, user_id: int, book_id: int) -> int:
+    # Сколько записей в очереди книги до пользователя включительно
+    return conn.execute(
+        """
+        SELECT COUNT(*) FROM waitlist
+        WHERE book_id = ?
+          AND position <= (SELECT position FROM waitlist WHERE user_id = ? AND book_id = ?)
+        """,
+        (book_id, user_id, book_id),
+    ).fetchone()[0]
+
+
+def _leave_waitlist(conn: sqlite3.Connection, user_id: int, book_id: int) -> bool:
+    return (
+        conn.execute(
+            "DELETE FROM waitlist WHERE user_id = ? AND book_id = ?", (user_id, book_id)
+        ).rowcount
+        > 0
+    )
+
+
+def _get_user_waitlist(conn: sqlite3.Connection, user_id: int):
+    rows = conn.execute(
+        """
+        SELECT waitlist.book_id, books.title
+        FROM waitlist JOIN books ON books.id = waitlist.book_id
+        WHERE waitlist.user_id = ?
+        ORDER BY waitlist.queued_at
+        """,
+        (user_id,),
+    ).fetchall()
+    return [(title, _waitlist_place(conn, user_id, book_id)) for book_id, title in rows]
+
+
+def _next_reminder_at(conn: sqlite3.Connection):
+    # MIN по индексу — один переход к его первой записи
+    return conn.execute(
+        "SELECT MIN(next_reminder_at) FROM loans WHERE returned_at IS NULL"
+    ).fetchone()[0]
+
+
+def _due_reminders(conn: sqlite3.Connection, now: int, limit: int):
+    return conn.execute(
+        """
+        SELECT loans.id, loans.user_id, books.title, loans.due_at
+        FROM loans JOIN books ON books.id = loans.book_id
+        WHERE loans.returned_at IS NULL AND loans.next_reminder_at <= ?
+        ORDER BY loans.next_reminder_at
+        LIMIT ?
+        """,
+        (now, limit),
+    ).fetchall()
+
+
+def _reschedule_reminders(conn: sqlite3.Connection, items):
+    conn.executemany("UPDATE loans SET next_reminder_at = ? WHERE id = ?", items)
+
+
+def _pending_migration_notes(conn: sqlite3.Connection):
+    return conn.execute(
+        """
+        SELECT migration_notes.id, migration_notes.user_id, kind, original, users.surname
+        FROM migration_notes JOIN users ON users.user_id = migration_notes.user_id
+        WHERE notified_at IS NULL
+        ORDER BY migration_notes.id
+        """
+    ).fetchall()
+
+
+def _mark_migration_notes(conn: sqlite3.Connection, note_ids, now: int):
+    conn.executemany(
+        "UPDATE migration_notes SET notified_at = ? WHERE id = ?",
+        [(now, note_id) for note_id in note_ids],
+    )
+
+
+def _get_fsm(conn: sqlite3.Connection, key: str, fresh_after: float):
+    return conn.execute(
+        "SELECT state, data FROM fsm_states WHERE key = ? AND updated_at > ?",
+        (key, fresh_after),
+    ).fetchone()
+
+
+def _set_fsm(conn: sqlite3.Connection, key, column, value, now, fresh_after):
+    # Вторая колонка сохраняется, только если запись ещё не истекла
+    other = "data" if column == "state" else "state"
+    fields = {"state": None, "data": "{}", column: value}
+    conn.execute(
+        f"""
+        INSERT INTO fsm_states (key, state, data, updated_at) VALUES (?, ?, ?, ?)
+        ON CONFLICT (key) DO UPDATE SET
+            {column} = excluded.{column},
+            {other} = CASE WHEN updated_at > ? THEN {other} ELSE excluded.{other} END,
+            updated_at = excluded.updated_at
+        """,
+        (key, fields["state"], fields["data"], now, fresh_after),
+    )
+    # Пустые записи (состояние сброшено, данных нет) не храним
+    conn.execute(
+        "DELETE FROM fsm_states WHERE key = ? AND state IS NULL AND data = '{}'",
+        (key,),
+    )
+
+
+def _purge_fsm(conn: sqlite3.Connection, older_than: float) -> int:
+    return conn.execute(
+        "DELETE FROM fsm_states WHERE updated_at <= ?", (older_than,)
+    ).rowcount
+
+
+def _init_books(conn: sqlite3.Connection, initial_books: dict):
+    # Проверяем, есть ли уже какие-то записи в таблице books
+    count = conn.execute("SELECT COUNT(*) FROM books").fetchone()[0]
+    if count == 0:
+        # Если записей нет, загружаем initial_books
+        _import_books(
+            conn,
+            (
+                (title, info["author"], info["available"], info["borrower"])
+                for title, info in initial_books.items()
+            ),
+            IMPORT_CHUNK_SIZE,
+        )
+
+
+def _import_books(conn: sqlite3.Connection, rows, chunk_size: int, progress=None):
+    """
+    Потоковый импорт. Триггер, добавляющий книгу в полнотекстовый индекс, на
+    время вставки снимается (по строке он в разы медленнее): новые книги
+    попадают в индекс одним запросом в конце, всё в той же транзакции.
+    Смену автора у существующих книг индексу по-прежнему передаёт триггер
+    books_fts_update, а неизменённые строки не обновляются вовсе.
+    """
+    (trigger_sql,) = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'books_fts_insert'"
+    ).fetchone()
+    conn.execute("DROP TRIGGER books_fts_insert")
+    (last_id,) = conn.execute("SELECT COALESCE(MAX(id), 0) FROM books").fetchone()
+
+    total = 0
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            break
+        conn.executemany(
+            """
+            INSERT INTO books (title, author, available, borrower)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (title) DO UPDATE SET author = excluded.author
+            WHERE author IS NOT excluded.author
+            """,
+            chunk,
+        )
+        total += len(chunk)
+        if progress:
+            progress(total)
+
+    title = _NORMALIZE_SQL.format("title")
+    author = _NORMALIZE_SQL.format("author")
+    conn.execute(
+        f"""
+        INSERT INTO books_fts (rowid, title, author)
+        SELECT id, {title}, {author} FROM books WHERE id > ?
+        """,
+        (last_id,),
+    )
+    conn.execute(trigger_sql)
+    return total
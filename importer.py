@@ -0,0 +1,119 @@
+"""
+Массовый импорт каталога книг в БД.
+
+Источники читаются потоково: .xlsx (openpyxl в режиме read-only), .csv или
+словарь books из book.py. Строки пишутся пачками через executemany в одной
+транзакции; книга с уже существующим названием обновляет автора.
+
+Запущенный бот подхватывает новые книги сам, как только их спросят или
+долистают до конца каталога (см. book_index.py); нового автора у
+известной книги — после перезапуска.
+
+Запуск:
+    python importer.py catalogue.xlsx
+    python importer.py catalogue.csv --chunk-size 20000
+    python importer.py book.py
+"""
+
+import argparse
+import asyncio
+import csv
+import logging
+import os
+
+from db import DB_PATH, IMPORT_CHUNK_SIZE, Database
+
+# Заголовки первой колонки, по которым первая строка файла считается шапкой
+HEADER_TITLES = {"title", "название", "книга"}
+
+
+def read_xlsx(path: str):
+    """
+    Строки (title, author, available, borrower) из первого листа .xlsx.
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        yield from _rows_from_cells(sheet.iter_rows(values_only=True))
+    finally:
+        workbook.close()
+
+
+def read_csv(path: str):
+    """
+    Строки (title, author, available, borrower) из .csv (разделитель определяется сам).
+    """
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        yield from _rows_from_cells(csv.reader(f, dialect))
+
+
+def read_book_module(books: dict = None):
+    """
+    Строки (title, author, available, borrower) из словаря books (по умолчанию из book.py).
+    """
+    if books is None:
+        from book import books
+    for title, info in books.items():
+        yield title, info["author"], info["available"], info["borrower"]
+
+
+def _rows_from_cells(cells):
+    first = True
+    for row in cells:
+        if not row or row[0] is None or not str(row[0]).strip():
+            continue
+        title = str(row[0]).strip()
+        if first:
+            first = False
+            if title.lower() in HEADER_TITLES:
+                continue
+        author = str(row[1]).strip() if len(row) > 1 and row[1] is not None else ""
+        yield title, author, True, None
+
+
+def read_source(path: str):
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".xlsx", ".xlsm"):
+        return read_xlsx(path)
+    if extension == ".csv":
+        return read_csv(path)
+    if os.path.basename(path) == "book.py":
+        return read_book_module()
+    raise ValueError(f"Неизвестный формат файла: {path}")
+
+
+async def import_file(path: str, db_path: str = DB_PATH, chunk_size=IMPORT_CHUNK_SIZE):
+    database = Database(db_path)
+    await database.connect()
+    try:
+        return await database.import_books(
+            read_source(path),
+            chunk_size=chunk_size,
+            progress=lambda done: logging.info("Импортировано книг: %s", done),
+        )
+    finally:
+        await database.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Импорт каталога книг")
+    parser.add_argument("source", help=".xlsx, .csv или book.py")
+    parser.add_argument("--db", default=DB_PATH, help="файл базы данных")
+    parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    total = asyncio.run(import_file(args.source, args.db, args.chunk_size))
+    logging.info("Готово: %s книг", total)
+
+
+if __name__ == "__main__":
+    main()
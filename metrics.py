@@ -0,0 +1,316 @@
+"""
+Метрики горячих путей: гистограммы задержек хендлеров, обновлений, SQL-запросов
+и запросов к Telegram API.
+
+- UpdateMetricsMiddleware (outer на dp.update) — время обработки обновления и
+  сколько из него ушло на ожидание базы;
+- HandlerMetricsMiddleware (inner на наблюдателях роутера) — время каждого хендлера;
+- TimedConnection — соединение sqlite3, которое замеряет каждый запрос
+  (подключается через Database(metrics=...));
+- ApiMetricsMiddleware (на bot.session) — время запросов к Telegram по методам.
+
+Всё отдаётся в текстовом формате Prometheus и в JSON: serve() поднимает
+локальный HTTP-сервер с /metrics и /metrics.json.
+"""
+
+import bisect
+import json
+import re
+import sqlite3
+import threading
+import time
+from contextvars import ContextVar
+from functools import lru_cache
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+
+# Границы корзин гистограмм, секунды
+BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+# Имя метки у каждой гистограммы
+LABELS = {
+    "update_seconds": "type",
+    "update_db_seconds": "type",
+    "handler_seconds": "handler",
+    "sql_seconds": "statement",
+    "sql_fetch_seconds": "statement",
+    "telegram_request_seconds": "method",
+}
+
+# Время ожидания базы в рамках текущего обновления (см. Database._read/_write)
+_db_time = ContextVar("db_time", default=None)
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self):
+        # Последняя корзина — всё, что больше BUCKETS[-1] (+Inf)
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """
+        Оценка квантиля по корзинам (верхняя граница корзины).
+        """
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class Metrics:
+    def __init__(self):
+        # SQL замеряется в потоках базы, остальное — в цикле событий
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._collectors = []
+
+    def observe(self, name: str, label: str, value: float):
+        key = (name, label)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def add_collector(self, prefix: str, stats):
+        """
+        stats() возвращает плоский dict чисел (как LRUCache.stats()); каждое
+        значение отдаётся как gauge {prefix}_{ключ}.
+        """
+        self._collectors.append((prefix, stats))
+
+    def observe_db_wait(self, seconds: float):
+        spent = _db_time.get()
+        if spent is not None:
+            spent[0] += seconds
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            histograms = {
+                key: (list(h.counts), h.count, h.sum) for key, h in self._histograms.items()
+            }
+        gauges = {}
+        for prefix, stats in self._collectors:
+            for key, value in stats().items():
+                gauges[f"{prefix}_{key}"] = value
+        return {"histograms": histograms, "gauges": gauges}
+
+    def to_json(self) -> str:
+        snapshot = self.snapshot()
+        histograms = {}
+        for (name, label), (counts, count, total) in sorted(snapshot["histograms"].items()):
+            histogram = Histogram()
+            histogram.counts, histogram.count, histogram.sum = counts, count, total
+            histograms.setdefault(name, {})[label] = {
+                "count": count,
+                "sum": total,
+                "p50": histogram.quantile(0.5),
+                "p99": histogram.quantile(0.99),
+                "buckets": dict(zip([*map(str, BUCKETS), "+Inf"], counts)),
+            }
+        return json.dumps(
+            {"histograms": histograms, "gauges": snapshot["gauges"]},
+            ensure_ascii=False,
+            indent=2,
+        )
+
+    def to_prometheus(self) -> str:
+        snapshot = self.snapshot()
+        lines = []
+        declared = set()
+        for (name, label), (counts, count, total) in sorted(snapshot["histograms"].items()):
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            label_text = f'{LABELS.get(name, "name")}="{_escape(label)}"'
+            cumulative = 0
+            for bound, bucket_count in zip([*map(str, BUCKETS), "+Inf"], counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{label_text}}} {total}")
+            lines.append(f"{name}_count{{{label_text}}} {count}")
+        for name, value in sorted(snapshot["gauges"].items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+##############################################################################
+# Middleware
+##############################################################################
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+
+    async def __call__(self, handler, event, data):
+        spent = [0.0]
+        token = _db_time.set(spent)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            kind = event.event_type
+            self.metrics.observe("update_seconds", kind, time.perf_counter() - started)
+            self.metrics.observe("update_db_seconds", kind, spent[0])
+            _db_time.reset(token)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+
+    async def __call__(self, handler, event, data):
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            name = data["handler"].callback.__name__
+            self.metrics.observe("handler_seconds", name, time.perf_counter() - started)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+
+    async def __call__(self, make_request, bot, method):
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        finally:
+            self.metrics.observe(
+                "telegram_request_seconds", method.__api_method__, time.perf_counter() - started
+            )
+
+
+##############################################################################
+# SQL
+##############################################################################
+
+
+# Служебные запросы, которые выполняются на каждую операцию записи и ничего не стоят
+_UNTIMED = ("SAVEPOINT", "RELEASE")
+
+
+@lru_cache(maxsize=1024)
+def statement_label(sql: str) -> str | None:
+    # Текст запроса без лишних пробелов. Значения передаются через «?»,
+    # так что число разных меток ограничено числом запросов в коде
+    label = re.sub(r"\s+", " ", sql).strip()[:160]
+    return None if label.upper().startswith(_UNTIMED) else label
+
+
+class TimedCursor(sqlite3.Cursor):
+    """
+    Курсор, замеряющий execute (sql_seconds) и выборку результатов
+    (sql_fetch_seconds) с текстом запроса в метке. fetchone и построчный
+    обход курсора в цикле не замеряются: одна строка обычно уже получена
+    в execute, а замер стоил бы дороже её выборки.
+    """
+
+    metrics = None
+    _label = None
+
+    def _observe(self, started, name="sql_fetch_seconds"):
+        self.metrics.observe(name, self._label, time.perf_counter() - started)
+
+    def execute(self, sql, parameters=()):
+        self._label = statement_label(sql)
+        if self._label is None:
+            return super().execute(sql, parameters)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._observe(started, "sql_seconds")
+
+    def executemany(self, sql, seq_of_parameters):
+        self._label = statement_label(sql)
+        if self._label is None:
+            return super().executemany(sql, seq_of_parameters)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._observe(started, "sql_seconds")
+
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._observe(started)
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        try:
+            return super().fetchmany(self.arraysize if size is None else size)
+        finally:
+            self._observe(started)
+
+
+class TimedConnection(sqlite3.Connection):
+    """
+    Соединение, у которого execute/executemany идут через TimedCursor.
+    metrics задаётся после connect(): sqlite3.connect(..., factory=TimedConnection).
+    """
+
+    metrics = None
+
+    def cursor(self, factory=TimedCursor):
+        cursor = super().cursor(factory)
+        cursor.metrics = self.metrics
+        return cursor
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+##############################################################################
+# HTTP
+##############################################################################
+
+
+async def serve(metrics: Metrics, host: str, port: int):
+    """
+    Поднимает /metrics (Prometheus) и /metrics.json. Возвращает AppRunner,
+    остановка — await runner.cleanup().
+    """
+    from aiohttp import web
+
+    async def prometheus(request):
+        return web.Response(text=metrics.to_prometheus(), content_type="text/plain", charset="utf-8")
+
+    async def as_json(request):
+        return web.Response(text=metrics.to_json(), content_type="application/json")
+
+    app = web.Application()
+    app.router.add_get("/metrics", prometheus)
+    app.router.add_get("/metrics.json", as_json)
+    runner = web.AppRunner(app, handle_signals=False)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
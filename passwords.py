@@ -0,0 +1,146 @@
+"""
+Хеширование паролей (scrypt с солью) вне цикла событий.
+
+Один хеш стоит десятки миллисекунд процессорного времени: посчитанный прямо
+в хендлере, он на это время останавливает бота для всех. Поэтому хеши
+считаются в небольшом пуле потоков (hashlib.scrypt отпускает GIL), а
+одновременно — не больше workers штук: остальные ждут своей очереди. Если
+ждущих больше max_waiting, новый запрос сразу получает PasswordHasherBusy,
+и бот просит повторить попытку позже вместо того, чтобы копить очередь.
+
+Хеш хранится строкой scrypt$n$r$p$соль$хеш. Пароль, сохранённый раньше
+открытым текстом, по-прежнему принимается; после успешного входа его, как
+и хеш с устаревшими параметрами, нужно пересчитать (needs_rehash).
+"""
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Параметры scrypt: память 128 * n * r байт (16 MiB), время ~ n * r * p
+SCRYPT_N = 2**14
+SCRYPT_R = 8
+SCRYPT_P = 1
+
+SALT_BYTES = 16
+HASH_BYTES = 32
+
+# Сколько хешей считать одновременно и сколько запросов может ждать очереди
+HASH_WORKERS = os.cpu_count() or 1
+MAX_WAITING = 1000
+
+PREFIX = "scrypt"
+
+
+class PasswordHasherBusy(Exception):
+    """
+    Очередь на хеширование переполнена.
+    """
+
+
+class PasswordHasher:
+    def __init__(
+        self,
+        n: int = SCRYPT_N,
+        r: int = SCRYPT_R,
+        p: int = SCRYPT_P,
+        workers: int = HASH_WORKERS,
+        max_waiting: int = MAX_WAITING,
+    ):
+        self.n = n
+        self.r = r
+        self.p = p
+        self.max_waiting = max_waiting
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="password")
+        self._slots = asyncio.Semaphore(workers)
+        self.waiting = 0
+        self.max_waited = 0
+        self.hashed = 0
+        self.rejected = 0
+
+    async def hash(self, password: str) -> str:
+        salt = os.urandom(SALT_BYTES)
+        digest = await self._run(_scrypt, password, salt, self.n, self.r, self.p)
+        return "$".join(
+            (PREFIX, str(self.n), str(self.r), str(self.p), _b64(salt), _b64(digest))
+        )
+
+    async def verify(self, password: str, stored: str) -> bool:
+        parsed = _parse(stored)
+        if parsed is None:
+            # Пароль из старой версии бота, открытым текстом
+            return hmac.compare_digest(password.encode(), stored.encode())
+        n, r, p, salt, expected = parsed
+        digest = await self._run(_scrypt, password, salt, n, r, p)
+        return hmac.compare_digest(digest, expected)
+
+    def needs_rehash(self, stored: str) -> bool:
+        """
+        True для открытого текста и для хеша с другими параметрами.
+        """
+        parsed = _parse(stored)
+        return parsed is None or parsed[:3] != (self.n, self.r, self.p)
+
+    async def _run(self, func, *args):
+        if self.waiting >= self.max_waiting:
+            self.rejected += 1
+            raise PasswordHasherBusy()
+        self.waiting += 1
+        self.max_waited = max(self.max_waited, self.waiting)
+        try:
+            # Очередь — на семафоре, а не внутри пула: ожидающий запрос
+            # ничего не занимает, и его можно отменить
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self._pool, func, *args)
+        finally:
+            self._slots.release()
+        self.hashed += 1
+        return result
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        return {
+            "waiting": self.waiting,
+            "max_waited": self.max_waited,
+            "hashed": self.hashed,
+            "rejected": self.rejected,
+        }
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(
+        password.encode(),
+        salt=salt,
+        n=n,
+        r=r,
+        p=p,
+        # Нужно 128 * r * (n + p + 2) байт; по умолчанию OpenSSL даёт 32 MiB
+        maxmem=128 * r * (n + p + 2) + 2**20,
+        dklen=HASH_BYTES,
+    )
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii")
+
+
+def _parse(stored: str):
+    parts = stored.split("$")
+    if len(parts) != 6 or parts[0] != PREFIX:
+        return None
+    try:
+        n, r, p = int(parts[1]), int(parts[2]), int(parts[3])
+        salt = base64.b64decode(parts[4], validate=True)
+        digest = base64.b64decode(parts[5], validate=True)
+    except ValueError:
+        return None
+    return n, r, p, salt, digest
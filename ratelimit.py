@@ -0,0 +1,306 @@
+"""
+Ограничение частоты входящих обновлений и исходящих сообщений.
+
+ThrottlingMiddleware — outer-middleware диспетчера: у каждого пользователя и
+чата своё «ведро жетонов», обновления сверх лимита отбрасываются до
+хендлеров и базы.
+
+SendScheduler — middleware сессии бота: отправки в чат идут не чаще лимита
+на чат и общего бюджета бота (~30 сообщений в секунду), лишние ждут своей
+очереди. Если Telegram всё же ответил 429 (RetryAfter), ждут все отправки,
+а запрос повторяется с нарастающей паузой. Простые текстовые сообщения,
+которые ждут отправки в один чат, склеиваются в одно: его отправляет
+отдельная задача, так что отмена одного из отправителей не отменяет
+остальных, а его текст, если сообщение ещё не ушло, из склейки убирается.
+"""
+
+import asyncio
+import itertools
+import logging
+import time
+
+from aiogram import BaseMiddleware
+from aiogram.client.default import Default
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from cache import MISSING, LRUCache
+
+# Входящие: сколько обновлений в секунду и какой всплеск разрешён
+USER_RATE = 1.0
+USER_BURST = 5
+CHAT_RATE = 3.0
+CHAT_BURST = 10
+
+# Исходящие: общий бюджет бота (у Telegram около 30 в секунду в скользящем
+# окне, поэтому с запасом и без всплеска) и лимит на один чат
+SEND_RATE = 28.0
+SEND_BURST = 1
+CHAT_SEND_RATE = 1.0
+CHAT_SEND_BURST = 5
+
+# Отправка, которой пришлось бы ждать дольше, отбрасывается
+MAX_SEND_DELAY = 30.0
+
+# Сколько раз повторять запрос после 429 и минимальная пауза перед повтором
+MAX_RETRIES = 5
+RETRY_BACKOFF = 1.0
+
+# Сколько вёдер держать в памяти; вытесненное ведро и так было бы полным
+MAX_BUCKETS = 100_000
+
+# Предел длины сообщения Telegram
+MESSAGE_LIMIT = 4096
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self.tokens = burst
+        self.updated = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self) -> bool:
+        """
+        Забирает жетон, если он есть.
+        """
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def reserve(self, max_delay: float):
+        """
+        Забирает жетон, при необходимости в долг. Возвращает, сколько секунд
+        ждать до его появления, или None (и ничего не забирает), если дольше max_delay.
+        """
+        self._refill()
+        delay = max(0.0, (1 - self.tokens) / self.rate)
+        if delay > max_delay:
+            return None
+        self.tokens -= 1
+        return delay
+
+
+class _Buckets:
+    """
+    Вёдра по ключу (user_id, chat_id). Ведро, которое не трогали столько,
+    сколько нужно на полное наполнение, забывается: новое будет таким же.
+    """
+
+    def __init__(self, rate, burst, clock, extra_ttl=0.0, maxsize=MAX_BUCKETS):
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._buckets = LRUCache(maxsize, burst / rate + extra_ttl, clock)
+
+    def __getitem__(self, key) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is MISSING:
+            bucket = TokenBucket(self.rate, self.burst, self._clock)
+        # put продлевает срок жизни: ведро, взятое в долг, не должно пропасть
+        self._buckets.put(key, bucket)
+        return bucket
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    def __init__(
+        self,
+        user_rate: float = USER_RATE,
+        user_burst: float = USER_BURST,
+        chat_rate: float = CHAT_RATE,
+        chat_burst: float = CHAT_BURST,
+        clock=time.monotonic,
+    ):
+        self.users = _Buckets(user_rate, user_burst, clock)
+        self.chats = _Buckets(chat_rate, chat_burst, clock)
+        self.passed = 0
+        self.dropped = 0
+
+    async def __call__(self, handler, event, data):
+        # event_from_user и event_chat заполняет UserContextMiddleware aiogram
+        user = data.get("event_from_user")
+        chat = data.get("event_chat")
+        if (user is not None and not self.users[user.id].take()) or (
+            chat is not None and not self.chats[chat.id].take()
+        ):
+            self.dropped += 1
+            return None
+        self.passed += 1
+        return await handler(event, data)
+
+    def stats(self) -> dict:
+        return {"passed": self.passed, "dropped": self.dropped}
+
+
+def _is_plain(bot, method) -> bool:
+    if not isinstance(method, SendMessage):
+        return False
+    parse_mode = method.parse_mode
+    if isinstance(parse_mode, Default):
+        parse_mode = bot.default[parse_mode.name]
+    return method.reply_markup is None and method.entities is None and not parse_mode
+
+
+class _Pending:
+    """
+    Склейка простых сообщений в один чат: тексты отправителей в порядке
+    прихода и задача, которая её отправит.
+    """
+
+    def __init__(self, method: SendMessage):
+        self.method = method
+        self.parts = {}
+        self.task = None
+        # Текст уже собран и отправляется: менять его поздно
+        self.sealed = False
+
+    def fits(self, text: str) -> bool:
+        length = sum(len(part) + 2 for part in self.parts.values())
+        return not self.sealed and length + len(text) <= MESSAGE_LIMIT
+
+    def add(self, text: str):
+        token = object()
+        self.parts[token] = text
+        return token
+
+    def build(self) -> SendMessage:
+        self.sealed = True
+        text = "\n\n".join(self.parts.values())
+        if text == self.method.text:
+            return self.method
+        # Сообщения отправителей не меняются: склейка — новый запрос
+        return self.method.model_copy(update={"text": text})
+
+
+class SendScheduler(BaseRequestMiddleware):
+    def __init__(
+        self,
+        rate: float = SEND_RATE,
+        burst: float = SEND_BURST,
+        chat_rate: float = CHAT_SEND_RATE,
+        chat_burst: float = CHAT_SEND_BURST,
+        max_delay: float = MAX_SEND_DELAY,
+        max_retries: int = MAX_RETRIES,
+        clock=time.monotonic,
+        sleep=asyncio.sleep,
+    ):
+        self.bucket = TokenBucket(rate, burst, clock)
+        self.chats = _Buckets(chat_rate, chat_burst, clock, extra_ttl=max_delay)
+        self.max_delay = max_delay
+        self.max_retries = max_retries
+        self._clock = clock
+        self._sleep = sleep
+        # До какого момента Telegram просил не отправлять (после 429)
+        self._paused_until = 0.0
+        # Чат -> _Pending: простое сообщение, ждущее отправки, к которому
+        # можно приклеить следующее
+        self._waiting = {}
+        self.queued = 0
+        self.max_queued = 0
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.retries = 0
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None or not method.__api_method__.startswith(
+            ("send", "edit", "copy", "forward")
+        ):
+            return await make_request(bot, method)
+
+        if not _is_plain(bot, method):
+            # Следующие простые сообщения не должны обогнать это, приклеившись к более раннему
+            self._waiting.pop(chat_id, None)
+            return await self._send(make_request, bot, chat_id, method)
+
+        pending = self._waiting.get(chat_id)
+        if pending is not None and pending.fits(method.text):
+            self.coalesced += 1
+        else:
+            pending = _Pending(method)
+            self._waiting[chat_id] = pending
+            pending.task = asyncio.ensure_future(
+                self._send(make_request, bot, chat_id, pending=pending)
+            )
+            pending.task.add_done_callback(lambda task: self._forget(chat_id, pending))
+        part = pending.add(method.text)
+        try:
+            return await asyncio.shield(pending.task)
+        except asyncio.CancelledError:
+            # Отменили этого отправителя: пока сообщение не ушло, его текст
+            # убирается, а склейка без текстов не отправляется вовсе
+            if not pending.sealed:
+                del pending.parts[part]
+                if not pending.parts:
+                    pending.task.cancel()
+            raise
+
+    def _forget(self, chat_id, pending: _Pending):
+        if self._waiting.get(chat_id) is pending:
+            del self._waiting[chat_id]
+        # Если все отправители отменены, исключение задачи некому получить
+        if not pending.task.cancelled():
+            pending.task.exception()
+
+    async def _send(self, make_request, bot, chat_id, method=None, pending=None):
+        self.queued += 1
+        self.max_queued = max(self.max_queued, self.queued)
+        try:
+            # Сначала очередь чата, затем общий бюджет: жетон бота берётся
+            # только тогда, когда сообщение действительно готово уйти
+            for bucket in (self.chats[chat_id], self.bucket):
+                delay = bucket.reserve(self.max_delay)
+                if delay is None:
+                    self.dropped += 1
+                    logging.warning("Сообщение в чат %s отброшено: очередь переполнена", chat_id)
+                    return None
+                await self._sleep(delay)
+            await self._wait_pause()
+        finally:
+            self.queued -= 1
+
+        # Дальше текст не меняется: новые сообщения в этот чат ждут отдельно
+        if pending is not None:
+            if self._waiting.get(chat_id) is pending:
+                del self._waiting[chat_id]
+            method = pending.build()
+
+        for attempt in itertools.count():
+            try:
+                result = await make_request(bot, method)
+            except TelegramRetryAfter as exc:
+                if attempt >= self.max_retries:
+                    raise
+                self.retries += 1
+                # Лимит Telegram общий для бота: паузу выдерживают все отправки
+                pause = max(exc.retry_after, RETRY_BACKOFF * 2**attempt)
+                self._paused_until = max(self._paused_until, self._clock() + pause)
+                logging.warning("Telegram просит подождать %s с (попытка %s)", pause, attempt + 1)
+                await self._wait_pause()
+            else:
+                self.sent += 1
+                return result
+
+    async def _wait_pause(self):
+        while (delay := self._paused_until - self._clock()) > 0:
+            await self._sleep(delay)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "retries": self.retries,
+        }
@@ -0,0 +1,199 @@
+"""
+Напоминания о возврате книг.
+
+ReminderScheduler — фоновая задача рядом с приёмом обновлений. Таблицу
+выдач она не опрашивает: у каждой открытой выдачи есть next_reminder_at,
+и по индексу (см. db.py) за одно обращение находится ближайшее
+напоминание — до него задача и спит. Проснувшись, она забирает
+наступившие напоминания пачками, отправляет их не быстрее rate сообщений в
+секунду, чтобы ответам на нажатия оставался бюджет Telegram, и назначает
+следующее: за REMIND_BEFORE до срока — «скоро срок», в момент срока и
+дальше раз в OVERDUE_EVERY — «книга просрочена».
+"""
+
+import asyncio
+import logging
+import time
+from contextlib import suppress
+
+from aiogram.exceptions import TelegramAPIError, TelegramNetworkError, TelegramRetryAfter
+
+from db import REMIND_BEFORE
+from ratelimit import TokenBucket
+
+# Сколько напоминаний забирать из базы за раз
+REMINDER_BATCH = 100
+
+# Сколько напоминаний в секунду отправлять
+REMINDER_RATE = 10.0
+
+# Насколько раньше времени можно отправить напоминание: соседние по времени
+# уходят одной пачкой, а задача не просыпается ради каждого по отдельности
+REMINDER_SLACK = 300
+
+# Как часто напоминать о просроченной книге
+OVERDUE_EVERY = 86400
+
+# Через сколько повторить напоминание, которое не ушло из-за сети; отсчёт
+# идёт от конца окна slack, иначе тот же проход забрал бы его снова
+RETRY_DELAY = 60
+
+# Выдачи создают и другие процессы (см. sharding.py): даже без напоминаний
+# в расписании база проверяется не реже этого
+MAX_SLEEP = 3600.0
+
+
+def next_reminder(due_at: int, now: int, slack: float = 0) -> int:
+    # Напоминание, отправленное на slack раньше, считается отправленным вовремя
+    now += slack
+    if now < due_at - REMIND_BEFORE:
+        return due_at - REMIND_BEFORE
+    if now < due_at:
+        return due_at
+    return int(now) + OVERDUE_EVERY
+
+
+def reminder_text(title: str, due_at: int, now: int, slack: float = 0) -> str:
+    date = time.strftime("%d.%m.%Y", time.localtime(due_at))
+    if now + slack < due_at:
+        return f"📅 Напоминание: книгу «{title}» нужно вернуть до {date}."
+    return f"⏰ Срок возврата книги «{title}» истёк {date}. Пожалуйста, верните её."
+
+
+class ReminderScheduler:
+    def __init__(
+        self,
+        db,
+        bot,
+        batch_size: int = REMINDER_BATCH,
+        rate: float = REMINDER_RATE,
+        slack: float = REMINDER_SLACK,
+        max_sleep: float = MAX_SLEEP,
+        clock=time.time,
+        sleep=asyncio.sleep,
+    ):
+        self.db = db
+        self.bot = bot
+        self.batch_size = batch_size
+        self.slack = slack
+        self.max_sleep = max_sleep
+        self.bucket = TokenBucket(rate, 1, clock)
+        self._clock = clock
+        self._sleep = sleep
+        self._wakeup = asyncio.Event()
+        # До какого момента спит задача. Пока она не спит — бесконечность:
+        # новая выдача могла разминуться с чтением расписания, так что
+        # цикл проверит его ещё раз
+        self._wake_at = float("inf")
+        self._task = None
+        self.wakeups = 0
+        self.batches = 0
+        self.sent = 0
+        self.failed = 0
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    def schedule(self, at: float):
+        """
+        Появилось напоминание на момент at: если оно раньше того, до которого
+        задача спит, она просыпается и пересматривает расписание.
+        """
+        if at < self._wake_at:
+            self._wakeup.set()
+
+    async def run(self):
+        while True:
+            self._wakeup.clear()
+            self.wakeups += 1
+            try:
+                await self.run_due()
+                next_at = await self.db.next_reminder_at()
+            except Exception:
+                logging.exception("Ошибка при отправке напоминаний")
+                next_at = None
+            delay = self.max_sleep
+            if next_at is not None:
+                delay = min(delay, next_at - self._clock())
+            if delay > 0:
+                self._wake_at = self._clock() + delay
+                try:
+                    await self._wait(delay)
+                finally:
+                    self._wake_at = float("inf")
+
+    async def run_due(self) -> int:
+        """
+        Отправляет все наступившие напоминания. Возвращает их число.
+        """
+        total = 0
+        # Окно прохода фиксируется в начале: всё, что наступит за время прохода,
+        # заберёт следующий, так что проход заканчивается и при сбоях отправки
+        until = int(self._clock() + self.slack)
+        while True:
+            now = int(self._clock())
+            rows = await self.db.due_reminders(until, self.batch_size)
+            if not rows:
+                return total
+            self.batches += 1
+            await self.db.reschedule_reminders(await self._send_batch(rows, now))
+            total += len(rows)
+
+    async def _send_batch(self, rows, now):
+        # Отправки идут параллельно, но начинаются не чаще rate в секунду
+        sends = []
+        for loan_id, user_id, title, due_at in rows:
+            await self._sleep(self.bucket.reserve(float("inf")))
+            sends.append(asyncio.create_task(self._send(user_id, title, due_at, now)))
+        delivered = await asyncio.gather(*sends)
+        # Следующее напоминание назначается и тем, кто заблокировал бота:
+        # иначе эта выдача возвращалась бы в каждую пачку
+        return [
+            (
+                next_reminder(due_at, now, self.slack) if ok
+                else int(now + self.slack) + RETRY_DELAY,
+                loan_id,
+            )
+            for (loan_id, _, _, due_at), ok in zip(rows, delivered)
+        ]
+
+    async def _send(self, user_id, title, due_at, now) -> bool:
+        """
+        False, если напоминание стоит повторить позже (сбой сети).
+        """
+        try:
+            await self.bot.send_message(user_id, reminder_text(title, due_at, now, self.slack))
+        except (TelegramNetworkError, TelegramRetryAfter) as exc:
+            self.failed += 1
+            logging.warning("Напоминание пользователю %s не отправлено: %s", user_id, exc)
+            return False
+        except TelegramAPIError as exc:
+            self.failed += 1
+            logging.warning("Напоминание пользователю %s не доставлено: %s", user_id, exc)
+        else:
+            self.sent += 1
+        return True
+
+    async def _wait(self, delay: float):
+        sleeper = asyncio.ensure_future(self._sleep(delay))
+        waker = asyncio.ensure_future(self._wakeup.wait())
+        try:
+            await asyncio.wait({sleeper, waker}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            sleeper.cancel()
+            waker.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "wakeups": self.wakeups,
+            "batches": self.batches,
+            "sent": self.sent,
+            "failed": self.failed,
+        }
@@ -0,0 +1,312 @@
+"""
+Отчёты для администраторов: история выдач, самые популярные книги,
+читатели с книгами на руках и просрочки.
+
+Отчёт собирается в отдельном потоке на своём соединении с базой, поэтому
+не занимает ни цикл событий, ни потоки-читатели Database. Сводные таблицы
+считаются агрегирующими запросами по индексам, историю выдач поток читает
+пачками по ключу (loans.id > ?) и сразу пишет в файл: в памяти одновременно
+не больше одной пачки, сколько бы выдач ни было в базе.
+
+Форматы:
+- xlsx — рабочая книга openpyxl в режиме write-only (строки уходят во
+  временные файлы, а не копятся в памяти). На листе Excel не больше
+  1 048 576 строк, так что в историю попадают последние выдачи;
+- csv — zip-архив с CSV-файлом на каждую таблицу, история целиком.
+"""
+
+import asyncio
+import csv
+import io
+import os
+import sqlite3
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from db import DB_PATH
+
+# Сколько выдач истории читать из базы за раз
+REPORT_CHUNK = 10_000
+
+# Сколько самых популярных книг включать в отчёт
+TOP_BOOKS = 100
+
+# Строк истории в xlsx: лист Excel минус строка заголовка
+XLSX_HISTORY_ROWS = 1_048_575
+
+FORMATS = ("xlsx", "csv")
+
+
+class ReportBusy(Exception):
+    """
+    Предыдущий отчёт ещё не готов.
+    """
+
+
+class ReportExporter:
+    def __init__(
+        self,
+        path: str = DB_PATH,
+        chunk_size: int = REPORT_CHUNK,
+        xlsx_history_rows: int = XLSX_HISTORY_ROWS,
+        clock=time.time,
+    ):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.xlsx_history_rows = xlsx_history_rows
+        self._clock = clock
+        # Отчёты строятся по одному: второй параллельно только делил бы диск и процессор
+        self._pool = ThreadPoolExecutor(1, thread_name_prefix="report")
+        self.running = False
+        self.built = 0
+        self.rows = 0
+        self.last_seconds = 0.0
+
+    async def export(self, fmt: str, directory: str | None = None) -> str:
+        """
+        Строит отчёт в формате fmt ("xlsx" или "csv") во временный файл и
+        возвращает путь к нему; удалить файл — забота вызывающего.
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f"Неизвестный формат отчёта: {fmt}")
+        if self.running:
+            raise ReportBusy()
+        self.running = True
+        try:
+            loop = asyncio.get_running_loop()
+            started = time.perf_counter()
+            path, rows = await loop.run_in_executor(
+                self._pool, self._build, fmt, directory
+            )
+            self.last_seconds = time.perf_counter() - started
+        finally:
+            self.running = False
+        self.built += 1
+        self.rows += rows
+        return path
+
+    def _build(self, fmt, directory):
+        suffix = ".zip" if fmt == "csv" else f".{fmt}"
+        fd, path = tempfile.mkstemp(prefix="report-", suffix=suffix, dir=directory)
+        os.close(fd)
+        conn = sqlite3.connect(self.path)
+        try:
+            conn.execute("PRAGMA query_only = 1")
+            now = int(self._clock())
+            if fmt == "xlsx":
+                tables = report_tables(
+                    conn, now, _excel_date, self.chunk_size, self.xlsx_history_rows
+                )
+                rows = write_xlsx(path, tables)
+            else:
+                tables = report_tables(conn, now, _text_date, self.chunk_size)
+                rows = write_csv_zip(path, tables)
+        except BaseException:
+            os.remove(path)
+            raise
+        finally:
+            conn.close()
+        return path, rows
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        return {
+            "running": int(self.running),
+            "built": self.built,
+            "rows": self.rows,
+            "last_seconds": self.last_seconds,
+        }
+
+
+def _excel_date(timestamp):
+    return None if timestamp is None else datetime.fromtimestamp(timestamp)
+
+
+def _text_date(timestamp):
+    if timestamp is None:
+        return None
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime(timestamp))
+
+
+##############################################################################
+# Таблицы отчёта
+#
+# Каждая таблица — (имя, заголовок, итератор строк). Строки читаются из
+# базы только тогда, когда их забирает запись в файл.
+##############################################################################
+
+
+def report_tables(conn, now: int, date, chunk_size: int = REPORT_CHUNK, history_limit=None):
+    yield "Сводка", ("Показатель", "Значение"), summary_rows(conn, now)
+    yield (
+        "Популярные книги",
+        ("Место", "Название", "Автор", "Выдач"),
+        popular_rows(conn),
+    )
+    yield (
+        "Читатели",
+        ("Читатель", "Книг на руках", "Из них просрочено", "Ближайший срок"),
+        borrower_rows(conn, now, date),
+    )
+    yield (
+        "Выдачи",
+        ("№", "Название", "Читатель", "Выдана", "Срок", "Возвращена", "Статус"),
+        loan_history_rows(conn, now, date, chunk_size, history_limit),
+    )
+
+
+def summary_rows(conn, now: int):
+    day = 86400
+    (books, available) = conn.execute(
+        "SELECT COUNT(*), COALESCE(SUM(available), 0) FROM books"
+    ).fetchone()
+    (users,) = conn.execute("SELECT COUNT(*) FROM users").fetchone()
+    (loans,) = conn.execute("SELECT COUNT(*) FROM loans").fetchone()
+    # Дальше — только открытые выдачи: их немного, и частичный индекс
+    # idx_loans_open содержит ровно их
+    (open_loans, overdue, week, month, readers) = conn.execute(
+        """
+        SELECT COUNT(*),
+               COALESCE(SUM(due_at < ?), 0),
+               COALESCE(SUM(due_at < ?), 0),
+               COALESCE(SUM(due_at < ?), 0),
+               COUNT(DISTINCT user_id)
+        FROM loans INDEXED BY idx_loans_open
+        WHERE returned_at IS NULL
+        """,
+        (now, now - 7 * day, now - 30 * day),
+    ).fetchone()
+    yield "Книг в каталоге", books
+    yield "Свободно", available
+    yield "Читателей", users
+    yield "Читателей с книгами", readers
+    yield "Выдач всего", loans
+    yield "Книг на руках", open_loans
+    yield "Просрочено", overdue
+    yield "Просрочено больше 7 дней", week
+    yield "Просрочено больше 30 дней", month
+
+
+def popular_rows(conn, limit: int = TOP_BOOKS):
+    # Подсчёт идёт по индексу idx_loans_book, сама таблица выдач не читается
+    rows = conn.execute(
+        """
+        SELECT books.title, books.author, top.loans
+        FROM (
+            SELECT book_id, COUNT(*) AS loans FROM loans
+            GROUP BY book_id ORDER BY loans DESC LIMIT ?
+        ) AS top
+        JOIN books ON books.id = top.book_id
+        ORDER BY top.loans DESC, books.id
+        """,
+        (limit,),
+    )
+    for place, (title, author, loans) in enumerate(rows, start=1):
+        yield place, title, author, loans
+
+
+def borrower_rows(conn, now: int, date):
+    rows = conn.execute(
+        """
+        SELECT users.name || ' ' || users.surname, held.books, held.overdue, held.first_due
+        FROM (
+            SELECT user_id, COUNT(*) AS books, SUM(due_at < ?) AS overdue,
+                   MIN(due_at) AS first_due
+            FROM loans INDEXED BY idx_loans_open
+            WHERE returned_at IS NULL
+            GROUP BY user_id
+        ) AS held
+        JOIN users ON users.user_id = held.user_id
+        ORDER BY held.books DESC, held.first_due
+        """,
+        (now,),
+    )
+    for reader, books, overdue, first_due in rows:
+        yield reader, books, overdue, date(first_due)
+
+
+def loan_history_rows(conn, now: int, date, chunk_size: int = REPORT_CHUNK, limit=None):
+    """
+    Выдачи по возрастанию номера, пачками по ключу. limit — взять только
+    последние limit выдач.
+    """
+    cursor = 0
+    if limit is not None:
+        row = conn.execute(
+            "SELECT id FROM loans ORDER BY id DESC LIMIT 1 OFFSET ?", (limit,)
+        ).fetchone()
+        cursor = row[0] if row else 0
+    while True:
+        rows = conn.execute(
+            """
+            SELECT loans.id, books.title, users.name || ' ' || users.surname,
+                   loans.borrowed_at, loans.due_at, loans.returned_at
+            FROM loans
+            JOIN books ON books.id = loans.book_id
+            LEFT JOIN users ON users.user_id = loans.user_id
+            WHERE loans.id > ?
+            ORDER BY loans.id
+            LIMIT ?
+            """,
+            (cursor, chunk_size),
+        ).fetchall()
+        if not rows:
+            return
+        for loan_id, title, reader, borrowed_at, due_at, returned_at in rows:
+            if returned_at is not None:
+                status = "возвращена"
+            elif due_at < now:
+                status = "просрочена"
+            else:
+                status = "на руках"
+            yield loan_id, title, reader, date(borrowed_at), date(due_at), date(returned_at), status
+        cursor = rows[-1][0]
+
+
+##############################################################################
+# Запись в файл
+##############################################################################
+
+
+def write_xlsx(path: str, tables) -> int:
+    """
+    Пишет таблицы на отдельные листы. Возвращает число строк данных.
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    total = 0
+    for name, header, rows in tables:
+        sheet = workbook.create_sheet(name)
+        sheet.append(header)
+        for row in rows:
+            sheet.append(row)
+            total += 1
+    workbook.save(path)
+    return total
+
+
+def write_csv_zip(path: str, tables) -> int:
+    """
+    Пишет каждую таблицу в свой CSV внутри zip-архива. Возвращает число строк данных.
+    """
+    total = 0
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, header, rows in tables:
+            # utf-8-sig: Excel открывает такой CSV с кириллицей без вопросов
+            with io.TextIOWrapper(
+                archive.open(f"{name}.csv", "w", force_zip64=True),
+                encoding="utf-8-sig",
+                newline="",
+            ) as f:
+                writer = csv.writer(f)
+                writer.writerow(header)
+                for row in rows:
+                    writer.writerow(row)
+                    total += 1
+    return total
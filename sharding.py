@@ -0,0 +1,252 @@
+"""
+Обработка обновлений в нескольких процессах.
+
+Основной процесс только принимает обновления (long polling или вебхук) и
+раздаёт их N процессам-обработчикам по user_id: все обновления одного
+пользователя попадают в один процесс и там выполняются строго по очереди,
+поэтому его шаги FSM не перемешиваются. Разные пользователи обрабатываются
+параллельно. Все процессы работают с одной базой SQLite в режиме WAL:
+читают одновременно, а запись SQLite сам выстраивает в очередь
+(busy_timeout, см. db.py), так что изменения книг остаются согласованными.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import queue
+import secrets
+import signal
+from contextlib import suppress
+
+from aiogram import Bot
+from aiogram.methods import TelegramMethod
+from aiohttp import web
+
+from webhook import MAX_IN_FLIGHT
+
+# Сколько ждать обновлений в одном запросе getUpdates
+POLLING_TIMEOUT = 30
+
+
+def update_user_id(update: dict):
+    """
+    user_id автора обновления (сообщение, нажатие кнопки и т.п.) или None.
+    """
+    for event in update.values():
+        if isinstance(event, dict):
+            user = event.get("from") or event.get("user")
+            if user:
+                return user["id"]
+            chat = event.get("chat")
+            if chat:
+                return chat["id"]
+    return None
+
+
+def shard_of(update: dict, workers: int) -> int:
+    user_id = update_user_id(update)
+    key = user_id if user_id is not None else update.get("update_id", 0)
+    return key % workers
+
+
+##############################################################################
+# Процесс-обработчик
+##############################################################################
+
+
+def worker_main(index: int, updates, results, setup):
+    """
+    Точка входа процесса-обработчика. setup(index) — корутинная функция,
+    возвращающая (dispatcher, bot, close); close() вызывается после
+    обработки всех полученных обновлений.
+    """
+    # Остановкой управляет основной процесс, Ctrl+C его не касается
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(_serve(index, updates, results, setup))
+
+
+async def _serve(index, updates, results, setup):
+    dispatcher, bot, close = await setup(index)
+    results.put(("ready", index))
+
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(MAX_IN_FLIGHT)
+    # Последняя задача каждого пользователя: следующая ждёт её завершения
+    last = {}
+    tasks = set()
+    handled = 0
+
+    def done(user_id, task):
+        nonlocal handled
+        handled += 1
+        tasks.discard(task)
+        slots.release()
+        if last.get(user_id) is task:
+            del last[user_id]
+        if not task.cancelled() and task.exception() is not None:
+            logging.error("Ошибка обработки обновления", exc_info=task.exception())
+
+    while True:
+        update = await loop.run_in_executor(None, updates.get)
+        if update is None:
+            break
+        await slots.acquire()
+        user_id = update_user_id(update)
+        task = asyncio.create_task(_feed(dispatcher, bot, update, last.get(user_id)))
+        if user_id is not None:
+            last[user_id] = task
+        tasks.add(task)
+        task.add_done_callback(lambda task, user_id=user_id: done(user_id, task))
+
+    if tasks:
+        await asyncio.wait(tasks)
+    results.put(("done", index, handled, await close()))
+
+
+async def _feed(dispatcher, bot, update, previous):
+    if previous is not None:
+        await asyncio.wait([previous])
+    result = await dispatcher.feed_raw_update(bot=bot, update=update)
+    if isinstance(result, TelegramMethod):
+        await dispatcher.silent_call_request(bot=bot, result=result)
+
+
+##############################################################################
+# Основной процесс
+##############################################################################
+
+
+class Shards:
+    def __init__(self, workers: int, setup):
+        context = multiprocessing.get_context("spawn")
+        self.queues = [context.Queue() for _ in range(workers)]
+        self.results = context.Queue()
+        self.processes = [
+            context.Process(
+                target=worker_main,
+                args=(index, updates, self.results, setup),
+                name=f"shard-{index}",
+                daemon=True,
+            )
+            for index, updates in enumerate(self.queues)
+        ]
+
+    async def start(self):
+        """
+        Запускает процессы и ждёт, пока каждый подключится к базе.
+        """
+        for process in self.processes:
+            process.start()
+        await self._collect("ready")
+
+    def submit(self, update: dict):
+        self.queues[shard_of(update, len(self.queues))].put(update)
+
+    async def stop(self):
+        """
+        Дожидается обработки всех отправленных обновлений и завершает процессы.
+        Возвращает список (index, handled, stats) от каждого процесса.
+        """
+        for updates in self.queues:
+            updates.put(None)
+        reports = await self._collect("done")
+        loop = asyncio.get_running_loop()
+        for process in self.processes:
+            await loop.run_in_executor(None, process.join)
+        return sorted(report[1:] for report in reports)
+
+    async def _collect(self, kind):
+        loop = asyncio.get_running_loop()
+        reports = []
+        while len(reports) < len(self.processes):
+            try:
+                report = await loop.run_in_executor(None, self.results.get, True, 1.0)
+            except queue.Empty:
+                failed = [p.name for p in self.processes if p.exitcode not in (None, 0)]
+                if failed:
+                    raise RuntimeError(f"Процессы-обработчики завершились с ошибкой: {failed}")
+                continue
+            if report[0] == kind:
+                reports.append(report)
+        return reports
+
+
+async def _poll(bot: Bot, shards: Shards):
+    offset = None
+    while True:
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=POLLING_TIMEOUT)
+        except Exception:
+            logging.exception("Ошибка getUpdates")
+            await asyncio.sleep(1)
+            continue
+        for update in updates:
+            shards.submit(update.model_dump(mode="json", by_alias=True, exclude_none=True))
+            offset = update.update_id + 1
+
+
+def _webhook_app(shards: Shards, path: str, secret_token: str):
+    if not secret_token:
+        raise ValueError("Вебхук без секретного токена принимал бы чужие обновления")
+
+    async def handle(request: web.Request):
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not secrets.compare_digest(token, secret_token):
+            return web.Response(body="Unauthorized", status=401)
+        shards.submit(await request.json())
+        return web.json_response({})
+
+    app = web.Application()
+    app.router.add_post(path, handle)
+    return app
+
+
+async def run_sharded(
+    bot: Bot,
+    workers: int,
+    setup,
+    url: str | None = None,
+    host: str = "127.0.0.1",
+    port: int = 8080,
+    path: str = "/webhook",
+    secret_token: str | None = None,
+):
+    """
+    Запускает workers процессов-обработчиков и раздаёт им обновления из
+    long polling или, если задан url, из вебхука (тогда нужен и secret_token).
+    Работает до SIGINT/SIGTERM, после чего дожидается обработки уже
+    принятых обновлений.
+    """
+    if url and not secret_token:
+        raise ValueError("Вебхук без секретного токена принимал бы чужие обновления")
+    shards = Shards(workers, setup)
+    await shards.start()
+    logging.info("Запущено обработчиков: %s", workers)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        with suppress(NotImplementedError):
+            loop.add_signal_handler(sig, stop.set)
+
+    runner = None
+    polling = None
+    try:
+        if url:
+            runner = web.AppRunner(_webhook_app(shards, path, secret_token), handle_signals=False)
+            await runner.setup()
+            await web.TCPSite(runner, host, port).start()
+            await bot.set_webhook(url, secret_token=secret_token, drop_pending_updates=False)
+        else:
+            await bot.delete_webhook(drop_pending_updates=False)
+            polling = asyncio.create_task(_poll(bot, shards))
+        await stop.wait()
+    finally:
+        if polling is not None:
+            polling.cancel()
+            with suppress(asyncio.CancelledError):
+                await polling
+        if runner is not None:
+            await runner.cleanup()
+        await shards.stop()
+        await bot.session.close()
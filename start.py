@@ -1,98 +1,110 @@
 import asyncio
 import logging
-import sqlite3
+import os
+import time
+from contextlib import suppress
 
-from aiogram import Bot, Dispatcher, F, Router, types
+from aiogram import Bot, Dispatcher, F, types
+from aiogram.exceptions import TelegramAPIError, TelegramNetworkError, TelegramRetryAfter
+from aiogram.filters.callback_data import CallbackData
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.types import KeyboardButton, ReplyKeyboardMarkup
-
-from config import API_TOKEN
+from aiogram.types import (
+    FSInputFile,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    KeyboardButton,
+    ReplyKeyboardMarkup,
+)
 
-# Если вы хотите за один раз загрузить книги из book.py в БД:
-# from book import books as initial_books
+from book import books as initial_books
+from book_index import BookIndex
+from buttons import ButtonRouter
+from cache import MISSING, LRUCache
+from config import (
+    ADMIN_IDS,
+    API_TOKEN,
+    BOOK_INDEX,
+    METRICS_HOST,
+    METRICS_PORT,
+    PASSWORD_SCRYPT_N,
+    PASSWORD_SCRYPT_P,
+    PASSWORD_SCRYPT_R,
+    PASSWORD_WORKERS,
+    WEBHOOK_HOST,
+    WEBHOOK_PATH,
+    WEBHOOK_PORT,
+    WEBHOOK_SECRET,
+    WEBHOOK_URL,
+    WORKERS,
+)
+from db import DB_PATH, LOAN_DAYS, REMIND_BEFORE, Database
+from metrics import (
+    ApiMetricsMiddleware,
+    HandlerMetricsMiddleware,
+    Metrics,
+    UpdateMetricsMiddleware,
+    serve,
+)
+from passwords import PasswordHasher, PasswordHasherBusy
+from ratelimit import SendScheduler, ThrottlingMiddleware
+from reminders import ReminderScheduler
+from reports import ReportBusy, ReportExporter
+from sharding import run_sharded
+from storage import SQLiteStorage
+from webhook import run_webhook
 
 logging.basicConfig(level=logging.INFO)
 
 bot = Bot(token=API_TOKEN)
-dp = Dispatcher()
-router = Router()
+# Кнопки и команды находятся по тексту за одно обращение к словарю (см. buttons.py)
+router = ButtonRouter()
 
 ##############################################################################
 # БЛОК РАБОТЫ С БАЗОЙ ДАННЫХ
 ##############################################################################
 
-# Подключаемся к базе
-conn = sqlite3.connect("database.sqlite3")
-cursor = conn.cursor()
-
-# Создаём таблицу пользователей (если не существует)
-cursor.execute(
-    """
-    CREATE TABLE IF NOT EXISTS users (
-        user_id INTEGER PRIMARY KEY,
-        name TEXT,
-        surname TEXT,
-        password TEXT,
-        borrowed_books TEXT
-    )
-"""
+# Все запросы к базе выполняются в отдельных потоках (см. db.py),
+# соединение открывается в main()
+metrics = Metrics()
+# Каталог в памяти — только для одного процесса: книги, взятые через другие
+# процессы-обработчики, он бы не увидел
+book_index = BookIndex() if BOOK_INDEX and WORKERS == 1 else None
+db = Database(DB_PATH, metrics=metrics, book_index=book_index)
+# Состояния FSM (регистрация, вход) хранятся в той же базе и переживают перезапуск
+dp = Dispatcher(storage=SQLiteStorage(db))
+
+# Пароли хешируются в отдельных потоках, чтобы вход не останавливал бота
+hasher = PasswordHasher(
+    PASSWORD_SCRYPT_N, PASSWORD_SCRYPT_R, PASSWORD_SCRYPT_P, workers=PASSWORD_WORKERS
 )
 
-# Создаём таблицу книг (если не существует)
-cursor.execute(
-    """
-    CREATE TABLE IF NOT EXISTS books (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        title TEXT UNIQUE,
-        author TEXT,
-        available BOOLEAN,
-        borrower TEXT
-    )
-"""
-)
+# Метрики: время обновлений (и ожидания базы в них), хендлеров и запросов к API
+dp.update.outer_middleware(UpdateMetricsMiddleware(metrics))
+router.message.middleware(HandlerMetricsMiddleware(metrics))
+router.callback_query.middleware(HandlerMetricsMiddleware(metrics))
 
-conn.commit()
+# Лимиты частоты: лишние входящие обновления отбрасываются, исходящие
+# сообщения ждут своей очереди в рамках бюджета Telegram (см. ratelimit.py)
+throttling = ThrottlingMiddleware()
+dp.update.outer_middleware(throttling)
+send_scheduler = SendScheduler()
+bot.session.middleware(send_scheduler)
+# После планировщика: замеряется сам запрос, без ожидания в очереди
+bot.session.middleware(ApiMetricsMiddleware(metrics))
 
 
-def init_books_in_db():
+async def init_books_in_db():
     """
-    Пример функции, которая единовременно загружает книги в таблицу `books`,
+    Единовременно загружает книги из словаря books в book.py в таблицу `books`,
     если они там ещё не записаны. Можно вызвать её один раз при старте бота.
-    Предполагается, что у вас есть словарь initial_books в book.py.
-    Или вы можете прописать книги прямо здесь в виде словаря.
-    """
-    # from book import books as initial_books
-    initial_books = {
-        "Война и мир": {"author": "Лев Толстой", "available": True, "borrower": None},
-        "Преступление и наказание": {
-            "author": "Федор Достоевский",
-            "available": True,
-            "borrower": None,
-        },
-        "Мастер и Маргарита": {
-            "author": "Михаил Булгаков",
-            "available": True,
-            "borrower": None,
-        },
-        # ... Добавьте остальные при необходимости ...
-    }
-
-    # Проверяем, есть ли уже какие-то записи в таблице books
-    cursor.execute("SELECT COUNT(*) FROM books")
-    count = cursor.fetchone()[0]
-    if count == 0:
-        # Если записей нет, загружаем initial_books
-        for title, info in initial_books.items():
-            cursor.execute(
-                "INSERT INTO books (title, author, available, borrower) VALUES (?, ?, ?, ?)",
-                (title, info["author"], info["available"], info["borrower"]),
-            )
-        conn.commit()
+    Большие каталоги (.xlsx, .csv) загружаются отдельно: python importer.py <файл>
+    """
+    await db.init_books(initial_books)
 
 
-# Если нужно один раз заполнить таблицу книг, снимите комментарий:
-# init_books_in_db()
+# Если нужно один раз заполнить таблицу книг, снимите комментарий в main():
+# await init_books_in_db()
 
 
 ##############################################################################
@@ -113,7 +125,10 @@ class RegisterState(StatesGroup):
 
 
 class BookRequest(StatesGroup):
+    # Поиск и бронирование — разные состояния: иначе первым всегда срабатывал бы поиск
     waiting_for_book_name = State()
+    waiting_for_borrow_title = State()
+    waiting_for_return_title = State()
 
 
 ##############################################################################
@@ -130,115 +145,241 @@ start_kb = ReplyKeyboardMarkup(
 
 menu_kb = ReplyKeyboardMarkup(
     keyboard=[
-        [KeyboardButton(text="📚 Список книг")],
-        [KeyboardButton(text="🔍 Найти книгу"), KeyboardButton(text="📖 Взять книгу")],
+        [KeyboardButton(text="📚 Список книг"), KeyboardButton(text="🔍 Найти книгу")],
+        [KeyboardButton(text="📖 Взять книгу"), KeyboardButton(text="↩️ Вернуть книгу")],
         [KeyboardButton(text="👤 Личный кабинет"), KeyboardButton(text="🚪 Выход")],
     ],
     resize_keyboard=True,
 )
 
+# Сколько книг показывать на одной странице каталога
+BOOKS_PAGE_SIZE = 10
+
+# Сколько результатов поиска показывать
+SEARCH_LIMIT = 5
+
+# Кеш отрисованных страниц каталога: (снимок версий, текст, клавиатура).
+# Страница действительна, пока не изменилась ни одна её книга (см. db.catalogue).
+books_pages_cache = LRUCache(maxsize=1000, ttl=3600)
+# Когда обновления обрабатывают несколько процессов, книгу может взять другой
+# процесс, и версии каталога этого процесса о ней не узнают: страницы живут недолго
+SHARED_PAGES_TTL = 2.0
+# По той же причине недолго живут и выдачи в кеше: книгу из очереди передаёт
+# процесс вернувшего её читателя, а следующий в очереди обычно на другом
+SHARED_LOANS_TTL = 2.0
+# Страницы, которые сейчас читаются из БД: одновременные нажатия ждут один запрос
+books_pages_loading = {}
+
+# Размеры кешей и счётчики лимитов — в метриках как gauge
+metrics.add_collector("users_cache", db.users_cache.stats)
+metrics.add_collector("loans_cache", db.loans_cache.stats)
+metrics.add_collector("pages_cache", books_pages_cache.stats)
+metrics.add_collector("throttling", throttling.stats)
+metrics.add_collector("send", send_scheduler.stats)
+metrics.add_collector("passwords", hasher.stats)
+if book_index is not None:
+    metrics.add_collector("books", book_index.stats)
+
+# Напоминания о сроке возврата; фоновая задача запускается в startup()
+reminders = ReminderScheduler(db, bot)
+metrics.add_collector("reminders", reminders.stats)
+
+# Отчёты для администраторов строятся в своём потоке (см. reports.py)
+report_exporter = ReportExporter(DB_PATH)
+metrics.add_collector("reports", report_exporter.stats)
+
+
+class BooksPage(CallbackData, prefix="books"):
+    """
+    Кнопка листания каталога: direction — "next" или "prev",
+    cursor — id последней (или первой) книги текущей страницы.
+    """
+
+    direction: str
+    cursor: int
+
+
+class Waitlist(CallbackData, prefix="queue"):
+    """
+    Кнопка очереди на занятую книгу: action — "join" или "leave".
+    """
+
+    action: str
+    book_id: int
+
 
 ##############################################################################
 # ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ
 ##############################################################################
 
 
-def get_user_data(user_id: int):
+async def get_user_data(user_id: int):
     """
     Получаем запись пользователя из БД.
     Возвращает dict или None, если пользователя нет.
     """
-    cursor.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
-    row = cursor.fetchone()
-    if row:
-        # row: (user_id, name, surname, password, borrowed_books)
-        return {
-            "user_id": row[0],
-            "name": row[1],
-            "surname": row[2],
-            "password": row[3],
-            "borrowed_books": row[4],  # CSV-строка или None
-        }
-    return None
+    return await db.get_user(user_id)
 
 
-def create_user(user_id: int, name: str, surname: str, password: str):
+async def create_user(user_id: int, name: str, surname: str, password: str) -> bool:
     """
     Создаём нового пользователя в таблице users.
-    borrowed_books по умолчанию будет пустой строкой.
-    """
-    cursor.execute(
-        """
-        INSERT INTO users (user_id, name, surname, password, borrowed_books)
-        VALUES (?, ?, ?, ?, ?)
-        """,
-        (user_id, name, surname, password, ""),
-    )
-    conn.commit()
+    Возвращает False, если пользователь с таким именем и фамилией уже есть.
+    """
+    return await db.create_user(user_id, name, surname, password)
 
 
-def update_user_borrowed_books(user_id: int, new_borrowed_books: str):
+async def get_books_page(cursor: int = 0, backward: bool = False):
     """
-    Обновляем CSV-строку с перечнем взятых книг у пользователя в таблице.
+    Возвращаем одну страницу каталога в виде (текст, inline-клавиатура).
+    Готовая страница берётся из кеша, пока её книги не менялись; в остальных
+    случаях она выбирается по ключу (WHERE id > ?), поэтому её стоимость не
+    зависит ни от номера страницы, ни от размера каталога.
     """
-    cursor.execute(
-        "UPDATE users SET borrowed_books = ? WHERE user_id = ?",
-        (new_borrowed_books, user_id),
-    )
-    conn.commit()
-
-
-def get_books_list() -> str:
+    key = (cursor, backward)
+    cached = books_pages_cache.get(key)
+    if cached is not MISSING and db.catalogue.is_current(cached[0]):
+        return cached[1], cached[2]
+
+    task = books_pages_loading.get(key)
+    if task is None:
+        task = asyncio.ensure_future(load_books_page(cursor, backward))
+        books_pages_loading[key] = task
+        task.add_done_callback(lambda _: books_pages_loading.pop(key, None))
+    # shield: отмена одного хендлера не должна отменять общий запрос
+    return await asyncio.shield(task)
+
+
+async def load_books_page(cursor: int, backward: bool):
+    version = db.catalogue.version
+    rows, has_more = await db.get_books_page(cursor, BOOKS_PAGE_SIZE, backward)
+    book_list, keyboard = render_books_page(rows, has_more, cursor, backward)
+    # Если книги страницы менялись, пока шёл запрос, она могла устареть
+    snapshot = db.catalogue.snapshot((row[0] for row in rows), since=version)
+    if snapshot is not None:
+        books_pages_cache.put((cursor, backward), (snapshot, book_list, keyboard))
+    return book_list, keyboard
+
+
+def render_books_page(rows, has_more: bool, cursor: int, backward: bool):
     """
-    Возвращаем список всех книг из БД в виде строки для отправки пользователю.
+    Текст и кнопки листания для страницы каталога.
+    rows — кортежи (id, title, author, available, borrower).
     """
-    cursor.execute("SELECT title, author, available, borrower FROM books")
-    rows = cursor.fetchall()
-
     if not rows:
-        return "❌ В базе данных нет ни одной книги."
+        if cursor == 0 and not backward:
+            return "❌ В базе данных нет ни одной книги.", None
+        return "❌ Больше книг нет.", None
 
-    book_list = "Список книг:\n"
-    for title, author, available, borrower in rows:
+    has_prev, has_next = (has_more, True) if backward else (cursor > 0, has_more)
+
+    lines = ["Список книг:"]
+    for _, title, author, available, borrower in rows:
         if available:
             status = "✅ Доступна"
         else:
             status = f"❌ Занята (Взял: {borrower})"
-        book_list += f"📖 {title} - {author} ({status})\n"
-    return book_list
+        lines.append(f"📖 {title} - {author} ({status})")
+
+    buttons = []
+    if has_prev:
+        buttons.append(
+            InlineKeyboardButton(
+                text="⬅️ Назад",
+                callback_data=BooksPage(direction="prev", cursor=rows[0][0]).pack(),
+            )
+        )
+    if has_next:
+        buttons.append(
+            InlineKeyboardButton(
+                text="Вперёд ➡️",
+                callback_data=BooksPage(direction="next", cursor=rows[-1][0]).pack(),
+            )
+        )
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
+    return "\n".join(lines), keyboard
 
 
-def find_book_in_db(title: str):
+async def find_book_in_db(title: str):
     """
     Ищем книгу по названию. Возвращаем кортеж (title, author, available, borrower) или None.
     """
-    cursor.execute(
-        "SELECT title, author, available, borrower FROM books WHERE title = ?",
-        (title,),
-    )
-    return cursor.fetchone()
+    return await db.find_book(title)
 
 
-def set_book_borrowed(title: str, borrower: str):
+async def search_books_in_db(text: str):
     """
-    Установить, что книга взята пользователем (available=False, borrower=...).
+    Поиск по словам названия и автора (без учёта регистра, с опечатками).
+    Возвращает список кортежей (title, author, available, borrower), лучшие первыми.
     """
-    cursor.execute(
-        "UPDATE books SET available = ?, borrower = ? WHERE title = ?",
-        (False, borrower, title),
-    )
-    conn.commit()
+    return await db.search_books(text, SEARCH_LIMIT)
+
+
+def format_book(row) -> str:
+    """
+    Карточка книги для ответа пользователю. row = (title, author, available, borrower)
+    """
+    title, author, available, borrower = row
+    status = "✅ Доступна" if available else f"❌ Зарезервирована (Резерв: {borrower})"
+    return f"📖 {title} - {author}\nСтатус: {status}"
 
 
-def set_book_returned(title: str):
+async def borrow_book_in_db(user_id: int, title: str) -> bool:
     """
-    Установить, что книга возвращена (available=True, borrower=None).
+    Атомарно бронирует книгу за пользователем (одна транзакция с условным UPDATE).
+    Возвращает False, если книги нет или её уже кто-то взял.
     """
-    cursor.execute(
-        "UPDATE books SET available = ?, borrower = NULL WHERE title = ?",
-        (True, title),
+    return await db.borrow_book(user_id, title)
+
+
+async def set_book_returned(title: str) -> bool:
+    """
+    Установить, что книга возвращена, и закрыть её выдачу в таблице loans.
+    Книга переходит к первому в очереди (он получает сообщение) или
+    становится доступной (available=True, borrower=None).
+    """
+    handoff = await db.set_book_returned(title)
+    if handoff is None:
+        return False
+    await notify_handoff(title, *handoff)
+    return True
+
+
+def format_date(timestamp: float) -> str:
+    return time.strftime("%d.%m.%Y", time.localtime(timestamp))
+
+
+async def notify_handoff(title: str, user_id, due_at):
+    """
+    Сообщает первому в очереди, что книга перешла к нему. Выдача уже
+    записана в базу: если сообщение не дошло, книга всё равно за ним и
+    видна в личном кабинете, а о сроке напомнит ReminderScheduler.
+    """
+    if user_id is None:
+        return
+    reminders.schedule(due_at - REMIND_BEFORE)
+    try:
+        await bot.send_message(
+            user_id,
+            f"📗 Подошла ваша очередь: книга «{title}» зарезервирована за вами. "
+            f"Верните её до {format_date(due_at)}.",
+        )
+    except TelegramAPIError as exc:
+        logging.warning("Не удалось сообщить пользователю %s о книге: %s", user_id, exc)
+
+
+def waitlist_keyboard(action: str, book_id: int):
+    text = "🕒 Встать в очередь" if action == "join" else "Выйти из очереди"
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [
+                InlineKeyboardButton(
+                    text=text,
+                    callback_data=Waitlist(action=action, book_id=book_id).pack(),
+                )
+            ]
+        ]
     )
-    conn.commit()
 
 
 async def check_registration(message: types.Message) -> bool:
@@ -246,7 +387,7 @@ async def check_registration(message: types.Message) -> bool:
     Проверка, зарегистрирован ли пользователь. Если нет, отправляем сообщение и возвращаем False.
     """
     user_id = message.from_user.id
-    user = get_user_data(user_id)
+    user = await get_user_data(user_id)
     if not user:
         await message.answer(
             "⛔ Вы не зарегистрированы. Пожалуйста, зарегистрируйтесь для доступа ко всем функциям.",
@@ -260,11 +401,14 @@ async def check_registration(message: types.Message) -> bool:
 # ХЕНДЛЕРЫ /start, Регистрация, Вход
 ##############################################################################
 
+# Ответ, когда очередь на проверку паролей переполнена (см. passwords.py)
+BUSY_TEXT = "⏳ Сейчас слишком много попыток входа. Отправьте пароль ещё раз через минуту."
 
-@router.message(F.text == "/start")
+
+@router.message.button("/start")
 async def send_welcome(message: types.Message, state: FSMContext):
     user_id = message.from_user.id
-    user = get_user_data(user_id)
+    user = await get_user_data(user_id)
 
     # Если пользователя нет, предлагаем регистрацию или вход
     if not user:
@@ -278,13 +422,13 @@ async def send_welcome(message: types.Message, state: FSMContext):
         await state.set_state(LoginState.waiting_for_password)
 
 
-@router.message(F.text == "📝 Регистрация")
+@router.message.button("📝 Регистрация")
 async def start_registration(message: types.Message, state: FSMContext):
     await message.answer("🔹 Давайте зарегистрируемся! Введите ваше имя:")
     await state.set_state(RegisterState.waiting_for_name)
 
 
-@router.message(F.text == "🔑 Войти")
+@router.message.button("🔑 Войти")
 async def start_login(message: types.Message, state: FSMContext):
     await message.answer("🔑 Введите ваше имя:")
     await state.set_state(LoginState.waiting_for_name)
@@ -299,6 +443,16 @@ async def register_name(message: types.Message, state: FSMContext):
 
 @router.message(RegisterState.waiting_for_surname)
 async def register_surname(message: types.Message, state: FSMContext):
+    user_data = await state.get_data()
+
+    # Пара (имя, фамилия) уникальна: по ней выполняется вход
+    if await db.find_user_by_name(user_data["name"], message.text):
+        await message.answer(
+            "⛔ Пользователь с таким именем и фамилией уже зарегистрирован. "
+            "Введите фамилию иначе (например, с инициалом отчества):"
+        )
+        return
+
     await state.update_data(surname=message.text)
     await message.answer("Придумайте пароль:")
     await state.set_state(RegisterState.waiting_for_password)
@@ -309,21 +463,35 @@ async def register_password(message: types.Message, state: FSMContext):
     user_id = message.from_user.id
 
     # Проверяем, есть ли уже такая запись
-    if get_user_data(user_id):
+    if await get_user_data(user_id):
         await message.answer(
             "⛔ Вы уже зарегистрированы. Используйте вход.", reply_markup=start_kb
         )
         await state.clear()
         return
 
-    # Сохраняем пользователя в БД
+    # Сохраняем пользователя в БД; вместо пароля — его хеш
     user_data = await state.get_data()
-    create_user(
+    try:
+        password_hash = await hasher.hash(message.text)
+    except PasswordHasherBusy:
+        await message.answer(BUSY_TEXT)
+        return
+    created = await create_user(
         user_id=user_id,
         name=user_data["name"],
         surname=user_data["surname"],
-        password=message.text,
+        password=password_hash,
     )
+    if not created:
+        # Кто-то успел занять имя и фамилию, пока вводился пароль
+        await message.answer(
+            "⛔ Пользователь с таким именем и фамилией уже зарегистрирован. "
+            "Начните регистрацию заново.",
+            reply_markup=start_kb,
+        )
+        await state.clear()
+        return
 
     await message.answer(
         "✅ Регистрация завершена! Добро пожаловать.", reply_markup=menu_kb
@@ -348,24 +516,31 @@ async def login_surname(message: types.Message, state: FSMContext):
 @router.message(LoginState.waiting_for_password)
 async def check_password(message: types.Message, state: FSMContext):
     user_data_state = await state.get_data()
-    name = user_data_state["name"]
-    surname = user_data_state["surname"]
     password_input = message.text
 
-    # Попробуем найти пользователя по имени и фамилии
-    cursor.execute(
-        """
-        SELECT user_id, password FROM users
-        WHERE name = ? AND surname = ?
-        """,
-        (name, surname),
-    )
-    row = cursor.fetchone()
+    if "name" in user_data_state and "surname" in user_data_state:
+        name = user_data_state["name"]
+        # Попробуем найти пользователя по имени и фамилии
+        row = await db.find_user_by_name(name, user_data_state["surname"])
+    else:
+        # Вход после /start: имя не спрашивали, пользователь известен по user_id
+        user = await get_user_data(message.from_user.id)
+        name = user["name"] if user else ""
+        row = (user["user_id"], user["password"]) if user else None
 
     if row:
-        user_id_db = row[0]
-        password_db = row[1]
-        if password_db == password_input:
+        user_id_db, password_db = row
+        try:
+            verified = await hasher.verify(password_input, password_db)
+        except PasswordHasherBusy:
+            await message.answer(BUSY_TEXT)
+            return
+        if verified:
+            # Пароль открытым текстом или хеш со старыми параметрами пересчитываем;
+            # если сейчас не до этого — пересчитаем при следующем входе
+            if hasher.needs_rehash(password_db):
+                with suppress(PasswordHasherBusy):
+                    await db.set_password(user_id_db, await hasher.hash(password_input))
             await message.answer(f"✅ Успешный вход, {name}!", reply_markup=menu_kb)
             await state.clear()
             return
@@ -377,36 +552,40 @@ async def check_password(message: types.Message, state: FSMContext):
 ##############################################################################
 
 
-@router.message(F.text == "👤 Личный кабинет")
+@router.message.button("👤 Личный кабинет")
 async def profile(message: types.Message, state: FSMContext):
     if not await check_registration(message):
         return
 
     user_id = message.from_user.id
-    user_data = get_user_data(user_id)
+    user_data = await get_user_data(user_id)
     if user_data:
-        borrowed_books_csv = user_data["borrowed_books"]
-        if borrowed_books_csv:
-            borrowed_list = borrowed_books_csv.split(",")
-            borrowed_books_str = ", ".join(borrowed_list)
+        loans = await db.get_user_loans(user_id)
+        if loans:
+            borrowed_books_str = ", ".join(title for title, _, _ in loans)
         else:
             borrowed_books_str = "Нет взятых книг"
 
-        await message.answer(
+        text = (
             f"👤 Ваш профиль:\n\nИмя: {user_data['name']}\n"
             f"Фамилия: {user_data['surname']}\n\n"
-            f"Зарезервированные книги:\n{borrowed_books_str}",
-            reply_markup=menu_kb,
+            f"Зарезервированные книги:\n{borrowed_books_str}"
         )
+        waitlist = await db.get_user_waitlist(user_id)
+        if waitlist:
+            text += "\n\nОчередь:\n" + "\n".join(
+                f"{title} — место {place}" for title, place in waitlist
+            )
+        await message.answer(text, reply_markup=menu_kb)
 
 
-@router.message(F.text == "🚪 Выход")
+@router.message.button("🚪 Выход")
 async def logout(message: types.Message, state: FSMContext):
     if not await check_registration(message):
         return
 
     user_id = message.from_user.id
-    user_data = get_user_data(user_id)
+    user_data = await get_user_data(user_id)
     if user_data:
         await message.answer(
             "Вы вышли из системы. Чтобы вернуться, пожалуйста, выполните вход.",
@@ -422,13 +601,22 @@ async def logout(message: types.Message, state: FSMContext):
 ##############################################################################
 
 
-@router.message(F.text == "📚 Список книг")
+@router.message.button("📚 Список книг")
 async def list_books_handler(message: types.Message):
-    book_list = get_books_list()
-    await message.answer(book_list)
+    book_list, keyboard = await get_books_page()
+    await message.answer(book_list, reply_markup=keyboard)
 
 
-@router.message(F.text == "🔍 Найти книгу")
+@router.callback_query(BooksPage.filter())
+async def books_page_handler(callback: types.CallbackQuery, callback_data: BooksPage):
+    book_list, keyboard = await get_books_page(
+        callback_data.cursor, backward=callback_data.direction == "prev"
+    )
+    await callback.message.edit_text(book_list, reply_markup=keyboard)
+    await callback.answer()
+
+
+@router.message.button("🔍 Найти книгу")
 async def ask_for_book(message: types.Message, state: FSMContext):
     if not await check_registration(message):
         return
@@ -439,77 +627,313 @@ async def ask_for_book(message: types.Message, state: FSMContext):
 @router.message(BookRequest.waiting_for_book_name)
 async def find_book(message: types.Message, state: FSMContext):
     book_title = message.text.strip()
-    row = find_book_in_db(book_title)
+    row = await find_book_in_db(book_title)
 
     if row:
-        title, author, available, borrower = row
-        status = (
-            "✅ Доступна" if available else f"❌ Зарезервирована (Резерв: {borrower})"
-        )
-        response = f"📖 {title} - {author}\nСтатус: {status}"
+        response = format_book(row)
     else:
-        response = "❌ Книга не найдена в библиотеке."
+        # Точного совпадения нет — ищем по словам и с учётом опечаток
+        rows = await search_books_in_db(book_title)
+        if len(rows) == 1:
+            response = format_book(rows[0])
+        elif rows:
+            response = "🔎 Возможно, вы искали:\n\n" + "\n\n".join(
+                format_book(row) for row in rows
+            )
+        else:
+            response = "❌ Книга не найдена в библиотеке."
 
     await message.answer(response)
     await state.clear()
 
 
-@router.message(F.text == "📖 Взять книгу")
+@router.message.button("📖 Взять книгу")
 async def borrow_book_request(message: types.Message, state: FSMContext):
     if not await check_registration(message):
         return
     await message.answer("Введите название книги, которую хотите зарезервировать:")
-    await state.set_state(BookRequest.waiting_for_book_name)
+    await state.set_state(BookRequest.waiting_for_borrow_title)
 
 
-@router.message(BookRequest.waiting_for_book_name)
+@router.message(BookRequest.waiting_for_borrow_title)
 async def borrow_book(message: types.Message, state: FSMContext):
     if not await check_registration(message):
         return
 
-    title = message.text.strip()
-    row = find_book_in_db(title)
     user_id = message.from_user.id
-    user_data = get_user_data(user_id)
-
-    if not row:
+    # Название приводится к каталожному так же, как в поиске: без учёта
+    # регистра, «ё» и лишних пробелов
+    book = await find_book_in_db(message.text.strip())
+    if book is None:
         await message.answer("Книга не найдена в библиотеке.")
         await state.clear()
         return
+    title = book[0]
+
+    # Проверка доступности и запись идут одним UPDATE ... WHERE available = 1,
+    # поэтому два одновременных запроса не могут взять одну и ту же книгу
+    if await borrow_book_in_db(user_id, title):
+        due_at = time.time() + LOAN_DAYS * 86400
+        await message.answer(
+            f"Вы успешно зарезервировали книгу «{title}». "
+            f"Не забудьте вернуть её до {format_date(due_at)}!"
+        )
+        reminders.schedule(due_at - REMIND_BEFORE)
+    else:
+        await message.answer(
+            "Эта книга уже занята. Можно встать в очередь: когда её вернут, "
+            "она сразу перейдёт к первому в очереди.",
+            reply_markup=waitlist_keyboard("join", await db.find_book_id(title)),
+        )
 
-    # row = (title, author, available, borrower)
-    _, _, available, borrower = row
+    await state.clear()
 
-    if available:
-        # Обновляем книгу
-        borrower_str = f"{user_data['name']} {user_data['surname']}"
-        set_book_borrowed(title, borrower_str)
 
-        # Обновляем список книг пользователя (CSV)
-        borrowed_csv = user_data["borrowed_books"] or ""
-        borrowed_list = borrowed_csv.split(",") if borrowed_csv else []
-        borrowed_list = [x for x in borrowed_list if x]  # На случай пустой строки
-        borrowed_list.append(title)
-        new_borrowed_csv = ",".join(borrowed_list)
-        update_user_borrowed_books(user_id, new_borrowed_csv)
+@router.callback_query(Waitlist.filter())
+async def waitlist_handler(callback: types.CallbackQuery, callback_data: Waitlist):
+    user_id = callback.from_user.id
+    if not await get_user_data(user_id):
+        await callback.answer("⛔ Вы не зарегистрированы.", show_alert=True)
+        return
 
-        await message.answer(
-            f"Вы успешно зарезервировали книгу «{title}». Не забудьте вернуть её вовремя!"
-        )
+    book_id = callback_data.book_id
+    if callback_data.action == "leave":
+        await db.leave_waitlist(user_id, book_id)
+        await callback.message.edit_text("Вы вышли из очереди.")
+        await callback.answer()
+        return
+
+    result = await db.join_waitlist(user_id, book_id)
+    if result is None:
+        await callback.message.edit_text("Книга не найдена в библиотеке.")
     else:
-        await message.answer("Эта книга уже занята.")
+        title, place = result
+        if place is None:
+            await callback.message.edit_text(f"Книга «{title}» и так у вас.")
+        elif place == 0:
+            # Книгу вернули, пока пользователь решал, а очереди не было
+            due_at = time.time() + LOAN_DAYS * 86400
+            await callback.message.edit_text(
+                f"Книга «{title}» освободилась, и вы её зарезервировали. "
+                f"Не забудьте вернуть её до {format_date(due_at)}!"
+            )
+            reminders.schedule(due_at - REMIND_BEFORE)
+        else:
+            await callback.message.edit_text(
+                f"🕒 Вы в очереди на книгу «{title}», ваше место: {place}. "
+                f"Когда книга перейдёт к вам, придёт сообщение.",
+                reply_markup=waitlist_keyboard("leave", book_id),
+            )
+    await callback.answer()
+
+
+@router.message.button("↩️ Вернуть книгу")
+async def return_book_request(message: types.Message, state: FSMContext):
+    if not await check_registration(message):
+        return
+    loans = await db.get_user_loans(message.from_user.id)
+    if not loans:
+        await message.answer("У вас нет взятых книг.", reply_markup=menu_kb)
+        return
+    # Названия взятых книг — кнопками, чтобы не набирать их вручную
+    keyboard = ReplyKeyboardMarkup(
+        keyboard=[[KeyboardButton(text=title)] for title, _, _ in loans],
+        resize_keyboard=True,
+        one_time_keyboard=True,
+    )
+    await message.answer("Какую книгу вы возвращаете?", reply_markup=keyboard)
+    await state.set_state(BookRequest.waiting_for_return_title)
+
+
+@router.message(BookRequest.waiting_for_return_title)
+async def return_book(message: types.Message, state: FSMContext):
+    title = message.text.strip()
+
+    # Закрытие выдачи и передача книги следующему в очереди — одна транзакция
+    handoff = await db.return_book(message.from_user.id, title)
+    if handoff is None:
+        await message.answer("Этой книги нет среди взятых вами.", reply_markup=menu_kb)
+    else:
+        await message.answer(f"✅ Книга «{title}» возвращена. Спасибо!", reply_markup=menu_kb)
+        await notify_handoff(title, *handoff)
 
     await state.clear()
 
 
+##############################################################################
+# ОТЧЁТЫ ДЛЯ АДМИНИСТРАТОРОВ
+##############################################################################
+
+# Telegram принимает от ботов документы до 50 МБ
+DOCUMENT_LIMIT = 50 * 1024 * 1024
+
+# Отчёты, которые сейчас строятся и отправляются
+report_tasks = set()
+
+
+@router.message.button("/report", "/report csv", filters=(F.from_user.id.in_(ADMIN_IDS),))
+async def report_command(message: types.Message):
+    if report_exporter.running:
+        await message.answer("⏳ Предыдущий отчёт ещё готовится.")
+        return
+    fmt = "csv" if message.text.endswith("csv") else "xlsx"
+    await message.answer("📊 Готовлю отчёт, пришлю его файлом.")
+    # Отчёт по большой базе строится минутами: хендлер не ждёт его
+    task = asyncio.create_task(send_report(message.chat.id, fmt))
+    report_tasks.add(task)
+    task.add_done_callback(report_tasks.discard)
+
+
+async def send_report(chat_id: int, fmt: str):
+    """
+    Строит отчёт и отправляет его документом; файл после отправки удаляется.
+    """
+    try:
+        path = await report_exporter.export(fmt)
+    except ReportBusy:
+        await bot.send_message(chat_id, "⏳ Предыдущий отчёт ещё готовится.")
+        return
+    except Exception:
+        logging.exception("Не удалось построить отчёт")
+        await bot.send_message(chat_id, "❌ Не удалось построить отчёт.")
+        return
+
+    size = os.path.getsize(path)
+    if size > DOCUMENT_LIMIT:
+        await bot.send_message(
+            chat_id,
+            f"Отчёт занимает {size / 2**20:.0f} МБ — больше, чем Telegram принимает "
+            f"от ботов. Он сохранён на сервере: {path}",
+        )
+        return
+    extension = "zip" if fmt == "csv" else fmt
+    try:
+        await bot.send_document(
+            chat_id,
+            FSInputFile(path, filename=f"report-{time.strftime('%Y-%m-%d')}.{extension}"),
+        )
+    except TelegramAPIError as exc:
+        logging.warning("Отчёт не отправлен: %s", exc)
+    finally:
+        os.remove(path)
+
+
 ##############################################################################
 # Запуск бота
 ##############################################################################
 
 
-async def main():
+metrics_runner = None
+migration_notifier = None
+
+
+def migration_note_text(kind: str, original: str, surname: str) -> str:
+    if kind == "renamed":
+        return (
+            f"ℹ️ В библиотеке есть другой читатель с такими же именем и фамилией, "
+            f"поэтому ваша фамилия изменена с «{original}» на «{surname}». "
+            f"Для входа используйте новую."
+        )
+    return (
+        f"⚠️ Книга «{original}», которая числилась за вами, не нашлась в каталоге "
+        f"и не перенесена в ваши книги. Пожалуйста, обратитесь в библиотеку."
+    )
+
+
+async def notify_migration_notes():
+    """
+    Сообщает читателям, что миграции базы изменили их данные (см.
+    _create_migration_notes в db.py). Не дошедшее из-за сети сообщение
+    останется в базе до следующего запуска.
+    """
+    try:
+        notes = await db.pending_migration_notes()
+    except Exception:
+        logging.exception("Не удалось прочитать изменения после миграции")
+        return
+    for note_id, user_id, kind, original, surname in notes:
+        try:
+            await bot.send_message(user_id, migration_note_text(kind, original, surname))
+        except (TelegramNetworkError, TelegramRetryAfter) as exc:
+            logging.warning("Не удалось сообщить пользователю %s о миграции: %s", user_id, exc)
+            continue
+        except TelegramAPIError as exc:
+            # Бот заблокирован или чат удалён: повторять бесполезно
+            logging.warning("Сообщение о миграции пользователю %s не доставлено: %s", user_id, exc)
+        await db.mark_migration_notes([note_id], int(time.time()))
+
+
+async def startup(metrics_port: int = METRICS_PORT, send_reminders: bool = True):
+    global metrics_runner, migration_notifier
+    await db.connect()
     dp.include_router(router)
-    await dp.start_polling(bot, skip_updates=True)
+    if metrics_port:
+        metrics_runner = await serve(metrics, METRICS_HOST, metrics_port)
+    if send_reminders:
+        reminders.start()
+        migration_notifier = asyncio.create_task(notify_migration_notes())
+
+
+async def shutdown():
+    await reminders.stop()
+    if migration_notifier is not None:
+        migration_notifier.cancel()
+    for task in report_tasks:
+        task.cancel()
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
+    await dp.storage.close()
+    await db.close()
+    hasher.close()
+    report_exporter.close()
+
+
+async def startup_shard(index: int):
+    """
+    Подготовка процесса-обработчика в режиме WORKERS > 1 (см. sharding.py).
+    """
+    # Напоминания рассылает только первый процесс, иначе они бы дублировались
+    await startup(METRICS_PORT + 1 + index if METRICS_PORT else 0, send_reminders=index == 0)
+    books_pages_cache.ttl = SHARED_PAGES_TTL
+    db.loans_cache.ttl = SHARED_LOANS_TTL
+    # Бюджет отправок Telegram общий на бота: делим его между процессами
+    send_scheduler.bucket.rate /= WORKERS
+
+    async def close():
+        await shutdown()
+        await bot.session.close()
+
+    return dp, bot, close
+
+
+async def main():
+    if WORKERS > 1:
+        # Этот процесс только принимает обновления и раздаёт их обработчикам
+        await run_sharded(
+            bot,
+            WORKERS,
+            startup_shard,
+            WEBHOOK_URL,
+            WEBHOOK_HOST,
+            WEBHOOK_PORT,
+            WEBHOOK_PATH,
+            WEBHOOK_SECRET,
+        )
+        return
+
+    await startup()
+    try:
+        if WEBHOOK_URL:
+            await run_webhook(
+                dp, bot, WEBHOOK_URL, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET
+            )
+        else:
+            # getUpdates не работает, пока установлен вебхук. Накопившиеся за
+            # время перезапуска обновления не выбрасываем, а обрабатываем.
+            await bot.delete_webhook(drop_pending_updates=False)
+            await dp.start_polling(bot)
+    finally:
+        await shutdown()
 
 
 if __name__ == "__main__":
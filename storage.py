@@ -0,0 +1,86 @@
+"""
+Хранилище состояний FSM aiogram в той же базе SQLite, что и данные бота.
+
+В отличие от MemoryStorage состояния переживают перезапуск, а благодаря
+WAL одну базу могут использовать несколько процессов бота. Состояние,
+которое не менялось дольше ttl секунд, считается сброшенным (пользователь
+бросил регистрацию на полпути); такие записи время от времени удаляются.
+"""
+
+import asyncio
+import json
+import time
+from collections.abc import Mapping
+from typing import Any
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import (
+    BaseStorage,
+    DefaultKeyBuilder,
+    KeyBuilder,
+    StateType,
+    StorageKey,
+)
+
+from db import Database
+
+# Сколько живёт состояние без изменений
+FSM_TTL = 24 * 3600
+
+# Как часто удалять устаревшие записи
+PURGE_INTERVAL = 3600
+
+
+class SQLiteStorage(BaseStorage):
+    def __init__(
+        self,
+        db: Database,
+        ttl: float = FSM_TTL,
+        purge_interval: float = PURGE_INTERVAL,
+        key_builder: KeyBuilder | None = None,
+        clock=time.time,
+    ):
+        self.db = db
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._clock = clock
+        self._purged_at = clock()
+        self._purge_task = None
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        if isinstance(state, State):
+            state = state.state
+        now = self._clock()
+        await self.db.set_fsm_state(self.key_builder.build(key), state, now, now - self.ttl)
+        self._maybe_purge(now)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        row = await self.db.get_fsm(self.key_builder.build(key), self._clock() - self.ttl)
+        return row[0] if row else None
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        now = self._clock()
+        data_json = json.dumps(dict(data), ensure_ascii=False)
+        await self.db.set_fsm_data(self.key_builder.build(key), data_json, now, now - self.ttl)
+        self._maybe_purge(now)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        row = await self.db.get_fsm(self.key_builder.build(key), self._clock() - self.ttl)
+        return json.loads(row[1]) if row else {}
+
+    async def close(self) -> None:
+        """
+        Дожидается начатой очистки. Базу закрывает её владелец (db.close()).
+        """
+        if self._purge_task is not None:
+            await self._purge_task
+
+    def _maybe_purge(self, now: float):
+        # Очистка идёт в фоне, чтобы хендлер не ждал лишнюю транзакцию
+        if now - self._purged_at < self.purge_interval:
+            return
+        if self._purge_task is not None and not self._purge_task.done():
+            return
+        self._purged_at = now
+        self._purge_task = asyncio.create_task(self.db.purge_fsm(now - self.ttl))
@@ -0,0 +1,81 @@
+"""
+Название книги ищется без учёта регистра, «ё» и лишних пробелов — с
+каталогом в памяти и без него, а книги, импортированные другим процессом,
+каталог в памяти подхватывает при первом промахе.
+"""
+
+import asyncio
+
+import pytest
+
+from book_index import BookIndex
+from db import Database
+
+BOOKS = {
+    "Война и мир": "Лев Толстой",
+    "Ёжик в тумане": "Сергей Козлов",
+    "Мир": "Автор",
+}
+
+
+async def open_database(path, book_index):
+    database = Database(str(path), book_index=book_index)
+    await database.connect()
+    return database
+
+
+async def fill(path):
+    database = await open_database(path, None)
+    await database.init_books(
+        {title: {"author": author, "available": True, "borrower": None} for title, author in BOOKS.items()}
+    )
+    for user_id in range(2):
+        await database.create_user(user_id, f"Имя{user_id}", f"Фамилия{user_id}", "pwd")
+    await database.close()
+
+
+@pytest.mark.parametrize("book_index", [None, BookIndex], ids=["sqlite", "bookindex"])
+def test_titles_match_after_normalization(tmp_path, book_index):
+    path = tmp_path / "books.sqlite3"
+
+    async def run():
+        await fill(path)
+        database = await open_database(path, book_index and book_index())
+        found = [
+            await database.find_book(title)
+            for title in ("  война  И МИР ", "ежик в тумане", "мир", "Война")
+        ]
+        ids = [await database.find_book_id(title) for title in ("ВОЙНА И МИР", "Война и мир")]
+        await database.close()
+        return found, ids
+
+    found, ids = asyncio.run(run())
+    assert [row and row[0] for row in found] == ["Война и мир", "Ёжик в тумане", "Мир", None]
+    assert ids[0] == ids[1] is not None
+
+
+def test_imported_books_are_found_and_offer_the_waitlist(tmp_path):
+    path = tmp_path / "books.sqlite3"
+
+    async def run():
+        await fill(path)
+        database = await open_database(path, BookIndex())
+        # Импорт другим процессом (importer.py) в обход каталога в памяти
+        other = await open_database(path, None)
+        await other.import_books([("Новая книга", "Новый автор", True, None)])
+        await other.close()
+
+        (title, _, available, _) = await database.find_book("новая  КНИГА")
+        book_id = await database.find_book_id(title)
+        borrowed = await database.borrow_book(0, title)
+        again = await database.borrow_book(1, title)
+        place = await database.join_waitlist(1, await database.find_book_id(title))
+        row = await database.find_book(title)
+        await database.close()
+        return title, available, book_id, borrowed, again, place, row
+
+    title, available, book_id, borrowed, again, place, row = asyncio.run(run())
+    assert title == "Новая книга" and available and book_id is not None
+    assert borrowed and not again
+    assert place == ("Новая книга", 1)
+    assert row == ("Новая книга", "Новый автор", False, "Имя0 Фамилия0")
@@ -0,0 +1,36 @@
+"""
+Выдача книги: одна условная транзакция, даже когда книгу хотят все сразу.
+"""
+
+import asyncio
+
+from db import Database
+
+ATTEMPTS = 2000
+
+
+def test_one_book_has_exactly_one_winner(tmp_path):
+    async def run():
+        database = Database(str(tmp_path / "race.sqlite3"))
+        await database.connect()
+        await database.init_books(
+            {"Книга": {"author": "Автор", "available": True, "borrower": None}}
+        )
+        for user_id in range(ATTEMPTS):
+            await database.create_user(user_id, f"Имя{user_id}", f"Фамилия{user_id}", "pwd")
+        results = await asyncio.gather(
+            *(database.borrow_book(user_id, "Книга") for user_id in range(ATTEMPTS))
+        )
+        holders = [
+            user_id for user_id in range(ATTEMPTS) if await database.get_user_loans(user_id)
+        ]
+        book = await database.find_book("Книга")
+        await database.close()
+        return results, holders, book
+
+    results, holders, (_, _, available, borrower) = asyncio.run(run())
+    winners = [user_id for user_id, ok in enumerate(results) if ok]
+    assert len(winners) == 1
+    assert holders == winners
+    assert not available
+    assert borrower == f"Имя{winners[0]} Фамилия{winners[0]}"
@@ -0,0 +1,65 @@
+"""
+Кнопка посреди сценария FSM срабатывает и сбрасывает начатый сценарий.
+"""
+
+import asyncio
+
+from aiogram import Bot, Dispatcher
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.types import Update
+
+from buttons import ButtonRouter
+
+
+class Form(StatesGroup):
+    waiting_for_name = State()
+
+
+def make_update(update_id, text):
+    return Update.model_validate(
+        {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": 0,
+                "chat": {"id": 1, "type": "private"},
+                "from": {"id": 1, "is_bot": False, "first_name": "Имя"},
+                "text": text,
+            },
+        }
+    )
+
+
+def test_button_clears_fsm_state():
+    calls = []
+    router = ButtonRouter()
+
+    @router.message.button("📚 Меню")
+    async def menu(message, state: FSMContext):
+        calls.append(("menu", await state.get_state(), await state.get_data()))
+
+    @router.message.button("✍️ Анкета")
+    async def start_form(message, state: FSMContext):
+        await state.set_state(Form.waiting_for_name)
+        await state.update_data(started=True)
+
+    @router.message(Form.waiting_for_name)
+    async def name(message):
+        calls.append(("name", message.text))
+
+    @router.message()
+    async def fallback(message):
+        calls.append(("fallback", message.text))
+
+    async def run():
+        dispatcher = Dispatcher()
+        dispatcher.include_router(router)
+        bot = Bot("0:test")
+        for update_id, text in enumerate(["✍️ Анкета", "📚 Меню", "Иван"]):
+            await dispatcher.feed_update(bot, make_update(update_id, text))
+        await bot.session.close()
+
+    asyncio.run(run())
+    # Меню открылось уже без анкеты, а следующий текст не попал в её поле
+    assert calls == [("menu", None, {}), ("fallback", "Иван")]
@@ -0,0 +1,90 @@
+"""
+Журнал book.py: после падения в любой момент книги восстанавливаются
+такими, какими были. Каждый сценарий — отдельный процесс над копией book.py.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+BOOK_SOURCE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "book.py")
+
+# Процесс-писатель: меняет статусы, сохраняет ожидаемое состояние и «падает»
+JOURNAL_WRITER = """
+import json, os, random, sys
+import book
+
+mode, updates = sys.argv[1], int(sys.argv[2])
+rng = random.Random(updates)
+titles = list(book.books)
+for i in range(updates):
+    book.update_book_status(rng.choice(titles), rng.choice([None, f"Читатель {i}"]))
+with open("expected.json", "w", encoding="utf-8") as f:
+    json.dump(book.books, f, ensure_ascii=False)
+
+if mode == "torn":
+    with open(book.JOURNAL_PATH, "a", encoding="utf-8") as f:
+        f.write('{"title": "Война и мир", "borr')
+elif mode == "compact":
+    # Снимок заменён, а журнал обнулить не успели
+    with open(book.SNAPSHOT_PATH, "w", encoding="utf-8") as f:
+        json.dump(book.books, f, ensure_ascii=False)
+elif mode == "grown":
+    # После снимка в каталог book.py добавили книгу: она должна остаться
+    book.compact()
+    with open("book.py", encoding="utf-8") as f:
+        source = f.read()
+    entry = {"author": "Новый автор", "available": True, "borrower": None}
+    with open("book.py", "w", encoding="utf-8") as f:
+        f.write(source.replace("books = {", f'books = {{\\n    "Новая книга": {entry!r},', 1))
+    expected = dict(book.books, **{"Новая книга": entry})
+    with open("expected.json", "w", encoding="utf-8") as f:
+        json.dump(expected, f, ensure_ascii=False)
+os._exit(0)
+"""
+
+# Перезапуск после оборванной записи: новые изменения дописываются в журнал
+# и должны пережить ещё один перезапуск
+JOURNAL_AFTER_TORN = """
+import json, os
+import book
+
+book.update_book_status("Обломов", "B")
+book.update_book_status("Идиот", "C")
+book.flush_journal()
+with open("expected.json", "w", encoding="utf-8") as f:
+    json.dump(book.books, f, ensure_ascii=False)
+os._exit(0)
+"""
+
+JOURNAL_READER = """
+import json
+import book
+
+with open("expected.json", encoding="utf-8") as f:
+    print("ok" if json.load(f) == book.books else "mismatch")
+"""
+
+
+def run(directory, script, *argv):
+    return subprocess.run(
+        [sys.executable, "-c", script, *argv],
+        cwd=directory, capture_output=True, text=True, check=True,
+    ).stdout.strip()
+
+
+@pytest.mark.parametrize("mode", ["crash", "torn", "compact", "grown"])
+def test_books_survive_crash(tmp_path, mode):
+    shutil.copy(BOOK_SOURCE, tmp_path)
+    run(tmp_path, JOURNAL_WRITER, mode, "500")
+    assert run(tmp_path, JOURNAL_READER) == "ok"
+
+
+def test_updates_after_torn_line_survive_restart(tmp_path):
+    shutil.copy(BOOK_SOURCE, tmp_path)
+    run(tmp_path, JOURNAL_WRITER, "torn", "500")
+    run(tmp_path, JOURNAL_AFTER_TORN)
+    assert run(tmp_path, JOURNAL_READER) == "ok"
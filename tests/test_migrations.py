@@ -0,0 +1,63 @@
+"""
+Миграции старой базы: то, что не переносится без потерь, сохраняется в
+migration_notes, чтобы бот сообщил об этом читателям.
+"""
+
+import asyncio
+import sqlite3
+
+import db
+from db import Database
+
+
+def old_database(path):
+    # База первой версии: книги читателя — CSV в users.borrowed_books
+    conn = sqlite3.connect(path)
+    db._migration_base_tables(conn)
+    conn.execute("PRAGMA user_version = 1")
+    conn.executemany(
+        "INSERT INTO books (title, author, available, borrower) VALUES (?, 'Автор', ?, ?)",
+        [("Война и мир", 0, "Иван Петров"), ("Отцы и дети", 1, None), ("Жизнь, и судьба", 0, "Иван Петров")],
+    )
+    conn.executemany(
+        "INSERT INTO users (user_id, name, surname, password, borrowed_books) VALUES (?, ?, ?, 'x', ?)",
+        [
+            (1, "Иван", "Петров", "Война и мир,Списанная книга,Жизнь, и судьба"),
+            (2, "Иван", "Петров", ""),
+            (3, "Анна", "Смирнова", "Потерянная"),
+        ],
+    )
+    conn.commit()
+    conn.close()
+
+
+def test_split_titles_reports_unmatched_parts():
+    book_ids = {"Война и мир": 1, "Жизнь, и судьба": 2}
+    assert db._split_titles("Нет такой,Война и мир,Жизнь, и судьба,Хвост", book_ids) == (
+        ["Война и мир", "Жизнь, и судьба"],
+        ["Нет такой", "Хвост"],
+    )
+
+
+def test_lossy_migrations_keep_notes(tmp_path):
+    path = str(tmp_path / "old.sqlite3")
+    old_database(path)
+
+    async def run():
+        database = Database(path)
+        await database.connect()
+        notes = await database.pending_migration_notes()
+        await database.mark_migration_notes([note_id for note_id, *_ in notes], 1)
+        left = await database.pending_migration_notes()
+        loans = await database.get_user_loans(1)
+        await database.close()
+        return notes, left, loans
+
+    notes, left, loans = asyncio.run(run())
+    assert sorted(title for title, *_ in loans) == ["Война и мир", "Жизнь, и судьба"]
+    assert [note[1:] for note in notes] == [
+        (1, "unknown_book", "Списанная книга", "Петров"),
+        (3, "unknown_book", "Потерянная", "Смирнова"),
+        (2, "renamed", "Петров", "Петров (2)"),
+    ]
+    assert left == []
@@ -0,0 +1,116 @@
+"""
+Ни один горячий запрос не должен сканировать таблицу целиком: запросы,
+которые делают хендлеры start.py, прогоняются на маленькой базе, и для
+каждого проверяется EXPLAIN QUERY PLAN.
+"""
+
+import asyncio
+import sqlite3
+import time
+
+from aiogram.fsm.storage.base import StorageKey
+
+from db import Database
+from storage import FSM_TTL, SQLiteStorage
+
+# Запросы, которым полный проход положен по смыслу
+FULL_SCAN_ALLOWED = (
+    "SELECT COUNT(*) FROM books",  # init_books, один раз при старте
+    "SELECT sql FROM sqlite_master",  # импорт: текст триггера
+)
+
+
+class TracingDatabase(Database):
+    """
+    Database, запоминающая каждый выполненный оператор с подставленными параметрами.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.statements = []
+
+    def _open(self):
+        conn = super()._open()
+        conn.set_trace_callback(self.statements.append)
+        return conn
+
+
+async def hot_path_workload(database):
+    """
+    Все запросы, которые делают хендлеры в start.py.
+    """
+    await database.init_books(
+        {
+            f"Книга {i}": {"author": f"Автор {i}", "available": True, "borrower": None}
+            for i in range(10)
+        }
+    )
+    await database.create_user(1, "Имя", "Фамилия", "pwd")
+    await database.find_user_by_name("Имя", "Фамилия")
+    await database.get_user(1)
+    await database.get_books_page(0, 5)
+    await database.get_books_page(8, 5, backward=True)
+    await database.find_book("Книга 1")
+    await database.find_book("КНИГА  1")
+    await database.find_book_id("книга 2")
+    await database.search_books("книга")
+    await database.search_books("Кинга")
+    await database.borrow_book(1, "Книга 1")
+    await database.get_user_loans(1)
+    await database.next_reminder_at()
+    await database.due_reminders(int(time.time()), 100)
+    await database.reschedule_reminders([(int(time.time()), 1)])
+    await database.create_user(2, "Имя2", "Фамилия2", "pwd")
+    book_id = await database.find_book_id("Книга 1")
+    await database.join_waitlist(2, book_id)
+    await database.get_user_waitlist(2)
+    await database.return_book(1, "Книга 1")
+    await database.join_waitlist(1, book_id)
+    await database.leave_waitlist(1, book_id)
+    await database.set_book_returned("Книга 1")
+
+    # Состояния FSM читаются и пишутся на каждое обновление (см. storage.py)
+    key = StorageKey(bot_id=1, chat_id=1, user_id=1)
+    storage = SQLiteStorage(database)
+    await storage.set_state(key, "RegisterState:waiting_for_surname")
+    await storage.set_data(key, {"name": "Имя"})
+    await storage.get_state(key)
+    await storage.get_data(key)
+    await database.purge_fsm(time.time() - FSM_TTL)
+
+
+def table_scans(path, statements):
+    """
+    Запросы из statements, план которых сканирует таблицу: {запрос: план}.
+    """
+    conn = sqlite3.connect(path)
+    scans = {}
+    for statement in statements:
+        sql = " ".join(statement.split())
+        if not sql.upper().startswith(("SELECT", "UPDATE", "DELETE", "INSERT")):
+            continue
+        if sql.upper().startswith("INSERT") and " SELECT " not in sql.upper():
+            continue  # INSERT ... VALUES ничего не читает
+        if sql.startswith(FULL_SCAN_ALLOWED) or "'main'." in sql:
+            continue  # "'main'." — служебные запросы FTS5 к своим теневым таблицам
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+        if any(step.startswith("SCAN") and "VIRTUAL TABLE INDEX" not in step for step in plan):
+            scans[sql] = plan
+    conn.close()
+    return scans
+
+
+def test_hot_queries_use_indexes(tmp_path):
+    path = str(tmp_path / "plans.sqlite3")
+
+    async def run():
+        database = TracingDatabase(path)
+        await database.connect()
+        database.statements.clear()
+        await hot_path_workload(database)
+        await database.close()
+        return database.statements
+
+    statements = asyncio.run(run())
+    assert len(statements) > 30
+    assert table_scans(path, statements) == {}
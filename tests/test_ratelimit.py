@@ -0,0 +1,120 @@
+"""
+SendScheduler на сессии без сети: пауза и повтор после 429, склейка
+простых сообщений в один чат и отмена одного из склеенных отправителей.
+"""
+
+import asyncio
+
+import pytest
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from ratelimit import SendScheduler
+
+
+class FakeSession(BaseSession):
+    """
+    Запоминает отправленные тексты; первые retry_after_times запросов
+    получают 429 с retry_after секунд.
+    """
+
+    def __init__(self, clock, retry_after=0, retry_after_times=0):
+        super().__init__()
+        self.clock = clock
+        self.retry_after = retry_after
+        self.retry_after_times = retry_after_times
+        self.requests = []
+
+    async def make_request(self, bot, method, timeout=None):
+        self.requests.append((self.clock(), method.text))
+        if len(self.requests) <= self.retry_after_times:
+            raise TelegramRetryAfter(method, "Too Many Requests", self.retry_after)
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        # Файлов у сессии без сети нет
+        for chunk in ():
+            yield chunk
+
+    async def close(self):
+        pass
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, delay):
+        self.sleeps.append(delay)
+        self.now += delay
+        await asyncio.sleep(0)
+
+
+def make_bot(session, scheduler):
+    bot = Bot("0:test", session=session)
+    session.middleware(scheduler)
+    return bot
+
+
+def test_retry_after_pauses_and_retries():
+    clock = FakeClock()
+    session = FakeSession(clock, retry_after=7, retry_after_times=2)
+    scheduler = SendScheduler(clock=clock, sleep=clock.sleep)
+    bot = make_bot(session, scheduler)
+
+    async def run():
+        return await bot.send_message(1, "привет")
+
+    assert asyncio.run(run()) is True
+    (t0, _), (t1, _), (t2, text) = session.requests
+    # Пауза — не меньше retry_after и не меньше нарастающей RETRY_BACKOFF
+    assert t1 - t0 >= 7 and t2 - t1 >= 7
+    assert text == "привет"
+    assert scheduler.retries == 2 and scheduler.sent == 1
+
+
+def test_pause_after_429_holds_other_sends():
+    clock = FakeClock()
+    session = FakeSession(clock, retry_after=5, retry_after_times=1)
+    scheduler = SendScheduler(clock=clock, sleep=clock.sleep)
+    bot = make_bot(session, scheduler)
+
+    async def run():
+        await asyncio.gather(bot.send_message(1, "первое"), bot.send_message(2, "второе"))
+
+    asyncio.run(run())
+    first_at = session.requests[0][0]
+    assert all(at >= first_at + 5 for at, _ in session.requests[1:])
+    assert sorted(text for _, text in session.requests[1:]) == ["второе", "первое"]
+
+
+# Отменяется тот, чьё сообщение стало основой склейки, или приклеенный к нему
+@pytest.mark.parametrize("cancelled", [0, 1])
+def test_coalesced_senders_are_isolated(cancelled):
+    session = FakeSession(lambda: 0)
+    # Второе сообщение в чат ждёт жетона чата, к нему приклеиваются следующие
+    scheduler = SendScheduler(rate=1000, chat_rate=20, chat_burst=1)
+    bot = make_bot(session, scheduler)
+    methods = [SendMessage(chat_id=1, text=f"сообщение {i}") for i in range(4)]
+
+    async def run():
+        await bot(methods[0])
+        tasks = [asyncio.ensure_future(bot(method)) for method in methods[1:]]
+        await asyncio.sleep(0.01)
+        tasks[cancelled].cancel()
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert isinstance(results.pop(cancelled), asyncio.CancelledError)
+    assert results == [True, True]
+    kept = [f"сообщение {i + 1}" for i in range(3) if i != cancelled]
+    assert [text for _, text in session.requests] == ["сообщение 0", "\n\n".join(kept)]
+    # Запросы отправителей не изменились
+    assert [method.text for method in methods] == [f"сообщение {i}" for i in range(4)]
+    assert scheduler.coalesced == 2
@@ -0,0 +1,180 @@
+"""
+Напоминания о возврате на виртуальных часах: каждое уходит один раз, не
+раньше срока (с точностью до slack), а не ушедшее из-за сети повторяется.
+"""
+
+import asyncio
+import logging
+import sqlite3
+
+import pytest
+from aiogram.exceptions import TelegramNetworkError
+
+from db import REMIND_BEFORE, Database
+from reminders import OVERDUE_EVERY, REMINDER_SLACK, RETRY_DELAY, ReminderScheduler
+
+DAY = 86400
+START_AT = 1_700_000_000
+LOANS = 200
+
+
+class FakeClock:
+    def __init__(self, end_at):
+        self.now = float(START_AT)
+        self.end_at = end_at
+        self.finished = asyncio.Event()
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, delay):
+        if self.now + delay > self.end_at:
+            # Время вышло: дальше задача просто ждёт отмены
+            self.finished.set()
+            await asyncio.Event().wait()
+        self.now += delay
+        await asyncio.sleep(0)
+
+
+class FakeBot:
+    def __init__(self, clock):
+        self.clock = clock
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        self.sent.append((chat_id, self.clock(), text.startswith("📅")))
+
+
+class FlakyBot(FakeBot):
+    """
+    Первая попытка для каждого пользователя падает с ошибкой сети.
+    """
+
+    def __init__(self, clock):
+        super().__init__(clock)
+        self.failed = {}
+
+    async def send_message(self, chat_id, text):
+        if chat_id not in self.failed:
+            self.failed[chat_id] = self.clock()
+            raise TelegramNetworkError(None, "сеть недоступна")
+        await super().send_message(chat_id, text)
+
+
+class OfflineBot(FakeBot):
+    async def send_message(self, chat_id, text):
+        await super().send_message(chat_id, text)
+        raise TelegramNetworkError(None, "сеть недоступна")
+
+
+async def run_scheduler(path, loans, bot_class, end_at, slack):
+    """
+    Заводит выдачи {user_id: due_at} и гоняет планировщик до end_at.
+    """
+    database = Database(path)
+    await database.connect()
+    await database.close()
+    conn = sqlite3.connect(path)
+    with conn:
+        for user_id, due_at in loans.items():
+            conn.execute(
+                "INSERT INTO books (title, author, available, borrower) VALUES (?, 'Автор', 0, ?)",
+                (f"Книга {user_id}", str(user_id)),
+            )
+            conn.execute(
+                "INSERT INTO users (user_id, name, surname, password) VALUES (?, ?, ?, 'x')",
+                (user_id, f"Имя{user_id}", f"Фамилия{user_id}"),
+            )
+            conn.execute(
+                """
+                INSERT INTO loans (user_id, book_id, borrowed_at, due_at, next_reminder_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (user_id, user_id + 1, START_AT, due_at, max(due_at - REMIND_BEFORE, START_AT)),
+            )
+    conn.close()
+
+    database = Database(path)
+    await database.connect()
+    clock = FakeClock(end_at)
+    bot = bot_class(clock)
+    scheduler = ReminderScheduler(database, bot, rate=1000, slack=slack, clock=clock, sleep=clock.sleep)
+    scheduler.start()
+    await clock.finished.wait()
+    await scheduler.stop()
+    await database.close()
+    return bot
+
+
+def spread_loans():
+    # Сроки разбросаны по дням со 2-го по 14-й: у каждой выдачи есть и
+    # напоминание до срока, и хотя бы одно о просрочке
+    return {u: START_AT + 2 * DAY + u * (12 * DAY // LOANS) for u in range(LOANS)}
+
+
+@pytest.mark.parametrize("slack", [0, REMINDER_SLACK])
+def test_each_reminder_is_sent_once_and_not_early(tmp_path, slack):
+    loans = spread_loans()
+    bot = asyncio.run(
+        run_scheduler(str(tmp_path / "r.sqlite3"), loans, FakeBot, START_AT + 16 * DAY, slack)
+    )
+
+    before = {}
+    overdue = {}
+    for user_id, at, early in bot.sent:
+        (before if early else overdue).setdefault(user_id, []).append(at)
+
+    assert sorted(before) == sorted(overdue) == list(loans)
+    for user_id, due_at in loans.items():
+        (at,) = before[user_id]
+        assert due_at - REMIND_BEFORE - slack <= at < due_at
+        first, *rest = overdue[user_id]
+        assert first >= due_at - slack
+        # О просрочке — раз в OVERDUE_EVERY, не чаще и без пропусков
+        # (расписание хранится в целых секундах)
+        for a, b in zip(overdue[user_id], rest):
+            assert OVERDUE_EVERY - slack - 1 <= b - a <= OVERDUE_EVERY + slack + 1
+
+
+def test_failed_send_is_retried(tmp_path):
+    loans = spread_loans()
+    logging.disable(logging.WARNING)
+    try:
+        bot = asyncio.run(
+            run_scheduler(str(tmp_path / "r.sqlite3"), loans, FlakyBot, START_AT + 16 * DAY, 0)
+        )
+    finally:
+        logging.disable(logging.NOTSET)
+
+    assert sorted(bot.failed) == list(loans)
+    before = {}
+    for user_id, at, early in bot.sent:
+        if early:
+            before.setdefault(user_id, []).append(at)
+    for user_id, failed_at in bot.failed.items():
+        # Не ушедшее напоминание до срока отправлено ровно один раз повторно,
+        # не в том же проходе, а через RETRY_DELAY
+        (at,) = before[user_id]
+        assert at - failed_at >= RETRY_DELAY - 1
+
+
+def test_outage_does_not_resend_in_a_loop(tmp_path):
+    loans = {u: START_AT - DAY for u in range(10)}
+    hours = 1
+    logging.disable(logging.WARNING)
+    try:
+        bot = asyncio.run(
+            run_scheduler(
+                str(tmp_path / "r.sqlite3"), loans, OfflineBot, START_AT + hours * 3600, REMINDER_SLACK
+            )
+        )
+    finally:
+        logging.disable(logging.NOTSET)
+
+    attempts = {}
+    for user_id, _, _ in bot.sent:
+        attempts[user_id] = attempts.get(user_id, 0) + 1
+    # Попытка сразу и по одной на каждый интервал повтора
+    limit = hours * 3600 // (REMINDER_SLACK + RETRY_DELAY) + 1
+    assert sorted(attempts) == list(loans)
+    assert all(2 <= count <= limit for count in attempts.values())
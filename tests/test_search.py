@@ -0,0 +1,38 @@
+"""
+Полнотекстовый поиск книг (Database.search_books).
+"""
+
+import asyncio
+
+from db import Database
+
+
+def search(path, books, query):
+    async def run():
+        database = Database(str(path))
+        await database.connect()
+        await database.init_books(books)
+        rows = await database.search_books(query)
+        await database.close()
+        return [title for title, _, _, _ in rows]
+
+    return asyncio.run(run())
+
+
+def book(author="Автор"):
+    return {"author": author, "available": True, "borrower": None}
+
+
+def test_exact_title_ranks_first_among_many_matches(tmp_path):
+    # Совпадений больше, чем бы ранжировалось при LIMIT до ORDER BY rank,
+    # а точное название добавлено последним (самый большой rowid)
+    books = {
+        f"Роман {i} о долгой дороге через степь и горы": book() for i in range(1500)
+    }
+    books["Роман"] = book()
+    assert search(tmp_path / "search.sqlite3", books, "роман")[0] == "Роман"
+
+
+def test_typo_is_corrected(tmp_path):
+    books = {"Война и мир": book("Лев Толстой"), "Мастер и Маргарита": book("Булгаков")}
+    assert search(tmp_path / "search.sqlite3", books, "Маргорита") == ["Мастер и Маргарита"]
@@ -0,0 +1,71 @@
+"""
+Состояния FSM в SQLite переживают перезапуск и сбрасываются через ttl.
+"""
+
+import asyncio
+
+from aiogram.fsm.storage.base import StorageKey
+
+from db import Database
+from storage import SQLiteStorage
+
+USERS = 50
+
+
+def fsm_key(user_id):
+    return StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+
+
+async def register_and_restart(path, clock):
+    """
+    Регистрирует USERS пользователей до середины и «перезапускает» бота:
+    возвращает новое хранилище над тем же файлом.
+    """
+    database = Database(path)
+    await database.connect()
+    storage = SQLiteStorage(database, ttl=3600, clock=lambda: clock[0])
+
+    async def register(user_id):
+        await storage.set_state(fsm_key(user_id), "RegisterState:waiting_for_surname")
+        await storage.set_data(fsm_key(user_id), {"name": f"Имя {user_id}"})
+
+    await asyncio.gather(*(register(user_id) for user_id in range(USERS)))
+    await storage.close()
+    await database.close()
+
+    database = Database(path)
+    await database.connect()
+    return database, SQLiteStorage(database, ttl=3600, purge_interval=0, clock=lambda: clock[0])
+
+
+def test_fsm_states_survive_restart(tmp_path):
+    async def run():
+        clock = [1_000_000.0]
+        database, storage = await register_and_restart(str(tmp_path / "fsm.sqlite3"), clock)
+        for user_id in range(USERS):
+            assert await storage.get_state(fsm_key(user_id)) == "RegisterState:waiting_for_surname"
+            assert await storage.get_data(fsm_key(user_id)) == {"name": f"Имя {user_id}"}
+        await storage.close()
+        await database.close()
+
+    asyncio.run(run())
+
+
+def test_fsm_state_expires_after_ttl(tmp_path):
+    async def run():
+        clock = [1_000_000.0]
+        database, storage = await register_and_restart(str(tmp_path / "fsm.sqlite3"), clock)
+
+        # Через ttl состояние считается сброшенным, а новое не подхватывает старые данные
+        clock[0] += 3601
+        assert await storage.get_state(fsm_key(0)) is None
+        await storage.set_state(fsm_key(0), "LoginState:waiting_for_name")
+        assert await storage.get_data(fsm_key(0)) == {}
+        await storage.close()
+        (left,) = await database._read(
+            lambda conn: conn.execute("SELECT COUNT(*) FROM fsm_states").fetchone()
+        )
+        await database.close()
+        assert left == 1
+
+    asyncio.run(run())
@@ -0,0 +1,110 @@
+"""
+Очередь на книгу: тысячи читателей встают в неё одновременно, книга
+переходит к ним строго в порядке записи, а те, кто передумал и вышел из
+очереди во время передач, не теряют и не получают лишних выдач.
+"""
+
+import asyncio
+import random
+
+from db import Database
+
+USERS = 2000
+TITLE = "Книга 0"
+
+
+async def open_queue(path):
+    """
+    База с одной книгой у пользователя 0 и USERS пользователями в очереди на
+    неё. Возвращает (database, book_id, places), places — {user_id: место}.
+    """
+    database = Database(str(path))
+    await database.connect()
+    await database.init_books({TITLE: {"author": "Автор", "available": True, "borrower": None}})
+    await asyncio.gather(
+        *(
+            database.create_user(user_id, f"Имя{user_id}", f"Фамилия{user_id}", "pwd")
+            for user_id in range(USERS + 1)
+        )
+    )
+    assert await database.borrow_book(0, TITLE)
+    book_id = await database.find_book_id(TITLE)
+    joined = await asyncio.gather(
+        *(database.join_waitlist(user_id, book_id) for user_id in range(1, USERS + 1))
+    )
+    places = {user_id: place for user_id, (_, place) in zip(range(1, USERS + 1), joined)}
+    return database, book_id, places
+
+
+async def pass_along(database, received, handed=None):
+    # Каждый, получив книгу, сразу возвращает её следующему;
+    # handed[n] срабатывает после n-й передачи
+    holder = 0
+    while True:
+        next_user, _ = await database.return_book(holder, TITLE)
+        if next_user is None:
+            return
+        received.append(next_user)
+        if handed is not None and len(received) < len(handed):
+            handed[len(received)].set()
+        holder = next_user
+
+
+def test_waitlist_is_first_come_first_served(tmp_path):
+    async def run():
+        database, book_id, places = await open_queue(tmp_path / "waitlist.sqlite3")
+        # Повторная запись не меняет места
+        repeated = await asyncio.gather(
+            *(database.join_waitlist(user_id, book_id) for user_id in range(1, USERS + 1, 7))
+        )
+        received = []
+        await pass_along(database, received)
+        (_, _, available, _) = await database.find_book(TITLE)
+        await database.close()
+        return places, [place for _, place in repeated], received, available
+
+    places, repeated, received, available = asyncio.run(run())
+    # Записи обрабатываются в порядке прихода: места — ровно порядок вызовов
+    assert [places[user_id] for user_id in range(1, USERS + 1)] == list(range(1, USERS + 1))
+    assert repeated == [places[user_id] for user_id in range(1, USERS + 1, 7)]
+    assert received == list(range(1, USERS + 1))
+    assert available
+
+
+def test_no_handoff_lost_when_users_leave_the_queue(tmp_path):
+    # Брони с истечением в этой схеме нет: передача сразу открывает выдачу.
+    # Ближайший аналог — читатель выходит из очереди, пока книга идёт по ней
+    rng = random.Random(0)
+    leavers = rng.sample(range(1, USERS + 1), USERS // 3)
+    # Каждый выходит после случайной передачи из первой половины: кто-то
+    # раньше, чем книга до него дойдёт, кто-то — уже получив её
+    after = {user_id: rng.randrange(USERS // 2) for user_id in leavers}
+
+    async def run():
+        database, book_id, _ = await open_queue(tmp_path / "waitlist.sqlite3")
+        received = []
+        handed = [asyncio.Event() for _ in range(USERS // 2)]
+        handed[0].set()
+
+        async def leave(user_id):
+            await handed[after[user_id]].wait()
+            return await database.leave_waitlist(user_id, book_id)
+
+        left = await asyncio.gather(
+            pass_along(database, received, handed), *(leave(user_id) for user_id in leavers)
+        )
+        (_, _, available, _) = await database.find_book(TITLE)
+        queue = await database._read(
+            lambda conn: conn.execute("SELECT COUNT(*) FROM waitlist").fetchone()[0]
+        )
+        await database.close()
+        return dict(zip(leavers, left[1:])), received, available, queue
+
+    left, received, available, queue = asyncio.run(run())
+    gone = {user_id for user_id, ok in left.items() if ok}
+    # Книгу получил каждый, кто не вышел из очереди, ровно один раз и по порядку
+    assert received == sorted(set(range(1, USERS + 1)) - gone)
+    # Не вышел только тот, до кого книга уже дошла
+    assert all(user_id in received for user_id, ok in left.items() if not ok)
+    assert gone and len(gone) < len(leavers)
+    assert available and queue == 0
@@ -0,0 +1,50 @@
+"""
+Вебхук не поднимается без секретного токена и отклоняет запросы с чужим.
+"""
+
+import asyncio
+
+import pytest
+from aiogram import Bot, Dispatcher
+from aiohttp.test_utils import TestClient, TestServer
+
+import sharding
+from webhook import create_app
+
+SECRET = "test-secret"
+UPDATE = {"update_id": 1}
+
+
+class FakeShards:
+    def __init__(self):
+        self.updates = []
+
+    def submit(self, update):
+        self.updates.append(update)
+
+
+@pytest.mark.parametrize("secret", [None, ""])
+def test_webhook_requires_secret(secret):
+    bot = Bot("0:test")
+    with pytest.raises(ValueError):
+        create_app(Dispatcher(), bot, "/webhook", secret)
+    with pytest.raises(ValueError):
+        sharding._webhook_app(FakeShards(), "/webhook", secret)
+    with pytest.raises(ValueError):
+        asyncio.run(sharding.run_sharded(bot, 2, None, "https://example.org/webhook", secret_token=secret))
+
+
+def test_sharded_webhook_rejects_wrong_token():
+    shards = FakeShards()
+
+    async def run():
+        async with TestClient(TestServer(sharding._webhook_app(shards, "/webhook", SECRET))) as client:
+            statuses = []
+            for headers in ({}, {"X-Telegram-Bot-Api-Secret-Token": "wrong"},
+                            {"X-Telegram-Bot-Api-Secret-Token": SECRET}):
+                response = await client.post("/webhook", json=UPDATE, headers=headers)
+                statuses.append(response.status)
+            return statuses
+
+    assert asyncio.run(run()) == [401, 401, 200]
+    assert shards.updates == [UPDATE]
@@ -0,0 +1,152 @@
+"""
+Приём обновлений через вебхук вместо long polling.
+
+Telegram сам присылает обновления POST-запросами на WEBHOOK_URL, их
+принимает локальный aiohttp-сервер (перед ним обычно стоит nginx с TLS).
+Каждое обновление обрабатывается в отдельной задаче, но одновременно — не
+больше max_in_flight: сверх лимита запрос ждёт свободного места, и Telegram
+сам придерживает следующие обновления. Запрос без правильного секретного
+токена отклоняется. При остановке сервер перестаёт принимать запросы и
+дожидается уже начатых обработчиков (не дольше drain_timeout).
+"""
+
+import asyncio
+import logging
+import signal
+from contextlib import suppress
+from typing import Any
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+# Сколько обновлений обрабатывается одновременно
+MAX_IN_FLIGHT = 100
+
+# Сколько ждать начатые обработчики при остановке
+DRAIN_TIMEOUT = 30.0
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        bot: Bot,
+        secret_token: str | None = None,
+        max_in_flight: int = MAX_IN_FLIGHT,
+        drain_timeout: float = DRAIN_TIMEOUT,
+        close_bot_session: bool = True,
+        **data: Any,
+    ):
+        super().__init__(
+            dispatcher, bot, handle_in_background=True, secret_token=secret_token, **data
+        )
+        self.drain_timeout = drain_timeout
+        self.close_bot_session = close_bot_session
+        self._slots = asyncio.Semaphore(max_in_flight)
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._background_feed_update_tasks)
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        update = await request.json(loads=bot.session.json_loads)
+        # Место занимается до ответа Telegram: при перегрузке он ждёт, а не мы копим задачи
+        await self._slots.acquire()
+        task = asyncio.create_task(self._background_feed_update(bot=bot, update=update))
+        self._background_feed_update_tasks.add(task)
+        task.add_done_callback(self._release)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    def _release(self, task: asyncio.Task):
+        self._background_feed_update_tasks.discard(task)
+        self._slots.release()
+        if not task.cancelled() and task.exception() is not None:
+            logging.error("Ошибка обработки обновления", exc_info=task.exception())
+
+    async def close(self):
+        """
+        Дожидается начатых обработчиков, затем закрывает сессию бота.
+        """
+        tasks = set(self._background_feed_update_tasks)
+        if tasks:
+            logging.info("Ждём завершения обработчиков: %s", len(tasks))
+            _, pending = await asyncio.wait(tasks, timeout=self.drain_timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                logging.warning("Не дождались обработчиков: %s", len(pending))
+                await asyncio.gather(*pending, return_exceptions=True)
+        if self.close_bot_session:
+            await self.bot.session.close()
+
+
+def create_app(
+    dispatcher: Dispatcher,
+    bot: Bot,
+    path: str,
+    secret_token: str,
+    max_in_flight: int = MAX_IN_FLIGHT,
+    drain_timeout: float = DRAIN_TIMEOUT,
+    close_bot_session: bool = True,
+) -> web.Application:
+    if not secret_token:
+        raise ValueError("Вебхук без секретного токена принимал бы чужие обновления")
+    app = web.Application()
+    handler = BoundedRequestHandler(
+        dispatcher,
+        bot,
+        secret_token=secret_token,
+        max_in_flight=max_in_flight,
+        drain_timeout=drain_timeout,
+        close_bot_session=close_bot_session,
+    )
+    # Сначала регистрируем обработчик: при остановке он дождётся задач
+    # раньше, чем диспетчер выполнит свои shutdown-хендлеры
+    handler.register(app, path=path)
+    setup_application(app, dispatcher, bot=bot)
+    app["webhook_handler"] = handler
+    return app
+
+
+async def run_webhook(
+    dispatcher: Dispatcher,
+    bot: Bot,
+    url: str,
+    host: str,
+    port: int,
+    path: str,
+    secret_token: str,
+    max_in_flight: int = MAX_IN_FLIGHT,
+    drain_timeout: float = DRAIN_TIMEOUT,
+):
+    """
+    Регистрирует вебхук у Telegram и обслуживает его до SIGINT/SIGTERM.
+    Накопившиеся за время перезапуска обновления не отбрасываются.
+    """
+    app = create_app(
+        dispatcher, bot, path, secret_token, max_in_flight, drain_timeout
+    )
+    runner = web.AppRunner(app, handle_signals=False)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    await bot.set_webhook(
+        url,
+        secret_token=secret_token,
+        allowed_updates=dispatcher.resolve_used_update_types(),
+        drop_pending_updates=False,
+    )
+    logging.info("Вебхук %s, слушаем %s:%s%s", url, host, port, path)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        with suppress(NotImplementedError):
+            loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        logging.info("Останавливаем вебхук")
+        # Перестаём принимать запросы, дожидаемся обработчиков, закрываем сессию
+        await runner.cleanup()